@@ -1,12 +1,14 @@
 import sys,os
+import copy
 import json
 import subprocess
 import os
 import time
-import queue
 from collections import defaultdict
 import threading
 import time
+import queue
+from concurrent.futures import wait
 
 from utils.config import (SAMPLE_MEDIA_DIR,
                           RESULTS_DIR,
@@ -14,18 +16,28 @@ from utils.config import (SAMPLE_MEDIA_DIR,
                           
                           LP_IP,MINIO_API_HOST_PORT, 
                           COMMON_RESULTS_DIR_FULL_PATH,
+                          VLM_WORKERS, VLM_MAX_IN_FLIGHT,
+                          VLM_ENHANCE_DEADLINE_SEC, VLM_STALE_POLICY,
+                          VLM_BATCH_MODE, VLM_BATCH_WINDOW_MS, VLM_BATCH_MAX_ITEMS,
+                          VLM_WORKER_COUNT, VLM_WORKER_ID, VLM_AGGREGATE_TIMEOUT_SEC,
                           )
-from utils.vlm import call_vlm
+from utils.vlm import call_vlm, call_vlm_batch
 from utils.frames_processor import get_best_frame
+from utils.frame_fetcher import get_frame_fetcher
+from utils.vlm_scheduler import get_vlm_scheduler, PRIORITY_ENHANCEMENT, PRIORITY_AUDIT
+from utils.agent_memo import get_agent_memo, memo_key
 from agent.agent import ConfigAgent
 import re
-from utils.save_results import get_presigned_url
-from utils.config import logger,INVENTORY_FILE
+from utils.config import logger
+from utils.inventory_store import InventoryStore
 from utils.prompts import generate_inventory_prompt
-from utils.rabbitmq_consumer import ODConsumer
+from utils.rabbitmq_consumer import ODConsumer, ack_message, retry_message
+from utils.run_aggregator import RunAggregator, merge_worker_results, write_run_results
+from utils.timed_queue import TimedQueue
 import traceback
 from workload_utils import get_video_name_only
 from vlm_metrics_logger import (
+    get_logger,
     log_start_time, 
     log_end_time, 
     log_custom_event,
@@ -41,11 +53,15 @@ CYAN = "\033[34m"
 RABBITMQ_USER = os.environ.get("RABBITMQ_USER")
 RABBITMQ_PASSWORD = os.environ.get("RABBITMQ_PASSWORD")
 
-vlm_queue = queue.Queue()
-result_queue = queue.Queue()
-od_message_queue = queue.Queue()
-inventory_list = None
-inventory_set = None
+vlm_queue = TimedQueue()
+result_queue = TimedQueue()
+od_message_queue = TimedQueue()
+# Hot-reloaded inventory; see get_inventory_index()
+inventory_store = None
+# Run this process is working on: run_id from the detections / STREAM_END, and
+# (scaled out) the worker that aggregates the run's results
+current_run = {"run_id": None, "aggregator": None}
+run_aggregator = RunAggregator()
 
 # ============================================================================
 # Helper Function
@@ -78,39 +94,157 @@ def load_json_from_file(file_path):
     except Exception as e:
         logger.error(f"Pipeline Script - Error loading {file_path} file: %s", str(e)+"\n"+traceback.format_exc())
         return f"🤖 Agent: ❌ Failed - Could not load {file_path}"
+
+
+def get_inventory_index():
+    """Current inventory index; the store swaps in a new one when the catalog changes on disk."""
+    global inventory_store
+    if inventory_store is None:
+        inventory_store = InventoryStore()
+        inventory_store.start_watching()
+    return inventory_store.index
+
+
+def is_stream_end(payload):
+    """True for the STREAM_END sentinel message."""
+    return isinstance(payload, dict) and payload.get("msg_type") == "STREAM_END"
+
+
+def record_queue_wait(queue_name, waited_sec):
+    """Log how long a message sat in an in-process queue."""
+    logger.debug("Pipeline Script - %s wait: %.1f ms", queue_name, waited_sec * 1000)
+    get_logger().log_custom_event(
+        "queue_wait",
+        "USECASE_1",
+        f"{queue_name}_{int(time.time() * 1000)}",
+        queue=queue_name,
+        wait_ms=round(waited_sec * 1000, 3),
+    )
     
         
 # ============================================================================
 # WORKER THREADS
 # ============================================================================
 
+def publish_vlm_result(payload, data, valid, result, err_msg):
+    """Put one VLM enhancement result on the result queue."""
+    payload["data"] = {"result": result, "valid": valid, "error": err_msg,
+                       "run_id": data.get("run_id"),
+                       "stream_id": data.get("stream_id", "default"),
+                       "tracking_id": data.get("tracking_id")}
+    result_queue.put(payload)
+    # The detection is done with once its result is published
+    ack_message(payload)
+
+
+def run_vlm_enhancement(payload):
+    """Run one VLM enhancement request on a pool worker and publish its result.
+
+    Results complete out of order; each carries its stream_id and tracking_id.
+    """
+    data = payload["data"]
+    try:
+        logger.info("Pipeline Script - Calling VLM with payload: %s", data)
+        start_time = time.time()
+        logger.info("⏳ [%s] Waiting for VLM call to finish ===", 
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start_time)))
+        valid,result,err_msg = call_vlm(data, use_case=data.get("use_case", ""))
+        logger.info("Pipeline Script - VLM Result (tracking_id=%s): %s", data.get("tracking_id"), result)
+    except Exception as e:
+        logger.error("Pipeline Script - VLM worker error: %s", str(e))
+        valid, result, err_msg = False, None, str(e)
+    publish_vlm_result(payload, data, valid, result, err_msg)
+
+
+def run_vlm_enhancement_batch(payloads):
+    """Run several VLM enhancement requests as one multi-image call and publish each result."""
+    datas = [payload["data"] for payload in payloads]
+    try:
+        logger.info("Pipeline Script - Calling VLM with a batch of %d item(s)", len(datas))
+        outcomes = call_vlm_batch(datas, use_case=datas[0].get("use_case", ""))
+    except Exception as e:
+        logger.error("Pipeline Script - VLM batch worker error: %s", str(e))
+        outcomes = [(False, None, str(e))] * len(datas)
+    for payload, data, (valid, result, err_msg) in zip(payloads, datas, outcomes):
+        logger.info("Pipeline Script - VLM Result (tracking_id=%s): %s", data.get("tracking_id"), result)
+        publish_vlm_result(payload, data, valid, result, err_msg)
+
+
+def drop_stale_enhancement(payload):
+    """Publish an empty result for an enhancement request that missed its deadline."""
+    logger.warning("Pipeline Script - Dropping stale VLM request (tracking_id=%s)", payload["data"].get("tracking_id"))
+    publish_vlm_result(payload, payload["data"], False, [], None)
+
+
+def drop_stale_enhancement_batch(payloads):
+    for payload in payloads:
+        drop_stale_enhancement(payload)
+
+
 def vlm_enhancer_consumer():
-    """Consumer thread that processes VLM enhancement requests"""
-    logger.info("Pipeline Script - [vlm_enhancer_consumer] Started")
+    """Dispatcher thread that hands VLM enhancement requests to the VLM scheduler.
+
+    Enhancement runs ahead of decision-agent work; a request still queued
+    VLM_ENHANCE_DEADLINE_SEC after it arrived is downgraded or dropped
+    (VLM_STALE_POLICY). STREAM_END is forwarded only after every submitted
+    request has finished. In batch mode, requests arriving within
+    VLM_BATCH_WINDOW_MS of the first one (up to VLM_BATCH_MAX_ITEMS, or
+    until STREAM_END) are sent as one call.
+    """
+    logger.info("Pipeline Script - [vlm_enhancer_consumer] Started with %d workers, max in flight %d, batch mode %s",
+                VLM_WORKERS, VLM_MAX_IN_FLIGHT, VLM_BATCH_MODE)
+    scheduler = get_vlm_scheduler()
+    deadline_s = VLM_ENHANCE_DEADLINE_SEC or None
+    in_flight = set()
+    batch = []
+    batch_deadline = 0.0
+
+    def submit(fn, arg):
+        if VLM_STALE_POLICY == "drop":
+            on_expire = drop_stale_enhancement_batch if fn is run_vlm_enhancement_batch else drop_stale_enhancement
+        else:
+            on_expire = "downgrade"
+        future = scheduler.submit(fn, arg, priority=PRIORITY_ENHANCEMENT, deadline_s=deadline_s,
+                                  on_expire=on_expire)
+        in_flight.add(future)
+        future.add_done_callback(in_flight.discard)
+
     try:
         while True:
-            payload = vlm_queue.get()
+            timeout = max(0.0, batch_deadline - time.monotonic()) if batch else None
+            try:
+                payload, waited = vlm_queue.get_timed(timeout=timeout)
+            except queue.Empty:
+                submit(run_vlm_enhancement_batch, batch)
+                batch = []
+                continue
+            record_queue_wait("vlm_queue", waited)
             if isinstance(payload, str):
                 payload = json.loads(payload)
             
-            if payload and "msg_type" in payload and payload["msg_type"] == "STREAM_END":
-                logger.info("Pipeline Script - VLM Consumer received end of stream signal")
+            if is_stream_end(payload):
+                if batch:
+                    submit(run_vlm_enhancement_batch, batch)
+                    batch = []
+                logger.info("Pipeline Script - VLM Consumer received end of stream signal, draining %d in-flight call(s)",
+                            len(in_flight))
+                wait(list(in_flight))
                 result_queue.put(payload)
                 break
             
             if payload and "data" in payload and len(payload["data"]) > 0:
-                data = payload["data"]
-                logger.info("Pipeline Script - Calling VLM with payload: %s", data)
-                start_time = time.time()
-                logger.info("⏳ [%s] Waiting for VLM call to finish ===", 
-                            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start_time)))
-                valid,result,err_msg = call_vlm(data, use_case=data.get("use_case", ""))
-                logger.info("Pipeline Script - VLM Result: %s", result)
-                payload["data"] = {"result": result, "valid": valid, "error": err_msg}
-                result_queue.put(payload)
+                if VLM_BATCH_MODE:
+                    if not batch:
+                        batch_deadline = time.monotonic() + VLM_BATCH_WINDOW_MS / 1000.0
+                    batch.append(payload)
+                    if len(batch) >= VLM_BATCH_MAX_ITEMS:
+                        submit(run_vlm_enhancement_batch, batch)
+                        batch = []
+                else:
+                    submit(run_vlm_enhancement, payload)
+            else:
+                ack_message(payload)
             vlm_queue.task_done()
-            
-            #print("⏳ Waiting for VLM call to finish")
     except Exception as e:
         logger.error("Pipeline Script - VLM Enhancer Consumer Error: %s", str(e))
 
@@ -119,22 +253,30 @@ def vlm_enhancer_consumer():
 # DATA STREAM READERS
 # ============================================================================
 
+def read_stream(message_queue, queue_name):
+    """Generator that blocks on a queue and yields messages up to and including STREAM_END.
+
+    STREAM_END is the shutdown sentinel: the generator returns right after
+    yielding it, so no polling or timeouts are needed.
+    """
+    while True:
+        item, waited = message_queue.get_timed()
+        record_queue_wait(queue_name, waited)
+        if isinstance(item, str):
+            item = json.loads(item)
+        yield item
+        if is_stream_end(item):
+            return
+
+
 def read_object_detection_stream():
     """Generator to read object detection messages from queue"""
-    while True:
-        while not od_message_queue.empty():
-            item = od_message_queue.get(timeout=15)
-            yield item
-        time.sleep(0.1)
+    return read_stream(od_message_queue, "od_message_queue")
 
 
 def read_vlm_results_stream():
     """Generator to read VLM results from queue"""
-    while True:
-        while not result_queue.empty():
-            item = result_queue.get()
-            yield item
-        time.sleep(0.1)
+    return read_stream(result_queue, "result_queue")
 
 
 # ============================================================================
@@ -143,10 +285,7 @@ def read_vlm_results_stream():
 
 def process_object_detection_results(video_file, use_case):
     """Process object detection results and prepare for VLM enhancement"""
-    global result_queue, vlm_queue, inventory_list,inventory_set
-    if not inventory_list:
-        inventory_list = load_json_from_file(INVENTORY_FILE)
-        inventory_set = set(item.strip().lower() for item in inventory_list)
+    global result_queue, vlm_queue
     if video_file is None:
         logger.error("Pipeline Script - No video file provided for processing")
         yield "📹 Object Detection: ❌ Failed - No video uploaded", {}
@@ -163,52 +302,75 @@ def process_object_detection_results(video_file, use_case):
                 
                 if payload and "msg_type" in payload and payload["msg_type"] == "STREAM_END":
                     logger.info("Pipeline Script - Object Detection stream ended")
+                    current_run["run_id"] = payload.get("run_id") or current_run["run_id"]
+                    current_run["aggregator"] = payload.get("aggregator")
+                    ack_message(payload)
                     break
                 
                 if not payload or not "data" in payload or not len(payload["data"]) > 0:
+                    ack_message(payload)
                     continue
                 data = payload["data"]
                 item = data.get("item_name")
+                stream_id = data.get("stream_id", "default")
+                run_id = data.get("run_id")
+                current_run["run_id"] = run_id or current_run["run_id"]
                 frame_names = data.get("frames", [])
                 #print("\n\nDATA:",data)
                 
-                if item in  inventory_set:
-                    print(f"✅ Item found {BOLD}{CYAN}{item}{RESET} in inventory, ❌ skipping VLM call and best frame selection call")
-                    logger.info("Pipeline Script - Item '%s' found in inventory, skipping VLM", item)
-                    ui_items.append({"item_name":item,"match":True})
+                index = get_inventory_index()
+                inventory_item = index.match(item)
+                if inventory_item:
+                    print(f"✅ [{stream_id}] Item found {BOLD}{CYAN}{item}{RESET} in inventory as {inventory_item}, ❌ skipping VLM call and best frame selection call")
+                    logger.info("Pipeline Script - [%s] Item '%s' matched inventory item '%s', skipping VLM", stream_id, item, inventory_item)
+                    ui_items.append({"item_name":item,"match":True,"inventory_item":inventory_item,"run_id":run_id,"stream_id":stream_id})
                     result_queue.put({"item_name": item})
+                    ack_message(payload)
+                    yield "📹 Object Detection: ⚡ Running", {"od_results": list(ui_items)}
                     continue
                 import time
 
                 log_start_time("USECASE_1")
 
-                # compute time to get best frame
-                best_frame, score = get_best_frame(frame_names, bucket_name=data.get("bucket", ""))
+                # The Publisher scores frames at capture time; fall back to scoring here
+                best_frame = data.get("best_frame")
+                if best_frame:
+                    score = data.get("best_frame_score", 0.0)
+                else:
+                    best_frame, score = get_best_frame(frame_names, bucket_name=data.get("bucket", ""))
                 
-                print(f"🏆 Best frame for {BOLD}{CYAN}{item}{RESET}: {os.path.basename(best_frame)} | Stability score: {score:.4f}")
-
-                presigned_url = get_presigned_url(best_frame, bucket_name=data.get("bucket", ""))
-                
-                if not presigned_url:
-                    logger.warning("Pipeline Script - Could not generate presigned URL for frame: %s", best_frame)
+                if not best_frame:
+                    logger.warning("Pipeline Script - No usable frame for item: %s", item)
+                    ack_message(payload)
                     continue
+
+                print(f"🏆 [{stream_id}] Best frame for {BOLD}{CYAN}{item}{RESET}: {os.path.basename(best_frame)} | Stability score: {score:.4f}")
                 
-                best_frames[item] = {
-                    "best_frame": presigned_url,
+                best_frames[(stream_id, item)] = {
+                    "best_frame": best_frame,
                     "stability_score": score
                 }
-                item_rec = {"item_name":item,"match":False}
+                item_rec = {"item_name":item,"match":False,"run_id":run_id,"stream_id":stream_id}
                 ui_items.append(item_rec)
-                dynamic_prompt = generate_inventory_prompt(item, inventory_list)
-                enhancer_payload = {"presigned_url": presigned_url, "use_case": use_case, "dynamic_prompt": dynamic_prompt}
+                candidates = [name for name, _ in index.candidates(item)]
+                dynamic_prompt = generate_inventory_prompt(item, index.items, candidates=candidates)
+                # Warm the frame cache while the request waits for a VLM worker
+                get_frame_fetcher().prefetch([best_frame], data.get("bucket") or None)
+                enhancer_payload = {"frame_path": best_frame, "bucket": data.get("bucket", ""), "use_case": use_case,
+                                    "dynamic_prompt": dynamic_prompt, "run_id": run_id, "stream_id": stream_id,
+                                    "tracking_id": data.get("tracking_id"),
+                                    # Only the Publisher's own best frame has a known item region
+                                    "bbox": data.get("best_frame_bbox") if data.get("best_frame") else None}
                 payload["data"] = enhancer_payload
 
                 vlm_queue.put(payload)
                 logger.info("Pipeline Script - Sent to VLM queue: %s", enhancer_payload)
+                yield "📹 Object Detection: ⚡ Running", {"od_results": list(ui_items)}
 
         
             except Exception as e:
                 logger.error("Pipeline Script - Error processing OD payload: %s", str(e))
+                retry_message(payload, str(e))
                 continue
         write_json_to_file({"od_results": ui_items}, COMMON_RESULTS_DIR_FULL_PATH)
         yield "📹 Object Detection: ✅ Completed", {"od_results": ui_items}
@@ -224,10 +386,6 @@ def process_object_detection_results(video_file, use_case):
 
 def process_vlm_enhancement():
     """Process VLM enhancement results from the result queue"""
-    global inventory_list, inventory_set
-    if not inventory_list:
-        inventory_list = load_json_from_file(INVENTORY_FILE)
-        inventory_set = set(item.strip().lower() for item in inventory_list)
     try:
         for payload in read_vlm_results_stream():
             if isinstance(payload, str):
@@ -245,15 +403,14 @@ def process_vlm_enhancement():
                     return
                 final_result = data.get("result", [])
                 if final_result and len(final_result)>0:
+                    index = get_inventory_index()
                     for result in final_result:
+                        result["run_id"] = data.get("run_id")
+                        result["stream_id"] = data.get("stream_id", "default")
                         item_name = result.get("item_name","").strip().lower()
-                        if item_name in inventory_set:
-                            result["match"] = True
-                        else:
-                            result["match"] = False
+                        result["match"] = index.match(item_name) is not None
                 logger.info("Pipeline Script - VLM enhancement result: %s", final_result)
                 yield "🤖 VLM Enhancement: ⚡ Running", final_result
-        time.sleep(0.5)  # Ensure all processing is done
         yield "🤖 VLM Enhancement: ✅ Completed", []
     
     except Exception as e:
@@ -266,57 +423,140 @@ def process_vlm_enhancement():
 # MAIN PIPELINE ORCHESTRATION
 # ============================================================================
 
+def run_object_detection_stage(video_file, use_case, events):
+    """OD stage thread: forward each OD status to the orchestrator and end the VLM stream when OD ends."""
+    try:
+        for od_status, od_results in process_object_detection_results(video_file, use_case):
+            events.put(("od", od_status, od_results))
+    finally:
+        vlm_queue.put({"msg_type": "STREAM_END", "data": {}})
+
+
+def run_vlm_results_stage(events):
+    """VLM stage thread: forward each VLM result (and the final status) to the orchestrator."""
+    for vlm_status, vlm_results in process_vlm_enhancement():
+        events.put(("vlm", vlm_status, vlm_results))
+
+
+def submit_agent_calls(records, events):
+    """Validate new VLM records at audit priority; each outcome is posted to events as it finishes."""
+    if VLM_BATCH_MODE:
+        def run_batch():
+            # Every record must get an agent event, or the orchestrator waits for it forever
+            try:
+                outcomes = list(agent_call_batch(records))
+            except Exception as e:
+                logger.error("Pipeline Script - [agent_call_batch] Batch validation failed: %s", str(e))
+                logger.error(traceback.format_exc())
+                outcomes = []
+            if len(outcomes) != len(records) or any(outcome is None for outcome in outcomes):
+                logger.error("Pipeline Script - [agent_call_batch] Got %d outcome(s) (%d missing) for %d record(s), "
+                             "failing the missing ones", len(outcomes),
+                             sum(outcome is None for outcome in outcomes) + max(0, len(records) - len(outcomes)),
+                             len(records))
+            for index, record in enumerate(records):
+                outcome = outcomes[index] if index < len(outcomes) else None
+                events.put(("agent", record, outcome if outcome is not None else (False, [])))
+        # agent_call_batch waits on scheduler jobs, so it must not run on a scheduler worker
+        threading.Thread(target=run_batch, name="agent-batch", daemon=True).start()
+        return
+    scheduler = get_vlm_scheduler()
+    for record in records:
+        future = scheduler.submit(agent_call, record, priority=PRIORITY_AUDIT)
+        future.add_done_callback(
+            lambda f, record=record: events.put(("agent", record, f.result() if not f.exception() else (False, []))))
+
+
 def execute_loss_prevention_pipeline(video_file):
-    """Main orchestration function for the entire pipeline"""
+    """Main orchestration function for the entire pipeline.
+
+    OD, VLM enhancement and agent validation run as a streaming DAG: each
+    item goes OD → best frame → VLM → agent on its own as soon as the
+    previous stage finishes it, and every stage output is yielded as it
+    arrives. The stages post to one event queue; the summary files are
+    written once the stream has ended and every item is decided.
+    """
     try:
         if video_file is None:
             logger.error("Pipeline Script - No video file uploaded")
             yield "📹 Object Detection: ❌ Failed - No video uploaded", {}, "🤖 VLM Enhancement: ⏳ Pending", [], "🤖 Agent: ⏳ Pending", []
             return
         
-        # Phase 1: Object Detection
-        od_completed = False
-        final_od_status = ""
-        final_od_results = {}
-        final_vlm_results = []
         use_case = os.path.splitext(video_file)[0].lower()
-        for od_status, od_results in process_object_detection_results(video_file, use_case):
-            final_od_status = od_status
-            final_od_results = od_results
-            yield od_status, od_results, "🤖 VLM Enhancement: ⏳ Pending", [], "🤖 Agent: ⏳ Pending", []
-            
-            if "❌ Failed" in od_status:
-                logger.error("Pipeline Script - Object detection failed, skipping VLM")
-                yield od_status, od_results, "🤖 VLM Enhancement: ❌ Skipped", [], "🤖 Agent: ❌ Skipped", []
-                return
-            
-            if "✅" in od_status and "Completed" in od_status:
-                od_completed = True
-                yield "📹 Object Detection: ✅ Completed", final_od_results, "🤖 VLM Enhancement: ⚡ Running", [], "🤖 Agent: ⏳ Pending", []
-        
-        # Phase 2: VLM Enhancement
-        vlm_queue.put({"msg_type": "STREAM_END", "data": {}})
-        
-        for vlm_status, vlm_results in process_vlm_enhancement():
-            final_vlm_results.extend(vlm_results)
-            unique_results = list({d['item_name']: d for d in final_vlm_results}.values())
-            yield "📹 Object Detection: ✅ Completed", final_od_results, vlm_status, unique_results, "🤖 Agent: ⏳ Pending", []
-        
-        write_json_to_file({"vlm_results":unique_results}, COMMON_RESULTS_DIR_FULL_PATH)
-        
-        
-        yield "📹 Object Detection: ✅ Completed", final_od_results, "🤖 VLM Enhancement: ✅ Completed", unique_results, "🤖 Agent: ⚡ Running", []
-        
+        events = TimedQueue()
+        threading.Thread(target=run_object_detection_stage, args=(video_file, use_case, events),
+                         name="od-stage", daemon=True).start()
+        threading.Thread(target=run_vlm_results_stage, args=(events,), name="vlm-stage", daemon=True).start()
+
+        od_status, od_results = "📹 Object Detection: ⚡ Running", {}
+        vlm_status, agent_status = "🤖 VLM Enhancement: ⏳ Pending", "🤖 Agent: ⏳ Pending"
+        # Demultiplex per run and camera: the same item on two lanes is two results
+        vlm_records = {}
         agent_results = []
-        # Phase 3: Agent Call for inventory validation
-        for record in unique_results:
-            agent_status, agent_result = agent_call(record)
-            if agent_status:
-                agent_results.extend(agent_result)
-            log_end_time("USECASE_1")
+        od_done = vlm_done = False
+        agent_pending = 0
+        started_at = time.monotonic()
+        first_decision_logged = False
+
+        while not (od_done and vlm_done and agent_pending == 0):
+            (kind, status, results), waited = events.get_timed()
+            record_queue_wait("pipeline_events", waited)
+
+            if kind == "od":
+                od_status, od_results = status, results
+                if "❌ Failed" in od_status:
+                    logger.error("Pipeline Script - Object detection failed, skipping VLM")
+                    yield od_status, od_results, "🤖 VLM Enhancement: ❌ Skipped", [], "🤖 Agent: ❌ Skipped", []
+                    return
+                if "✅" in od_status and "Completed" in od_status:
+                    od_done = True
+                if vlm_status.endswith("Pending"):
+                    vlm_status = "🤖 VLM Enhancement: ⚡ Running"
+
+            elif kind == "vlm":
+                vlm_status = status
+                if "❌ Failed" in vlm_status:
+                    yield od_status, od_results, vlm_status, list(vlm_records.values()), "🤖 Agent: ❌ Skipped", agent_results
+                    return
+                if "✅" in vlm_status and "Completed" in vlm_status:
+                    vlm_done = True
+                new_records = []
+                for record in results or []:
+                    key = (record.get("run_id"), record.get("stream_id"), record.get("item_name"))
+                    if key not in vlm_records:
+                        new_records.append(record)
+                    vlm_records[key] = record
+                if new_records:
+                    agent_pending += len(new_records)
+                    agent_status = "🤖 Agent: ⚡ Running"
+                    submit_agent_calls(new_records, events)
+
+            else:  # agent
+                record, (ok, agent_result) = status, results
+                agent_pending -= 1
+                if ok:
+                    for result in agent_result:
+                        if isinstance(result, dict):
+                            result.setdefault("run_id", record.get("run_id"))
+                            result.setdefault("stream_id", record.get("stream_id", "default"))
+                    agent_results.extend(agent_result)
+                log_end_time("USECASE_1")
+                if not first_decision_logged:
+                    first_decision_logged = True
+                    get_logger().log_custom_event(
+                        "time_to_first_decision",
+                        "USECASE_1",
+                        f"first_decision_{int(time.time() * 1000)}",
+                        latency_ms=round((time.monotonic() - started_at) * 1000, 3),
+                    )
+
+            yield od_status, od_results, vlm_status, list(vlm_records.values()), agent_status, agent_results
+
+        unique_results = list(vlm_records.values())
+        write_json_to_file({"vlm_results":unique_results}, COMMON_RESULTS_DIR_FULL_PATH)
         write_json_to_file({"agent_results":agent_results}, COMMON_RESULTS_DIR_FULL_PATH)
         
-        yield "🧠 Decision Agent: ✅ Completed", final_od_results, "🤖 VLM Enhancement: ✅ Completed", unique_results, "🤖 Agent: ✅ Completed", agent_results
+        yield "🧠 Decision Agent: ✅ Completed", od_results, "🤖 VLM Enhancement: ✅ Completed", unique_results, "🤖 Agent: ✅ Completed", agent_results
         
     except Exception as e:
         error_message = f"Pipeline Error: {str(e)}"
@@ -339,20 +579,16 @@ def agent_call(item, use_case="decision_agent"):
     Returns:
         tuple: (status_message, updated_results)
     """
-    global inventory_list, inventory_set
-    
     try:
         logger.info(f"Pipeline Script - [agent_call] Starting inventory validation {item}")
         
-        if inventory_list is None:
-            inventory_list = load_json_from_file(INVENTORY_FILE)
-            inventory_set = set(item.strip().lower() for item in inventory_list)
+        index = get_inventory_index()
         
 
         
         item_name = item.get("item_name", "").strip().lower()
             
-        if item_name in inventory_set:
+        if index.match(item_name):
             logger.info(f"Pipeline Script - [agent_call] Item '{item_name}' found in inventory")
             return True,[item]
         
@@ -364,14 +600,19 @@ def agent_call(item, use_case="decision_agent"):
             "items": item_name,
             "use_case": use_case
         }       
-        valid, vlm_validation_result, err_msg = call_vlm(vlm_data, use_case=use_case)
+        # Identical names across baskets and runs share one answer (and one in-flight call)
+        memo = get_agent_memo()
+        if memo is not None:
+            valid, vlm_validation_result, err_msg = memo.call(item_name, lambda: call_vlm(vlm_data, use_case=use_case))
+        else:
+            valid, vlm_validation_result, err_msg = call_vlm(vlm_data, use_case=use_case)
         logger.info(f"Pipeline Script - [agent_call] result - {vlm_validation_result}-{valid}-{err_msg}")
         
         if not valid or err_msg or vlm_validation_result and not isinstance(vlm_validation_result, list):
             logger.error(f"Pipeline Script - [agent_call] VLM validation failed for item_name {item_name}: %s", err_msg)
             return False, []
         # Process VLM validation results
-        logger.info("Pipeline Script - [agent_call] Agent validation completed. Item: %d, Validated: %d", 
+        logger.info("Pipeline Script - [agent_call] Agent validation completed. Item: %s, Validated: %s", 
                     item_name, vlm_validation_result)
         return True, vlm_validation_result
         
@@ -379,6 +620,109 @@ def agent_call(item, use_case="decision_agent"):
         logger.error("Pipeline Script - [agent_call] Error in agent call: %s", str(e))
         logger.error(traceback.format_exc())
         return False, []
+
+def agent_call_batch(items, use_case="decision_agent"):
+    """
+    Batched variant of agent_call: items not found in inventory are validated
+    VLM_BATCH_MAX_ITEMS at a time with one VLM call per chunk. Chunks run
+    concurrently at audit priority on the VLM scheduler. Memoized names are
+    answered without a call, and each distinct name is sent only once.
+
+    Args:
+        items: Items from VLM enhancement
+        use_case: The use case for the pipeline
+
+    Returns:
+        list: (status, results) per item, in input order
+    """
+    inventory_index = get_inventory_index()
+    memo = get_agent_memo()
+    outcomes = [None] * len(items)
+    # memo key -> (item name, indexes of the items with that name)
+    pending = {}
+    for index, item in enumerate(items):
+        item_name = item.get("item_name", "").strip().lower()
+        if inventory_index.match(item_name):
+            logger.info(f"Pipeline Script - [agent_call_batch] Item '{item_name}' found in inventory")
+            outcomes[index] = (True, [item])
+            continue
+        memoized = memo.get(item_name) if memo is not None else None
+        if memoized is not None:
+            outcomes[index] = (True, memoized)
+        else:
+            pending.setdefault(memo_key(item_name), (item_name, []))[1].append(index)
+    unmatched = [(indexes, item_name) for item_name, indexes in pending.values()]
+
+    scheduler = get_vlm_scheduler()
+    chunks = [unmatched[start:start + VLM_BATCH_MAX_ITEMS] for start in range(0, len(unmatched), VLM_BATCH_MAX_ITEMS)]
+    futures = [scheduler.submit(call_vlm_batch, [{"items": name, "use_case": use_case} for _, name in chunk], use_case,
+                                priority=PRIORITY_AUDIT)
+               for chunk in chunks]
+    for chunk, future in zip(chunks, futures):
+        logger.info("Pipeline Script - [agent_call_batch] Validating %d item(s) with one VLM call", len(chunk))
+        try:
+            results = future.result()
+        except Exception as e:
+            logger.error("Pipeline Script - [agent_call_batch] Error in agent call: %s", str(e))
+            logger.error(traceback.format_exc())
+            results = [(False, None, str(e))] * len(chunk)
+        for (indexes, item_name), (valid, result, err_msg) in zip(chunk, results):
+            if not valid or err_msg or result and not isinstance(result, list):
+                logger.error(f"Pipeline Script - [agent_call_batch] VLM validation failed for item_name {item_name}: %s", err_msg)
+                for index in indexes:
+                    outcomes[index] = (False, [])
+                continue
+            if not result:
+                # The batch response left this name out; ask for it alone rather than memoize "nothing found"
+                logger.warning(f"Pipeline Script - [agent_call_batch] No result for '{item_name}' in batch response, "
+                               f"validating it alone")
+                outcome = agent_call(items[indexes[0]], use_case)
+                for index in indexes:
+                    outcomes[index] = copy.deepcopy(outcome)
+                continue
+            if memo is not None:
+                memo.put(item_name, result)
+            for index in indexes:
+                outcomes[index] = (True, copy.deepcopy(result))
+    return outcomes
+
+# ============================================================================
+# SCALE-OUT: CROSS-WORKER RESULT AGGREGATION
+# ============================================================================
+
+def finish_scaled_out_run(od_consumer, result):
+    """
+    Report this worker's results for the run and, on the aggregating worker,
+    merge every worker's results into results/runs/run_<run_id>.json.
+
+    Only used when VLM_WORKER_COUNT > 1; the aggregator is the worker that
+    received the run's STREAM_END.
+    """
+    od_status, od_results, vlm_status, vlm_results, agent_status, agent_results = result
+    run_id = current_run["run_id"] or "default"
+    done = {
+        "msg_type": "WORKER_DONE",
+        "run_id": run_id,
+        "worker_id": VLM_WORKER_ID,
+        "data": {
+            "od_results": (od_results or {}).get("od_results", []),
+            "vlm_results": vlm_results or [],
+            "agent_results": agent_results or [],
+            "status": {"od": od_status, "vlm": vlm_status, "agent": agent_status},
+        },
+    }
+    if not od_consumer.publish_control(done):
+        logger.error("Pipeline Script - Could not publish WORKER_DONE for run %s", run_id)
+    if current_run["aggregator"] != VLM_WORKER_ID:
+        return None
+
+    logger.info("Pipeline Script - Aggregating run %s across %d worker(s)", run_id, VLM_WORKER_COUNT)
+    parts = run_aggregator.wait(run_id, VLM_WORKER_COUNT, VLM_AGGREGATE_TIMEOUT_SEC)
+    summary = merge_worker_results(run_id, parts, VLM_WORKER_COUNT)
+    path = write_run_results(summary)
+    print(f"📦 Run {run_id}: merged results of {len(parts)}/{VLM_WORKER_COUNT} worker(s) → {path}")
+    return summary
+
 # ============================================================================
 # INITIALIZATION
 # ============================================================================
@@ -388,8 +732,8 @@ def init_pipeline_components():
     """Initialize all necessary components for the pipeline"""
     global vlm_queue, result_queue, od_message_queue
         
-    # Object Detection Consumer
-    od_consumer = ODConsumer(od_message_queue,RABBITMQ_USER,RABBITMQ_PASSWORD)
+    # Object Detection Consumer (one of VLM_WORKER_COUNT competing consumers)
+    od_consumer = ODConsumer(od_message_queue,RABBITMQ_USER,RABBITMQ_PASSWORD, on_worker_done=run_aggregator.add)
     od_consumer.start_consumer()
     
     # VLM Enhancer Consumer
@@ -415,6 +759,7 @@ def main(video_file_name=None):
     global od_results_shown, od_pipeline_status, vlm_pipeline_status
     
     agent_pipeline_status = False
+    vlm_results_shown = False
     
     for step in execute_loss_prevention_pipeline(video_file_name):
         od_status, od_results, vlm_status, vlm_results, agent_status, agent_results = step
@@ -442,7 +787,9 @@ def main(video_file_name=None):
             od_results_shown = True
         
         # Check and display VLM Enhancement completion
-        if "✅" in vlm_status and "Completed" in vlm_status:
+        # Agent decisions keep streaming in after VLM enhancement completes; show its results once
+        if "✅" in vlm_status and "Completed" in vlm_status and not vlm_results_shown:
+            vlm_results_shown = True
             logger.info("Pipeline Script - VLM Enhancement COMPLETED")
             logger.info("Pipeline Script - VLM Enhancement Results: %s", vlm_results)
             print(f"{vlm_status}")
@@ -505,6 +852,9 @@ if __name__ == "__main__":
         print(f"VLM Status: {vlm_status}")
         print(f"Agent Status: {agent_status}")
 
+    if VLM_WORKER_COUNT > 1:
+        finish_scaled_out_run(od_consumer, result)
+
     vlm_enhancer_thread.join() 
     logger.info("=== VLM Enhancer finished ===")
     logger.info("=== END OF PIPELINE RUN ===\n\n\n")
\ No newline at end of file
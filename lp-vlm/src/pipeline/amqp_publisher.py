@@ -0,0 +1,419 @@
+"""
+Background RabbitMQ publisher for the gvapython Publisher.
+Moves broker I/O off the GStreamer streaming thread: events are queued,
+batched, published with publisher confirms and spooled to disk while the
+broker is unreachable.
+"""
+
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import traceback
+from datetime import datetime
+
+import pika
+from config import METADATA_DIR_FULL_PATH
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+QUEUE_NAME = "object_detection"
+# Topic exchange so routing keys carry the stream id: object_detection.<stream_id>
+EXCHANGE_NAME = os.environ.get("RABBITMQ_EXCHANGE", "lp.object_detection")
+ROUTING_KEY_PREFIX = "object_detection"
+CONTROL_STREAM_ID = "control"
+
+# Events published in one confirmed round trip
+BATCH_SIZE = int(os.environ.get("RABBITMQ_BATCH_SIZE", "32"))
+# How long the I/O thread waits for more events before publishing a partial batch
+BATCH_LINGER_MS = int(os.environ.get("RABBITMQ_BATCH_LINGER_MS", "50"))
+# In-memory queue bound; overflow goes straight to the spool
+MAX_PENDING = int(os.environ.get("RABBITMQ_MAX_PENDING", "10000"))
+
+SPOOL_DIR = os.environ.get("RABBITMQ_SPOOL_DIR", os.path.join(METADATA_DIR_FULL_PATH, "spool"))
+SPOOL_MAX_BYTES = int(os.environ.get("RABBITMQ_SPOOL_MAX_MB", "64")) * 1024 * 1024
+# A batch claimed for replay longer than this belongs to a replayer that died; it is replayed again
+SPOOL_INFLIGHT_STALE_S = float(os.environ.get("RABBITMQ_SPOOL_INFLIGHT_STALE_S", "300"))
+INFLIGHT_SUFFIX = ".inflight"
+
+RECONNECT_MAX_BACKOFF_S = 30
+FLUSH_TIMEOUT_S = float(os.environ.get("RABBITMQ_FLUSH_TIMEOUT_S", "10"))
+
+logger = logging.getLogger("loss_prevention_gvapython")
+
+_STOP = object()
+# Shared by every DiskSpool in the process (one Publisher per stream)
+_SPOOL_LOCK = threading.RLock()
+
+# ============================================================================
+# HELPERS
+# ============================================================================
+
+def get_rabbitmq_connection():
+    """Open a single RabbitMQ connection attempt (no retry loop)."""
+    credentials = pika.PlainCredentials(
+        os.environ.get("RABBITMQ_USER"),
+        os.environ.get("RABBITMQ_PASSWORD")
+    )
+    return pika.BlockingConnection(
+        pika.ConnectionParameters(
+            host=os.getenv("RABBITMQ_HOST", "rabbitmq"),
+            port=int(os.getenv("RABBITMQ_PORT", "5672")),
+            credentials=credentials,
+            heartbeat=60,
+            blocked_connection_timeout=30
+        )
+    )
+
+
+def routing_key_for(stream_id):
+    """Routing key for events of one stream."""
+    return f"{ROUTING_KEY_PREFIX}.{stream_id}"
+
+
+def declare_topology(channel, queue_name=QUEUE_NAME):
+    """Declare the detection exchange and queue and bind all stream keys."""
+    channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type="topic", durable=True)
+    channel.queue_declare(queue=queue_name, durable=True)
+    channel.queue_bind(queue=queue_name, exchange=EXCHANGE_NAME, routing_key=f"{ROUTING_KEY_PREFIX}.#")
+
+
+def build_body(messages):
+    """
+    Wrap several events into one BATCH message.
+    A single event is sent as-is so existing consumers keep working.
+    """
+    if len(messages) == 1:
+        return messages[0]
+    return {
+        "msg_type": "BATCH",
+        "status": "PROCESSING",
+        "timestamp": datetime.now().isoformat(),
+        "data": {"messages": messages}
+    }
+
+
+def publish_batch(channel, messages, routing_key):
+    """
+    Publish events on a channel in confirm mode.
+    Raises on nack/unroutable so callers can spool and retry.
+    """
+    channel.basic_publish(
+        exchange=EXCHANGE_NAME,
+        routing_key=routing_key,
+        body=json.dumps(build_body(messages)),
+        properties=pika.BasicProperties(delivery_mode=2, content_type="application/json"),
+        mandatory=True
+    )
+
+# ============================================================================
+# DISK SPOOL
+# ============================================================================
+
+class DiskSpool:
+    """
+    Bounded on-disk spool of unpublished event batches.
+    One JSON file per batch (with its routing key), written atomically and
+    replayed in order. The oldest batches are dropped once the size bound
+    is exceeded.
+
+    Several replayers share the directory (every stream's Publisher and
+    send_end_message.py, in other processes). A replayer claims a file by
+    renaming it to <name>.inflight before publishing it, so each batch is
+    published by exactly one of them.
+    """
+
+    _seq = 0
+
+    def __init__(self, directory=SPOOL_DIR, max_bytes=SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = _SPOOL_LOCK
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _files(self):
+        return sorted(
+            os.path.join(self.directory, name)
+            for name in os.listdir(self.directory)
+            if name.endswith(".json")
+        )
+
+    def __len__(self):
+        try:
+            return len(self._files())
+        except FileNotFoundError:
+            return 0
+
+    def write(self, messages, routing_key):
+        """Persist a batch of events."""
+        if not messages:
+            return
+        with self._lock:
+            DiskSpool._seq += 1
+            name = f"{time.time_ns():020d}-{os.getpid()}-{DiskSpool._seq:06d}.json"
+            path = os.path.join(self.directory, name)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"routing_key": routing_key, "messages": messages}, f)
+            os.replace(tmp_path, path)
+            self._enforce_limit()
+        logger.warning(f"Spooled {len(messages)} event(s) to {path}")
+
+    def _enforce_limit(self):
+        files = self._files()
+        sizes = {}
+        for path in files:
+            try:
+                sizes[path] = os.path.getsize(path)
+            except FileNotFoundError:
+                pass  # claimed by a replayer meanwhile
+        total = sum(sizes.values())
+        for path in files[:-1]:
+            if total <= self.max_bytes:
+                break
+            if path not in sizes:
+                continue
+            total -= sizes[path]
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            logger.error(f"Spool exceeded {self.max_bytes} bytes, dropped {path}")
+
+    def _claim(self, path):
+        """Atomically take a spooled file for replay; None if another replayer got it first."""
+        inflight = path + INFLIGHT_SUFFIX
+        try:
+            os.rename(path, inflight)
+        except FileNotFoundError:
+            return None
+        return inflight
+
+    def _recover_stale(self):
+        """Put back batches claimed by a replayer that died before finishing them."""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json" + INFLIGHT_SUFFIX):
+                continue
+            inflight = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(inflight) > SPOOL_INFLIGHT_STALE_S:
+                    os.rename(inflight, inflight[:-len(INFLIGHT_SUFFIX)])
+                    logger.warning(f"Recovered stale in-flight spool file {inflight}")
+            except FileNotFoundError:
+                continue
+
+    def replay(self, publish_fn):
+        """
+        Publish spooled batches oldest first via publish_fn(messages, routing_key);
+        each file is claimed before publishing and removed only after
+        publish_fn returns. Files claimed by another replayer are skipped.
+        Stops at the first failure, returns that file to the spool and
+        re-raises.
+
+        Returns:
+            int: Number of events replayed
+        """
+        replayed = 0
+        with self._lock:
+            self._recover_stale()
+            for path in self._files():
+                inflight = self._claim(path)
+                if inflight is None:
+                    continue
+                try:
+                    with open(inflight, "r") as f:
+                        record = json.load(f)
+                    messages = record["messages"]
+                    for start in range(0, len(messages), BATCH_SIZE):
+                        publish_fn(messages[start:start + BATCH_SIZE], record["routing_key"])
+                except Exception:
+                    os.rename(inflight, path)
+                    raise
+                os.unlink(inflight)
+                replayed += len(messages)
+        if replayed:
+            logger.info(f"Replayed {replayed} spooled event(s)")
+        return replayed
+
+# ============================================================================
+# CONFIRMED PUBLISHER
+# ============================================================================
+
+class ConfirmedPublisher:
+    """
+    Publishes events to RabbitMQ from a background I/O thread.
+
+    - publish() never blocks on the broker and never exits the process
+    - events are batched (BATCH_SIZE / BATCH_LINGER_MS) and confirmed
+    - the connection is kept open and re-established with backoff
+    - while disconnected, batches go to a bounded DiskSpool
+    """
+
+    def __init__(self, stream_id="default", queue_name=QUEUE_NAME, spool=None):
+        self.stream_id = stream_id
+        self.routing_key = routing_key_for(stream_id)
+        self.queue_name = queue_name
+        self.spool = spool if spool is not None else DiskSpool()
+        self._pending = queue.Queue(maxsize=MAX_PENDING)
+        self._connection = None
+        self._channel = None
+        self._backoff_s = 1
+        self._next_connect_at = 0.0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"amqp-publisher-{stream_id}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------------
+    # PUBLIC API
+    # ------------------------------------------------------------------------
+
+    def publish(self, message):
+        """
+        Queue an event for publishing.
+
+        Args:
+            message (dict): Message payload
+        """
+        if self._closed:
+            self._spool([message])
+            return
+        try:
+            self._pending.put_nowait(message)
+        except queue.Full:
+            logger.warning("Publisher queue full, spooling event to disk")
+            self._spool([message])
+
+    def close(self, timeout=FLUSH_TIMEOUT_S):
+        """Flush pending events, spool whatever could not be sent and disconnect."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._pending.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        leftover = self._drain_pending()
+        if leftover:
+            logger.warning(f"Flush timed out, spooling {len(leftover)} event(s)")
+            self._spool(leftover)
+
+    # ------------------------------------------------------------------------
+    # I/O THREAD
+    # ------------------------------------------------------------------------
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch and not len(self.spool):
+                continue
+            try:
+                if self._ensure_channel():
+                    self.spool.replay(self._publish)
+                    if batch:
+                        self._publish(batch, self.routing_key)
+                    self._backoff_s = 1
+                elif batch:
+                    self._spool(batch)
+            except Exception as e:
+                logger.error(f"Error publishing to RabbitMQ: {e}")
+                logger.error(traceback.format_exc())
+                self._spool(batch)
+                self._disconnect()
+        self._disconnect()
+
+    def _spool(self, batch):
+        """Write a batch to the spool; a failing disk loses the batch but never the I/O thread."""
+        try:
+            self.spool.write(batch, self.routing_key)
+        except Exception as e:
+            logger.error(f"Could not spool {len(batch)} event(s) for {self.routing_key}, dropping them: {e}")
+
+    def _next_batch(self):
+        """
+        Collect up to BATCH_SIZE events, waiting at most BATCH_LINGER_MS after
+        the first one. Returns (batch, stop_requested).
+        """
+        batch = []
+        try:
+            item = self._pending.get(timeout=1.0)
+        except queue.Empty:
+            self._heartbeat()
+            return batch, False
+        if item is _STOP:
+            return batch, True
+        batch.append(item)
+
+        deadline = time.monotonic() + BATCH_LINGER_MS / 1000.0
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _drain_pending(self):
+        items = []
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                return items
+            if item is not _STOP:
+                items.append(item)
+
+    def _publish(self, messages, routing_key):
+        publish_batch(self._channel, messages, routing_key)
+        logger.debug(f"Published {len(messages)} event(s)")
+
+    def _ensure_channel(self):
+        """Return True when a confirmed channel is available."""
+        if self._channel is not None and self._channel.is_open:
+            return True
+        if time.monotonic() < self._next_connect_at:
+            return False
+        try:
+            self._connection = get_rabbitmq_connection()
+            self._channel = self._connection.channel()
+            declare_topology(self._channel, self.queue_name)
+            self._channel.confirm_delivery()
+            logger.info("RabbitMQ publisher connected")
+            return True
+        except Exception as e:
+            logger.error(f"Error establishing RabbitMQ connection: {e}")
+            self._disconnect()
+            self._next_connect_at = time.monotonic() + self._backoff_s
+            self._backoff_s = min(self._backoff_s * 2, RECONNECT_MAX_BACKOFF_S)
+            return False
+
+    def _heartbeat(self):
+        """Service heartbeats while idle so the broker keeps the connection."""
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.process_data_events(time_limit=0)
+        except Exception as e:
+            logger.error(f"RabbitMQ connection lost while idle: {e}")
+            self._disconnect()
+
+    def _disconnect(self):
+        try:
+            if self._connection is not None and self._connection.is_open:
+                self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+        self._channel = None
@@ -0,0 +1,127 @@
+"""
+Capture-time frame scoring for the gvapython Publisher.
+Scores each tracked object's crop for sharpness and stability as frames
+arrive and keeps the running top-K frames per track, so only those frames
+are uploaded and the consumer receives the winning frame directly.
+"""
+
+import os
+import heapq
+
+import numpy as np
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+# Frames kept (and uploaded) per track; 0 disables scoring and keeps every frame
+TOP_K = int(os.environ.get("FRAME_SCORE_TOP_K", "5"))
+# Weight of sharpness vs stability
+ALPHA = float(os.environ.get("FRAME_SCORE_ALPHA", "0.5"))
+# Side of the square grid the crop is sampled onto
+CROP_SIZE = 64
+# Laplacian variance giving a sharpness score of ~0.63
+SHARPNESS_SCALE = float(os.environ.get("FRAME_SCORE_SHARPNESS_SCALE", "200"))
+# Mean abs grey-level change giving a stability score of 0.5
+STABILITY_SCALE = float(os.environ.get("FRAME_SCORE_STABILITY_SCALE", "8"))
+
+
+def crop_gray(image, bbox, size=CROP_SIZE):
+    """
+    Sample a detection crop onto a size x size grey grid straight from the
+    mapped frame; only the sampled pixels are read.
+
+    Args:
+        image (np.ndarray): Mapped frame, (H, W, C) BGR/RGB or (H, W) grey
+        bbox (dict): Normalized x_min, y_min, x_max, y_max
+        size (int): Grid size
+
+    Returns:
+        np.ndarray: (size, size) float32 crop, or None for an empty box
+    """
+    height, width = image.shape[:2]
+    x1 = int(np.clip(bbox.get("x_min", 0.0), 0, 1) * width)
+    x2 = int(np.clip(bbox.get("x_max", 1.0), 0, 1) * width)
+    y1 = int(np.clip(bbox.get("y_min", 0.0), 0, 1) * height)
+    y2 = int(np.clip(bbox.get("y_max", 1.0), 0, 1) * height)
+    if x2 - x1 < 2 or y2 - y1 < 2:
+        return None
+    ys = np.linspace(y1, y2 - 1, size).astype(np.intp)
+    xs = np.linspace(x1, x2 - 1, size).astype(np.intp)
+    if image.ndim == 3:
+        # Green carries most of the luminance in both BGR and RGB
+        return image[np.ix_(ys, xs)][..., 1].astype(np.float32)
+    return image[np.ix_(ys, xs)].astype(np.float32)
+
+
+def sharpness(crop):
+    """Laplacian variance mapped to [0, 1)."""
+    lap = (4 * crop[1:-1, 1:-1] - crop[:-2, 1:-1] - crop[2:, 1:-1]
+           - crop[1:-1, :-2] - crop[1:-1, 2:])
+    return float(1 - np.exp(-lap.var() / SHARPNESS_SCALE))
+
+
+def stability(crop, prev_crop):
+    """Inverse mean abs difference to the previous crop of the same track, in (0, 1]."""
+    if prev_crop is None:
+        return 0.5
+    return float(1 / (1 + np.abs(crop - prev_crop).mean() / STABILITY_SCALE))
+
+# ============================================================================
+# TRACK SCORER
+# ============================================================================
+
+class TrackScorer:
+    """
+    Running top-K of scored frames for one track.
+
+    offer() is O(log K); best() and frames() are what the Publisher sends.
+    """
+
+    def __init__(self, top_k=TOP_K, alpha=ALPHA):
+        self.top_k = top_k
+        self.alpha = alpha
+        self._heap = []  # min-heap of (score, seq, frame_path, bbox)
+        self._seq = 0
+        self._prev_crop = None
+
+    def offer(self, frame_path, crop, bbox=None):
+        """
+        Score a frame's crop and keep it if it ranks in the top K.
+
+        bbox (normalized x_min, y_min, x_max, y_max) is kept with the frame so
+        the consumer can tell which region of the best frame is the item.
+
+        Returns:
+            bool: True if the frame entered the top K (and must be stored)
+        """
+        if crop is None:
+            return False
+        score = self.alpha * sharpness(crop) + (1 - self.alpha) * stability(crop, self._prev_crop)
+        self._prev_crop = crop
+        self._seq += 1
+        entry = (score, self._seq, frame_path, bbox)
+        if len(self._heap) < self.top_k:
+            heapq.heappush(self._heap, entry)
+            return True
+        if score > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+            return True
+        return False
+
+    def best(self):
+        """(frame_path, score) of the best frame so far, or (None, 0.0)."""
+        if not self._heap:
+            return None, 0.0
+        score, _, frame_path, _ = max(self._heap)
+        return frame_path, round(score, 4)
+
+    def best_bbox(self):
+        """Bounding box of the item in the best frame, or None."""
+        if not self._heap:
+            return None
+        return max(self._heap)[3]
+
+    def frames(self):
+        """Top-K frame paths in capture order."""
+        return [entry[2] for entry in sorted(self._heap, key=lambda entry: entry[1])]
@@ -0,0 +1,137 @@
+"""
+Lightweight IoU/centroid tracker for detections that arrive without gvatrack ids.
+Gives the Publisher stable per-object ids so dedup and dwell time always use
+the time-based tracking path.
+"""
+
+import os
+
+import numpy as np
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+IOU_THRESHOLD = float(os.environ.get("FALLBACK_TRACKER_IOU", "0.3"))
+# Max centroid distance (normalized frame units) for matches IoU misses, e.g. fast motion
+CENTROID_THRESHOLD = float(os.environ.get("FALLBACK_TRACKER_CENTROID", "0.1"))
+MAX_AGE_MS = int(os.environ.get("FALLBACK_TRACKER_MAX_AGE_MS", "1000"))
+
+
+def pairwise_iou(boxes_a, boxes_b):
+    """
+    IoU between every box in boxes_a (N, 4) and boxes_b (M, 4), as (x1, y1, x2, y2).
+
+    Returns:
+        np.ndarray: (N, M) IoU matrix
+    """
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def _greedy_match(scores, threshold):
+    """
+    Greedily pair rows and columns by descending score.
+
+    Returns:
+        list of (row, col) pairs with score >= threshold
+    """
+    scores = scores.copy()
+    pairs = []
+    while scores.size:
+        row, col = np.unravel_index(np.argmax(scores), scores.shape)
+        if scores[row, col] < threshold:
+            break
+        pairs.append((int(row), int(col)))
+        scores[row, :] = -np.inf
+        scores[:, col] = -np.inf
+    return pairs
+
+
+class IoUTracker:
+    """
+    Assigns stable ids to per-frame detections by label-aware IoU matching,
+    falling back to centroid distance for boxes that moved too far to overlap.
+
+    Ids are negative integers so they never collide with gvatrack ids.
+    Tracks not matched for max_age_ms are dropped.
+    """
+
+    def __init__(self, iou_threshold=IOU_THRESHOLD, centroid_threshold=CENTROID_THRESHOLD,
+                 max_age_ms=MAX_AGE_MS):
+        self.iou_threshold = iou_threshold
+        self.centroid_threshold = centroid_threshold
+        self.max_age_ms = max_age_ms
+        self._boxes = np.zeros((0, 4), dtype=np.float32)
+        self._labels = np.zeros(0, dtype=object)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._last_seen = np.zeros(0, dtype=np.float64)
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self._ids)
+
+    def update(self, labels, boxes, now_ms):
+        """
+        Match detections of one frame to existing tracks.
+
+        Args:
+            labels (list[str]): Detection labels
+            boxes (list): Detection boxes as (x1, y1, x2, y2), normalized
+            now_ms (float): Frame time in milliseconds
+
+        Returns:
+            list[int]: Track id per detection, in input order
+        """
+        alive = (now_ms - self._last_seen) <= self.max_age_ms
+        self._boxes = self._boxes[alive]
+        self._labels = self._labels[alive]
+        self._ids = self._ids[alive]
+        self._last_seen = self._last_seen[alive]
+
+        if not labels:
+            return []
+
+        det_boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        det_labels = np.asarray(labels, dtype=object)
+        assigned = np.zeros(len(det_labels), dtype=np.int64)
+
+        if len(self._ids):
+            same_label = det_labels[:, None] == self._labels[None, :]
+            iou = np.where(same_label, pairwise_iou(det_boxes, self._boxes), 0.0)
+            pairs = _greedy_match(iou, self.iou_threshold)
+
+            # Centroid fallback for what IoU left unmatched
+            free_dets = np.setdiff1d(np.arange(len(det_labels)), [r for r, _ in pairs])
+            free_tracks = np.setdiff1d(np.arange(len(self._ids)), [c for _, c in pairs])
+            if len(free_dets) and len(free_tracks):
+                det_c = (det_boxes[free_dets, :2] + det_boxes[free_dets, 2:]) / 2
+                trk_c = (self._boxes[free_tracks, :2] + self._boxes[free_tracks, 2:]) / 2
+                dist = np.linalg.norm(det_c[:, None, :] - trk_c[None, :, :], axis=-1)
+                closeness = np.where(same_label[np.ix_(free_dets, free_tracks)], -dist, -np.inf)
+                for r, c in _greedy_match(closeness, -self.centroid_threshold):
+                    pairs.append((int(free_dets[r]), int(free_tracks[c])))
+
+            for det, trk in pairs:
+                assigned[det] = self._ids[trk]
+                self._boxes[trk] = det_boxes[det]
+                self._last_seen[trk] = now_ms
+
+        new_dets = np.flatnonzero(assigned == 0)
+        if len(new_dets):
+            new_ids = -np.arange(self._next_id, self._next_id + len(new_dets), dtype=np.int64)
+            self._next_id += len(new_dets)
+            assigned[new_dets] = new_ids
+            self._boxes = np.concatenate([self._boxes, det_boxes[new_dets]])
+            self._labels = np.concatenate([self._labels, det_labels[new_dets]])
+            self._ids = np.concatenate([self._ids, new_ids])
+            self._last_seen = np.concatenate([self._last_seen, np.full(len(new_dets), now_ms)])
+
+        return assigned.tolist()
@@ -0,0 +1,201 @@
+"""
+Opt-in per-stage timing for the gvapython Publisher.
+Keeps a rolling window of samples per stage and periodically exports
+p50/p95/max and counters to a JSONL file or a Prometheus textfile.
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+import traceback
+from collections import defaultdict, deque
+
+from config import METADATA_DIR_FULL_PATH
+
+# ============================================================================
+# CONSTANTS
+# ============================================================================
+
+PROFILE_ENABLED = os.environ.get("PUBLISHER_PROFILE", "0") == "1"
+# A ".prom" suffix selects the Prometheus textfile format, anything else is JSONL;
+# each stream writes its own file, named with the stream id before the extension
+PROFILE_FILE = os.environ.get(
+    "PUBLISHER_PROFILE_FILE",
+    os.path.join(METADATA_DIR_FULL_PATH, "publisher_profile.jsonl")
+)
+PROFILE_INTERVAL_S = float(os.environ.get("PUBLISHER_PROFILE_INTERVAL_S", "10"))
+PROFILE_WINDOW = int(os.environ.get("PUBLISHER_PROFILE_WINDOW", "1024"))
+
+logger = logging.getLogger("loss_prevention_gvapython")
+
+
+def stream_profile_path(path, stream_id):
+    """
+    Per-stream variant of a profile path: "profile.prom" -> "profile.cam1.prom".
+
+    Every camera branch runs its own Publisher, so sharing one file would have
+    the streams replace (textfile) or interleave (JSONL) each other's exports.
+    """
+    if not stream_id:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{stream_id}{ext}"
+
+
+class _NullStage:
+    """No-op stage timer used when profiling is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """Times one stage and records it on exit."""
+
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+        return False
+
+# ============================================================================
+# STAGE PROFILER
+# ============================================================================
+
+class StageProfiler:
+    """
+    Rolling per-stage latency histograms and counters.
+
+    Usage:
+        with profiler.stage("encode"):
+            ...
+        profiler.count("frames")
+        profiler.maybe_export()
+
+    All methods are no-ops when disabled.
+    """
+
+    def __init__(self, enabled=PROFILE_ENABLED, path=PROFILE_FILE,
+                 interval_s=PROFILE_INTERVAL_S, window=PROFILE_WINDOW, labels=None, stream_id=None):
+        self.enabled = enabled
+        self.path = stream_profile_path(path, stream_id)
+        self.interval_s = interval_s
+        self.labels = labels or {}
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._counters = defaultdict(int)
+        self._lock = threading.Lock()
+        self._last_export = time.monotonic()
+        if self.enabled:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            logger.info(f"Publisher profiling enabled, exporting to {self.path} every {self.interval_s}s")
+
+    def stage(self, name):
+        """Context manager timing a named stage."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def record(self, name, seconds):
+        """Record one sample (seconds) for a stage."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._samples[name].append(seconds)
+            self._counters[f"{name}_total"] += 1
+
+    def count(self, name, value=1):
+        """Increment a counter."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] += value
+
+    def snapshot(self):
+        """
+        Summarize the current window.
+
+        Returns:
+            dict: {"stages": {name: {count, p50_ms, p95_ms, max_ms}}, "counters": {...}}
+        """
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items() if values}
+            counters = dict(self._counters)
+        stages = {}
+        for name, values in samples.items():
+            n = len(values)
+            stages[name] = {
+                "count": n,
+                "p50_ms": round(values[int(0.50 * (n - 1))] * 1000, 3),
+                "p95_ms": round(values[int(0.95 * (n - 1))] * 1000, 3),
+                "max_ms": round(values[-1] * 1000, 3),
+            }
+        return {"stages": stages, "counters": counters}
+
+    def maybe_export(self):
+        """Export if the export interval has elapsed."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now - self._last_export < self.interval_s:
+            return
+        self._last_export = now
+        self.export()
+
+    def export(self):
+        """Write the current snapshot to the configured file."""
+        if not self.enabled:
+            return
+        try:
+            snapshot = self.snapshot()
+            if self.path.endswith(".prom"):
+                self._write_prometheus(snapshot)
+            else:
+                record = {"timestamp": time.time(), **self.labels, **snapshot}
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+        except Exception as e:
+            logger.error(f"Error exporting publisher profile: {e}")
+            logger.error(traceback.format_exc())
+
+    def _write_prometheus(self, snapshot):
+        """Atomically replace a node-exporter textfile."""
+        label_str = ",".join(f'{k}="{v}"' for k, v in self.labels.items())
+        lines = [
+            "# TYPE lp_publisher_stage_ms gauge",
+        ]
+        for name, stats in snapshot["stages"].items():
+            for quantile in ("p50", "p95", "max"):
+                labels = f'stage="{name}",stat="{quantile}"' + (f",{label_str}" if label_str else "")
+                lines.append(f"lp_publisher_stage_ms{{{labels}}} {stats[quantile + '_ms']}")
+        lines.append("# TYPE lp_publisher_total counter")
+        for name, value in snapshot["counters"].items():
+            labels = f'name="{name}"' + (f",{label_str}" if label_str else "")
+            lines.append(f"lp_publisher_total{{{labels}}} {value}")
+        # Unique temp file in the target directory, so os.replace stays atomic
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".",
+                                        prefix=os.path.basename(self.path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -15,33 +15,42 @@ import traceback
 from dataclasses import dataclass, field
 from datetime import datetime
 from io import BytesIO
-from collections import defaultdict
 
 import numpy as np
-import pika
 from PIL import Image
 from config import METADATA_DIR_FULL_PATH, FRAMES_DIR_FULL_PATH, BUCKET_NAME, MINIO_HOST, FRAME_DIR_VOL_BASE, RESULTS_DIR
+from amqp_publisher import ConfirmedPublisher
+from profiler import StageProfiler
+from iou_tracker import IoUTracker
+from frame_scorer import TrackScorer, crop_gray, TOP_K as FRAME_SCORE_TOP_K
 
 # ============================================================================
 # CONSTANTS
 # ============================================================================
 
-threshold_value = os.environ.get("DETECTION_THRESHOLD")
-THRESHOLD = int(threshold_value) if threshold_value else 12  # Fallback frame-count threshold
-
-# Time-based tracking threshold (milliseconds) — preferred when gvatrack provides tracking IDs
+# Time-based tracking threshold (milliseconds). Objects without gvatrack IDs get
+# IDs from the built-in IoUTracker, so every detection uses this path.
 TRACKING_THRESHOLD_MS = int(os.environ.get("TRACKING_THRESHOLD_MS", "1500"))
 
+# Buckets already checked/created by any Publisher in this process
+_READY_BUCKETS = set()
+
 
 @dataclass
 class TrackedObject:
-    """Tracks a single detected object instance by its unique tracking ID."""
+    """Tracks a single detected object instance by its unique tracking ID.
+
+    Negative IDs come from the fallback IoUTracker, positive ones from gvatrack.
+    With capture-time scoring enabled, frames are kept by scorer (top-K)
+    instead of the unbounded frames list.
+    """
     label: str
     tracking_id: int
     first_seen: float   # wall-clock time in milliseconds
     last_seen: float
     published: bool = False
     frames: list = field(default_factory=list)
+    scorer: TrackScorer = None
 
 # ============================================================================
 # LOGGER SETUP
@@ -109,6 +118,44 @@ def get_minio_client():
         logger.error(traceback.format_exc())
         sys.exit(1)
 
+# ============================================================================
+# IMAGE CONVERSION
+# ============================================================================
+
+# GStreamer format -> PIL raw decoder mode producing RGB
+_RAW_MODES = {
+    "BGR": "BGR",
+    "BGRx": "BGRX",
+    "BGRA": "BGRX",
+    "RGB": "RGB",
+    "RGBx": "RGBX",
+    "RGBA": "RGBX",
+}
+
+
+def to_pil_image(image_array, img_format):
+    """
+    Build an RGB PIL image from a mapped frame.
+    
+    Contiguous frames are decoded straight from the mapped buffer (channel
+    swap included) without an intermediate numpy copy. Anything else falls
+    back to slicing + Image.fromarray.
+    
+    Args:
+        image_array (np.ndarray): Mapped frame (H, W, C)
+        img_format (str): GStreamer video format, e.g. "BGR"
+    
+    Returns:
+        PIL.Image.Image: RGB image
+    """
+    rawmode = _RAW_MODES.get(img_format)
+    if rawmode and image_array.ndim == 3 and image_array.flags.c_contiguous:
+        height, width = image_array.shape[:2]
+        return Image.frombuffer("RGB", (width, height), image_array, "raw", rawmode, 0, 1)
+    if img_format in ["BGR", "BGRx", "BGRA"]:
+        image_array = image_array[:, :, 2::-1]
+    return Image.fromarray(image_array)
+
 # ============================================================================
 # PUBLISHER CLASS
 # ============================================================================
@@ -128,40 +175,43 @@ class Publisher:
     # INITIALIZATION
     # ------------------------------------------------------------------------
     
-    def __init__(self, clean_output=True):
+    def __init__(self, clean_output=True, stream_id=None):
         """
         Initialize Publisher with necessary connections and directories.
         
         Args:
             clean_output (bool): Whether to clean output directories on startup
+            stream_id (str): Camera/stream id of this detection branch; tags
+                every message and its RabbitMQ routing key
         """
         try:
             # Frame tracking
             self.frame_counter = 0
-            self.run_id = f"{int(time.time())}-{random.randint(1000, 9999)}"
-            self.person = 0
+            # RUN_ID is shared by all Publishers of one multi-camera pipeline
+            self.run_id = os.environ.get("RUN_ID") or f"{int(time.time())}-{random.randint(1000, 9999)}"
+            self.stream_id = stream_id or os.environ.get("STREAM_ID", "default")
             # Directory setup
             self.metadata_dir = METADATA_DIR_FULL_PATH
             self.frames_dir = FRAMES_DIR_FULL_PATH
             self.output_dir_frames = "/app/pipeline-server/results/frames"
             
             # Detection tracking
-            self.item_frameid_mapper = defaultdict(list)
-            self.sent_items = []
             self._tracked_objects = {}  # tracking_id -> TrackedObject
             self._threshold_ms = TRACKING_THRESHOLD_MS
+            self._fallback_tracker = IoUTracker()
             
             # External connections
             self.minio_client = get_minio_client()
-            self.connection = None
-            self.channel = None
+            self.amqp_publisher = None
+            self.profiler = StageProfiler(labels={"run_id": self.run_id, "stream_id": self.stream_id},
+                                          stream_id=self.stream_id)
             self.file_handle = None
             
             # Setup
             self._setup_directories(clean_output)
             self._setup_jsonl_file()
             self._setup_rabbitmq()            
-            logger.info(f"GVA Publisher initialized: {self.metadata_dir}")
+            logger.info(f"GVA Publisher initialized for stream '{self.stream_id}': {self.metadata_dir}")
         except Exception as e:
             logger.error(f"Error initializing Publisher: {e}")
             logger.error(traceback.format_exc())
@@ -184,7 +234,7 @@ class Publisher:
         """Initialize JSONL file for metadata storage."""
         try:
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S") + str(int(time.time_ns()))[10:16]
-            self.jsonl_file = os.path.join(self.metadata_dir, f"rs-1_{timestamp}.jsonl")
+            self.jsonl_file = os.path.join(self.metadata_dir, f"rs-{self.stream_id}_{timestamp}.jsonl")
             os.makedirs(os.path.dirname(self.jsonl_file), exist_ok=True)
             self.file_handle = open(self.jsonl_file, 'a')
         except Exception as e:
@@ -193,12 +243,9 @@ class Publisher:
             sys.exit(1)
     
     def _setup_rabbitmq(self):
-        """Establish RabbitMQ connection and channel."""
+        """Start the background RabbitMQ publisher (connects asynchronously)."""
         try:
-            # Use local client (works with mounted files inside container)
-            self.connection = self.get_rabbitmq_connection()
-            self.channel = self.connection.channel()
-            self.channel.queue_declare(queue="object_detection", durable=True)
+            self.amqp_publisher = ConfirmedPublisher(stream_id=self.stream_id)
         except Exception as e:
             logger.error(f"Error setting up RabbitMQ: {e}")
             logger.error(traceback.format_exc())
@@ -219,31 +266,55 @@ class Publisher:
             bool: False if processing failed, None otherwise
         """
         try:
-            with frame.data() as image:
-                video_info = frame.video_info()
-                logger.info("Frame received for processing**********************************")
-                
-                frame_id = f"frame__{self.frame_counter:06d}.jpg"
-                metadata = {"frame_id": frame_id}
-                
-                # Extract and update metadata
+            profiler = self.profiler
+            frame_start = time.perf_counter()
+            logger.debug("Frame received for processing")
+            profiler.count("frames")
+            
+            frame_id = f"frame__{self.frame_counter:06d}.jpg"
+            metadata = {"frame_id": frame_id}
+            
+            # Extract and update metadata (no pixel access)
+            with profiler.stage("parse"):
                 messages = frame.messages()
-                if isinstance(messages, list) and len(messages) > 0:
-                    json_string = messages[0]
-                    data = json.loads(json_string)
-                    metadata.update(data)
-                    
+                has_metadata = isinstance(messages, list) and len(messages) > 0
+                if has_metadata:
+                    metadata.update(json.loads(messages[0]))
+            
+            if has_metadata:
+                with profiler.stage("metadata_write"):
                     self.save_metadata_json(metadata)
-                    self.add_video_format_info(video_info, metadata)
-                    
-                    frame_path = os.path.join(self.run_id, frame_id)
-                    self.save_image(image, frame_path, metadata)
-                    logger.info(f"Image saved: {metadata}")
-                    
-                    # Process detected objects
-                    self._process_detections(metadata, frame_path)
-                    
-                    self.frame_counter += 1
+                self.add_video_format_info(frame.video_info(), metadata)
+                
+                frame_path = os.path.join(self.run_id, self.stream_id, frame_id)
+                
+                # Process detected objects first to decide whether the frame is needed
+                with profiler.stage("detections"):
+                    pending, ready = self._process_detections(metadata, frame_path)
+                
+                # Map the buffer only for frames seen by an open track, and
+                # upload only frames that rank in some track's top-K
+                if pending:
+                    map_start = time.perf_counter()
+                    with frame.data() as image:
+                        profiler.record("map", time.perf_counter() - map_start)
+                        with profiler.stage("score"):
+                            persist = self._score_frame(image, pending, frame_path)
+                        if persist:
+                            self.save_image(image, frame_path, metadata)
+                            logger.debug(f"Image saved: {metadata}")
+                        else:
+                            profiler.count("frames_not_top_k")
+                else:
+                    profiler.count("frames_skipped")
+                
+                # Notify only after the frames the message references are stored
+                for tracked in ready:
+                    self._send_detection_notification_tracked(tracked)
+                
+                self.frame_counter += 1
+            profiler.record("frame", time.perf_counter() - frame_start)
+            profiler.maybe_export()
             
         except Exception as e:
             logger.error(f"Error processing frame {self.frame_counter}: {e}")
@@ -253,110 +324,138 @@ class Publisher:
     def _process_detections(self, metadata, frame_path):
         """
         Process object detections using tracking IDs and time-based threshold.
-        Falls back to frame-count threshold when tracking IDs are not available.
+        Detections without a gvatrack ID get a stable ID from the built-in
+        IoUTracker first, so dedup and dwell time are always time-based.
         
         Args:
             metadata (dict): Frame metadata containing detected objects
-            frame_path (str): Path to saved frame image
+            frame_path (str): Path the frame image will be stored under
+        
+        Returns:
+            tuple: (pending, ready) where pending lists (TrackedObject, bounding_box)
+            for unpublished tracks seen in this frame, and ready lists the
+            TrackedObjects that crossed the threshold and should be notified
         """
+        pending = []
+        ready = []
         try:
             if not metadata or len(metadata.get("objects", [])) == 0:
-                return
+                return pending, ready
             
             current_time_ms = time.time() * 1000
             
+            detections = []
             for obj in metadata.get("objects", []):
-                detection = obj.get("detection", {})
-                label = detection.get("label")
-                tracking_id = obj.get("id")  # unique tracking ID from gvatrack
-                
-                if not label:
+                label = obj.get("detection", {}).get("label")
+                if not label or label == "person":
                     continue
+                detections.append((label, obj.get("id"), obj))  # id: unique tracking ID from gvatrack
+            
+            self._assign_fallback_ids(detections, current_time_ms)
+            
+            for label, tracking_id, obj in detections:
+                if tracking_id not in self._tracked_objects:
+                    self._tracked_objects[tracking_id] = TrackedObject(
+                        label=label,
+                        tracking_id=tracking_id,
+                        first_seen=current_time_ms,
+                        last_seen=current_time_ms,
+                        scorer=TrackScorer() if FRAME_SCORE_TOP_K > 0 else None,
+                    )
                 
-                if label == "person":
-                    self.person += 1
-                    if self.person > 5:
-                        self.sent_items.append(label)
+                tracked = self._tracked_objects[tracking_id]
+                tracked.last_seen = current_time_ms
+                if tracked.published:
                     continue
-                
-                # Primary path: time-based tracking with unique IDs (when gvatrack is active)
-                if tracking_id is not None:
-                    if tracking_id not in self._tracked_objects:
-                        self._tracked_objects[tracking_id] = TrackedObject(
-                            label=label,
-                            tracking_id=tracking_id,
-                            first_seen=current_time_ms,
-                            last_seen=current_time_ms,
-                        )
-                    
-                    tracked = self._tracked_objects[tracking_id]
-                    tracked.last_seen = current_time_ms
+                if tracked.scorer is None:
                     tracked.frames.append(frame_path)
-                    
-                    duration_ms = tracked.last_seen - tracked.first_seen
-                    if duration_ms >= self._threshold_ms and not tracked.published:
-                        tracked.published = True
-                        logger.info(
-                            f"Tracking ID {tracking_id} ({label}) visible for "
-                            f"{duration_ms:.0f}ms >= {self._threshold_ms}ms, sending notification"
-                        )
-                        self._send_detection_notification_tracked(tracked)
-                else:
-                    # Fallback: frame-count threshold when no tracking ID
-                    logger.info(f"Items extracted from label: {self.item_frameid_mapper}")
-                    self.item_frameid_mapper[label].append(frame_path)
-                    
-                    if len(self.item_frameid_mapper[label]) >= THRESHOLD:
-                        if len(self.sent_items) == 0 or label != self.sent_items[-1]:
-                            logger.info(f"Sending Data: {self.item_frameid_mapper}")
-                            self._send_detection_notification(label)
-                            self.sent_items.append(label)
-                            self.person = 0
-                            del self.item_frameid_mapper[label]
-                        else:
-                            logger.info(f"Data already sent for {label}, skipping.")
-                            del self.item_frameid_mapper[label]
+                pending.append((tracked, obj.get("detection", {}).get("bounding_box", {})))
+                
+                duration_ms = tracked.last_seen - tracked.first_seen
+                if duration_ms >= self._threshold_ms:
+                    tracked.published = True
+                    logger.info(
+                        f"Tracking ID {tracking_id} ({label}) visible for "
+                        f"{duration_ms:.0f}ms >= {self._threshold_ms}ms, sending notification"
+                    )
+                    ready.append(tracked)
+            return pending, ready
         except Exception as e:
             logger.error(f"Error processing detections: {e}")
             logger.error(traceback.format_exc())
             sys.exit(1)
     
+    def _score_frame(self, image, pending, frame_path):
+        """
+        Offer this frame to the scorer of every pending track.
+        
+        Args:
+            image (np.ndarray): Mapped frame
+            pending (list): (TrackedObject, bounding_box) pairs
+            frame_path (str): Path the frame would be stored under
+        
+        Returns:
+            bool: True if any track keeps the frame, i.e. it must be stored
+        """
+        persist = False
+        for tracked, bbox in pending:
+            if tracked.scorer is None:
+                persist = True
+            elif tracked.scorer.offer(frame_path, crop_gray(image, bbox), bbox):
+                persist = True
+        return persist
+    
+    def _assign_fallback_ids(self, detections, current_time_ms):
+        """
+        Fill in tracking IDs for detections gvatrack did not track, in place.
+        
+        Args:
+            detections (list): (label, tracking_id, obj) tuples; tracking_id may be None
+            current_time_ms (float): Frame time in milliseconds
+        """
+        untracked = [i for i, (_, tracking_id, _) in enumerate(detections) if tracking_id is None]
+        if not untracked:
+            return
+        labels = []
+        boxes = []
+        for i in untracked:
+            label, _, obj = detections[i]
+            bbox = obj.get("detection", {}).get("bounding_box", {})
+            labels.append(label)
+            boxes.append((bbox.get("x_min", 0.0), bbox.get("y_min", 0.0),
+                          bbox.get("x_max", 0.0), bbox.get("y_max", 0.0)))
+        ids = self._fallback_tracker.update(labels, boxes, current_time_ms)
+        for i, tracking_id in zip(untracked, ids):
+            label, _, obj = detections[i]
+            detections[i] = (label, tracking_id, obj)
+        logger.debug(f"Fallback tracker assigned IDs {ids} to {labels}")
+    
     def _send_detection_notification_tracked(self, tracked):
         """Send RabbitMQ notification for a tracked object (time-based path)."""
         try:
-            message = {
-                "data": {
-                    "item_name": tracked.label,
-                    "tracking_id": tracked.tracking_id,
-                    "frames": tracked.frames,
-                    "bucket": BUCKET_NAME
-                },
-                "msg_type": "FRAME_DATA",
-                "status": "PROCESSING",
-                "timestamp": datetime.now().isoformat()
+            data = {
+                "item_name": tracked.label,
+                "tracking_id": tracked.tracking_id,
+                "stream_id": self.stream_id,
+                "run_id": self.run_id,
+                "frames": tracked.frames,
+                "bucket": BUCKET_NAME
             }
-            self.send_message(message)
-        except Exception as e:
-            logger.error(f"Error sending tracked detection notification: {e}")
-            logger.error(traceback.format_exc())
-            sys.exit(1)
-    
-    def _send_detection_notification(self, label):
-        """Send RabbitMQ notification for detected item."""
-        try:
+            if tracked.scorer is not None:
+                best_frame, best_score = tracked.scorer.best()
+                data["frames"] = tracked.scorer.frames()
+                data["best_frame"] = best_frame
+                data["best_frame_score"] = best_score
+                data["best_frame_bbox"] = tracked.scorer.best_bbox()
             message = {
-                "data": {
-                    "item_name": label,
-                    "frames": self.item_frameid_mapper[label],
-                    "bucket": BUCKET_NAME
-                },
+                "data": data,
                 "msg_type": "FRAME_DATA",
                 "status": "PROCESSING",
                 "timestamp": datetime.now().isoformat()
             }
             self.send_message(message)
         except Exception as e:
-            logger.error(f"Error sending detection notification: {e}")
+            logger.error(f"Error sending tracked detection notification: {e}")
             logger.error(traceback.format_exc())
             sys.exit(1)
     
@@ -391,7 +490,7 @@ class Publisher:
             json.dump(metadata, self.file_handle)
             self.file_handle.write('\n')
             self.file_handle.flush()
-            logger.info(f"Metadata saved to: {self.jsonl_file}")
+            logger.debug(f"Metadata saved to: {self.jsonl_file}")
         except Exception as e:
             logger.error(f"Error saving JSON for frame {self.frame_counter}: {e}")
             logger.error(traceback.format_exc())
@@ -434,12 +533,11 @@ class Publisher:
             metadata (dict): Image metadata containing format info
         """
         try:
-            # Convert BGR to RGB if needed
-            if metadata.get("img_format") in ["BGR", "BGRx", "BGRA"]:
-                image_array = image_array[:, :, 2::-1]
+            with self.profiler.stage("convert"):
+                image = to_pil_image(image_array, metadata.get("img_format"))
             
             # Save to MinIO
-            self._save_to_minio(image_array, image_filename)
+            self._save_to_minio(image, image_filename)
             
             # Save to local filesystem
             #save_to_local(image_array)
@@ -449,19 +547,22 @@ class Publisher:
             logger.error(traceback.format_exc())
             sys.exit(1)
     
-    def _save_to_minio(self, image_array, image_filename):
-        """Save image to MinIO object storage."""
+    def _save_to_minio(self, image, image_filename):
+        """Save PIL image to MinIO object storage."""
         try:
-            image = Image.fromarray(image_array)
-            image_buffer = BytesIO()
-            image.save(image_buffer, format="JPEG", quality=85)
-            image_buffer.seek(0)
+            with self.profiler.stage("encode"):
+                image_buffer = BytesIO()
+                image.save(image_buffer, format="JPEG", quality=85)
+                image_buffer.seek(0)
+            upload_start = time.perf_counter()
             if self.minio_client is None:
                 logger.error("MinIO client is not initialized. Initialize MinIO client again to save images.")
                 self.minio_client = get_minio_client()
-            if not self.minio_client.bucket_exists(BUCKET_NAME):
-                self.minio_client.make_bucket(BUCKET_NAME)
-                logger.info(f"Minio Bucket '{BUCKET_NAME}' created ✅")
+            if BUCKET_NAME not in _READY_BUCKETS:
+                if not self.minio_client.bucket_exists(BUCKET_NAME):
+                    self.minio_client.make_bucket(BUCKET_NAME)
+                    logger.info(f"Minio Bucket '{BUCKET_NAME}' created ✅")
+                _READY_BUCKETS.add(BUCKET_NAME)
             
             self.minio_client.put_object(
                 BUCKET_NAME,
@@ -470,7 +571,11 @@ class Publisher:
                 length=image_buffer.getbuffer().nbytes,
                 content_type="image/jpeg"
             )
+            self.profiler.record("upload", time.perf_counter() - upload_start)
+            self.profiler.count("frames_saved")
+            self.profiler.count("bytes_uploaded", image_buffer.getbuffer().nbytes)
         except Exception as e:
+            _READY_BUCKETS.discard(BUCKET_NAME)
             logger.error(f"Error saving to MinIO: {e}")
             logger.error(traceback.format_exc())
             sys.exit(1)
@@ -492,51 +597,20 @@ class Publisher:
     
     def send_message(self, text):
         """
-        Send message to RabbitMQ queue.
+        Queue message for the background RabbitMQ publisher.
+        
+        Publishing, confirms, reconnects and spooling happen on the publisher's
+        I/O thread, so this never blocks on the broker.
         
         Args:
             text (dict): Message payload
         """
         try:
-            self.channel.basic_publish(
-                exchange='',
-                routing_key='object_detection',
-                body=json.dumps(text),
-                properties=pika.BasicProperties(delivery_mode=2)
-            )
-            logger.info(f"Sent: {text}")
+            self.amqp_publisher.publish(text)
+            logger.info(f"Queued: {text}")
         except Exception as e:
-            logger.error(f"Error sending message to RabbitMQ: {e}")
+            logger.error(f"Error queueing message for RabbitMQ: {e}")
             logger.error(traceback.format_exc())
-            sys.exit(1)
-    
-    def get_rabbitmq_connection(self):
-        """
-        Establish RabbitMQ connection with retry logic.
-        """
-        RABBITMQ_USERNAME = os.environ.get("RABBITMQ_USER")
-        RABBITMQ_PASSWORD = os.environ.get("RABBITMQ_PASSWORD")
-        rabbit_host = os.getenv("RABBITMQ_HOST", "rabbitmq")
-        MAX_RETRIES = 30
-        retry = 0
-        while retry < MAX_RETRIES:
-            try:
-                credentials = pika.PlainCredentials(RABBITMQ_USERNAME, RABBITMQ_PASSWORD)
-                connection = pika.BlockingConnection(
-                    pika.ConnectionParameters(
-                        host=rabbit_host,
-                        port=5672,
-                        credentials=credentials
-                    )
-                )
-                return connection
-            except Exception as e:
-                logger.error(f"Error establishing RabbitMQ connection: {e}")
-                logger.error(traceback.format_exc())
-                time.sleep(2)
-                retry += 1
-        logger.error("Max retries reached. Could not connect to RabbitMQ.")
-        sys.exit(1)
     
     # ------------------------------------------------------------------------
     # CLEANUP AND UTILITIES
@@ -570,8 +644,12 @@ class Publisher:
             sys.exit(1)
     
     def close(self):
-        """Close file handle."""
+        """Flush pending RabbitMQ events and close file handle."""
         try:
+            if getattr(self, 'amqp_publisher', None) is not None:
+                self.amqp_publisher.close()
+            if getattr(self, 'profiler', None) is not None:
+                self.profiler.export()
             if hasattr(self, 'file_handle') and self.file_handle and not self.file_handle.closed:
                 self.file_handle.close()
                 logger.info("Publisher file handle closed")
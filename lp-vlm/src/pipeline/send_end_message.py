@@ -3,6 +3,7 @@ import json
 import os
 from datetime import datetime
 from config import LP_IP
+from amqp_publisher import DiskSpool, publish_batch, declare_topology, routing_key_for, CONTROL_STREAM_ID, EXCHANGE_NAME
 import sys
 
 rabbit_user = os.environ.get("RABBITMQ_USER")
@@ -17,16 +18,25 @@ try:
         pika.ConnectionParameters(host=rabbit_host, port=rabbit_port, credentials=credentials)
     )
     channel = connection.channel()
+    declare_topology(channel, rabbit_queue)
+    channel.confirm_delivery()
+
+    # Deliver events the Publisher spooled during a broker outage before ending the stream
+    replayed = DiskSpool().replay(lambda messages, routing_key: publish_batch(channel, messages, routing_key))
+    if replayed:
+        print(f"📦 Replayed {replayed} spooled event(s)")
 
     end_message = {
         "msg_type": "STREAM_END",
         "status": "COMPLETED",
         "timestamp": datetime.now().isoformat(),
+        # Exported by vlm_od_pipeline.sh and stamped on every detection of the run
+        "run_id": os.environ.get("RUN_ID", ""),
         "data": {}
     }
     channel.basic_publish(
-        exchange="",
-        routing_key=rabbit_queue,
+        exchange=EXCHANGE_NAME,
+        routing_key=routing_key_for(CONTROL_STREAM_ID),
         body=json.dumps(end_message)
     )
 
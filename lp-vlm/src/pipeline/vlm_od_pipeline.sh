@@ -84,28 +84,57 @@ else
   echo "⚠️  No ROI specified, processing full frame"
 fi
 
-# Determine source: use local file if fileSrc was provided, otherwise stream via URI
-if [ -n "$ORIGINAL_VIDEO_NAME" ] && [ -f "$INPUT_DIR/$ORIGINAL_VIDEO_NAME" ]; then
-  SOURCE_ELEMENT="filesrc location=$INPUT_DIR/$ORIGINAL_VIDEO_NAME"
-  echo "Using local file: $INPUT_DIR/$ORIGINAL_VIDEO_NAME"
-else
-  SOURCE_ELEMENT="urisourcebin uri=$STREAM_URI"
-  echo "Using stream URI: $STREAM_URI"
+# One detection branch + Publisher per lp_vlm camera. All branches share the
+# detection model through the same model-instance-id; messages are tagged with
+# the stream id so the consumer can demultiplex them.
+STREAMS="$(python3 /home/pipeline-server/lp-vlm/workload_utils.py \
+  --camera-config "/home/pipeline-server/lp-vlm/configs/${CAMERA_STREAM}" \
+  --get-streams)"
+
+if [ -z "$STREAMS" ]; then
+  echo "❌ Error: No lp_vlm streams found in camera config"
+  exit 1
 fi
 
-time gst-launch-1.0 --verbose \
-  $SOURCE_ELEMENT ! \
-  decodebin3 ! videoconvert ! videorate ! \
-  video/x-raw,format=BGR,framerate=13/1 ! \
-  gvadetect model-instance-id=detect1_1 name=lp-vlm batch-size=1 \
-    model=$MODEL_FULL_PATH \
-    device=$DEVICE threshold=0.4 pre-process-backend=opencv \
-    ie-config=CPU_THROUGHPUT_STREAMS=2 nireq=2 \
-    pre-process-config=resize_type=standard ! \
-  queue ! gvatrack tracking-type=zero-term-imageless ! \
-  queue ! gvametaconvert format=json ! queue ! \
-  gvapython class=Publisher function=process module=/home/pipeline-server/lp-vlm/gvapython/publish.py name=publish ! \
-  gvawatermark ! queue ! fakesink sync=false async=false
+# Shared run id for every Publisher in this pipeline
+export RUN_ID="${RUN_ID:-$(date +%s)-$RANDOM}"
+echo "🆔 Run id: $RUN_ID"
+
+PIPELINE_ARGS=()
+CLEAN_OUTPUT=true
+while IFS='|' read -r STREAM_ID VIDEO_NAME BRANCH_URI BRANCH_ROI; do
+  [ -z "$STREAM_ID" ] && continue
+
+  # Determine source: use local file if fileSrc was provided, otherwise stream via URI
+  if [ -n "$VIDEO_NAME" ] && [ -f "$INPUT_DIR/$VIDEO_NAME" ]; then
+    SOURCE_ELEMENT=(filesrc "location=$INPUT_DIR/$VIDEO_NAME")
+    echo "[$STREAM_ID] Using local file: $INPUT_DIR/$VIDEO_NAME"
+  else
+    SOURCE_ELEMENT=(urisourcebin "uri=$BRANCH_URI")
+    echo "[$STREAM_ID] Using stream URI: $BRANCH_URI"
+  fi
+  echo "[$STREAM_ID] ROI from config: $BRANCH_ROI"
+
+  PIPELINE_ARGS+=(
+    "${SOURCE_ELEMENT[@]}" !
+    decodebin3 ! videoconvert ! videorate !
+    video/x-raw,format=BGR,framerate=13/1 !
+    gvadetect model-instance-id=detect1_1 "name=lp-vlm-$STREAM_ID" batch-size=1
+      "model=$MODEL_FULL_PATH"
+      "device=$DEVICE" threshold=0.4 pre-process-backend=opencv
+      ie-config=CPU_THROUGHPUT_STREAMS=2 nireq=2
+      pre-process-config=resize_type=standard !
+    queue ! gvatrack tracking-type=zero-term-imageless !
+    queue ! gvametaconvert format=json ! queue !
+    gvapython class=Publisher function=process module=/home/pipeline-server/lp-vlm/gvapython/publish.py "name=publish-$STREAM_ID"
+      "kwarg={\"stream_id\":\"$STREAM_ID\",\"clean_output\":$CLEAN_OUTPUT}" !
+    gvawatermark ! queue ! fakesink sync=false async=false
+  )
+  # Only the first Publisher cleans the shared output directory
+  CLEAN_OUTPUT=false
+done <<< "$STREAMS"
+
+time gst-launch-1.0 --verbose "${PIPELINE_ARGS[@]}"
 
 # --- Capture exit code ---
 EXIT_CODE=$?
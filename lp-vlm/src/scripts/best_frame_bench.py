@@ -0,0 +1,107 @@
+"""
+Benchmark best-frame selection on a synthetic track.
+
+Generates JPEG frames of a product moving across the counter (with motion
+blur on the fast frames), serves them from memory with an optional simulated
+MinIO latency, and times the legacy sequential implementation against
+get_best_frame with each metric.
+
+Usage (from lp-vlm/src):
+    python scripts/best_frame_bench.py --frames 300 --fetch-latency-ms 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.frames_processor import compute_optical_flow_mag_fast, get_best_frame  # noqa: E402
+from skimage.metrics import structural_similarity as ssim  # noqa: E402
+
+
+def make_track(num_frames, width, height, seed=0):
+    """Encode a synthetic track; the object pauses (sharp) in the middle third."""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(60, 120, (height, width, 3), dtype=np.uint8)
+    frames = {}
+    for i in range(num_frames):
+        img = background.copy()
+        t = i / max(1, num_frames - 1)
+        paused = 1 / 3 <= t <= 2 / 3
+        x = int(width * (0.5 if paused else t * 0.8 + 0.1))
+        cv2.rectangle(img, (x - 80, height // 2 - 60), (x + 80, height // 2 + 60), (30, 40, 200), -1)
+        cv2.putText(img, "SODA 1L", (x - 70, height // 2 + 10), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (255, 255, 255), 3)
+        if not paused:
+            kernel = np.zeros((1, 25), np.float32)
+            kernel[0, :] = 1 / 25
+            img = cv2.filter2D(img, -1, kernel)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        frames[f"run/default/{i}.jpg"] = buf.tobytes()
+    return frames
+
+
+def make_fetch(frames, latency_s):
+    def fetch(key, bucket_name=""):
+        if latency_s:
+            time.sleep(latency_s)
+        return frames[key]
+    return fetch
+
+
+def legacy_best_frame(frames_list, fetch, alpha=0.5, resize_factor=0.2):
+    """Sequential fetch, full-resolution decode, Farneback + SSIM (pre-change implementation)."""
+    prev_gray = None
+    best_frame, best_score = None, -1
+    for f in frames_list:
+        img = cv2.imdecode(np.frombuffer(fetch(f), np.uint8), cv2.IMREAD_COLOR)
+        small = cv2.resize(img, None, fx=resize_factor, fy=resize_factor, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if prev_gray is not None:
+            motion_score = 1 / (1 + compute_optical_flow_mag_fast(prev_gray, gray))
+            score = alpha * ssim(prev_gray, gray) + (1 - alpha) * motion_score
+            if score > best_score:
+                best_frame, best_score = f, score
+        prev_gray = gray
+    return best_frame, best_score
+
+
+def run(name, fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    best, score = result
+    print(f"{name:<34} {np.median(timings) * 1000:9.1f} ms   best={os.path.basename(best or '-'):<10} score={score:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--fetch-latency-ms", type=float, default=5.0, help="Simulated MinIO GET latency")
+    parser.add_argument("--max-frames", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    frames = make_track(args.frames, args.width, args.height)
+    keys = list(frames)
+    fetch = make_fetch(frames, args.fetch_latency_ms / 1000.0)
+    print(f"{args.frames} frames {args.width}x{args.height}, {args.fetch_latency_ms} ms fetch latency, "
+          f"paused (sharp) frames {args.frames // 3}-{2 * args.frames // 3}\n")
+
+    run("legacy (sequential, full decode)", lambda: legacy_best_frame(keys, fetch), args.repeat)
+    run("flow_ssim, all frames", lambda: get_best_frame(keys, metric="flow_ssim", max_frames=0, fetch_fn=fetch), args.repeat)
+    run(f"flow_ssim, max {args.max_frames}", lambda: get_best_frame(keys, metric="flow_ssim", max_frames=args.max_frames, fetch_fn=fetch), args.repeat)
+    run("sharpness, all frames", lambda: get_best_frame(keys, metric="sharpness", max_frames=0, fetch_fn=fetch), args.repeat)
+    run(f"sharpness, max {args.max_frames}", lambda: get_best_frame(keys, metric="sharpness", max_frames=args.max_frames, fetch_fn=fetch), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
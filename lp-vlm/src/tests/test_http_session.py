@@ -0,0 +1,58 @@
+"""POST retries: resend over a dropped keep-alive connection, never after a read timeout."""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from utils.http_session import build_session
+
+
+class Handler(BaseHTTPRequestHandler):
+    hits = 0
+    mode = "ok"
+
+    def do_POST(self):
+        type(self).hits += 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.mode == "drop" and self.hits == 1:
+            # Close without a status line, as a server does with an idle keep-alive connection
+            self.close_connection = True
+            return
+        if self.mode == "slow":
+            time.sleep(0.5)
+        body = b'{"ok": true}'
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.hits = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/v3/chat/completions"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_post_retried_when_connection_dropped_before_response(server):
+    Handler.mode = "drop"
+    response = build_session(retries=2, backoff_factor=0).post(server, json={"prompt": "x"}, timeout=5)
+    assert response.status_code == 200
+    assert Handler.hits == 2
+
+
+def test_post_not_retried_after_read_timeout(server):
+    Handler.mode = "slow"
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        build_session(retries=2, backoff_factor=0).post(server, json={"prompt": "x"}, timeout=0.1)
+    time.sleep(0.6)
+    assert Handler.hits == 1
@@ -0,0 +1,60 @@
+"""InventoryIndex.match must not confirm partial or different item names."""
+import json
+import os
+import random
+
+import pytest
+
+from utils.inventory_index import MAX_SCORED, InventoryIndex, load_label_synonyms, normalize
+
+# The inventory and synonym map shipped with the consumer
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "..", "config")
+
+
+@pytest.fixture(scope="module")
+def index():
+    with open(os.path.join(CONFIG_DIR, "inventory.json")) as f:
+        inventory = json.load(f)
+    synonyms = load_label_synonyms(os.path.join(CONFIG_DIR, "label_synonyms.json"))
+    return InventoryIndex(inventory, synonyms, threshold=0.85, margin=0.05)
+
+
+@pytest.mark.parametrize("query", [
+    "green",                  # subset of "Green Apple"
+    "yellow",
+    "peeled",
+    "green apple juice",      # superset: a different product
+    "Red Apples 2",
+    "Coca-Cola Bottle Larg",  # truncated size
+    "apple",                  # ambiguous
+])
+def test_partial_or_different_names_do_not_match(index, query):
+    assert index.match(query) is None
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Red Apple", "Red Apple"),
+    ("Green Apples", "Green Apple"),
+    ("coca cola bottle large", "Coca-Cola Bottle Large"),
+    ("yelow banana", "Yellow Bananas"),
+    ("Peeled Pomegranite", "Peeled Pomegranate"),
+])
+def test_full_names_with_typos_match(index, query, expected):
+    assert index.match(query) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("pomegranate seeds", "Peeled Pomegranate"),
+    ("banana", "Yellow Bananas"),
+])
+def test_detector_labels_match_through_shipped_synonyms(index, query, expected):
+    assert index.match(query) == expected
+
+
+def test_frequent_tokens_do_not_fan_out():
+    rng = random.Random(1)
+    names = {f"{rng.choice(['coca cola', 'pepsi', 'fanta'])} {rng.choice(['red', 'green'])} "
+             f"{rng.choice(['bottle', 'can'])} {rng.choice(['small', 'large'])} {n}" for n in range(5000)}
+    large = InventoryIndex(sorted(names))
+    for query in ("bottle", "coca cola bottle large", "gren can"):
+        assert len(large._retrieve(normalize(query))) <= MAX_SCORED
@@ -0,0 +1,51 @@
+"""The streaming pipeline must end even when batched agent validation fails."""
+import threading
+
+import pytest
+
+import main
+
+RECORD = {"item_name": "coke 2l", "run_id": "r1", "stream_id": "cam1"}
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    def od_results(video_file, use_case):
+        yield "📹 Object Detection: ✅ Completed", {"od_results": []}
+
+    def vlm_results():
+        yield "🤖 VLM Enhancement: ⚡ Running", [dict(RECORD)]
+        yield "🤖 VLM Enhancement: ✅ Completed", [dict(RECORD)]
+
+    monkeypatch.setattr(main, "process_object_detection_results", od_results)
+    monkeypatch.setattr(main, "process_vlm_enhancement", vlm_results)
+    monkeypatch.setattr(main, "write_json_to_file", lambda *args, **kwargs: None)
+    monkeypatch.setattr(main, "VLM_BATCH_MODE", True)
+
+
+def run_pipeline(timeout=10):
+    """Drain execute_loss_prevention_pipeline on a thread; the last update, or None if it hung."""
+    updates = []
+    thread = threading.Thread(target=lambda: updates.extend(main.execute_loss_prevention_pipeline("lane.mp4")),
+                              daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return None if thread.is_alive() else updates[-1]
+
+
+def test_pipeline_ends_when_agent_call_batch_raises(stages, monkeypatch):
+    def failing_batch(records):
+        raise RuntimeError("inventory index unavailable")
+
+    monkeypatch.setattr(main, "agent_call_batch", failing_batch)
+    last = run_pipeline()
+    assert last is not None, "pipeline hung waiting for agent results"
+    assert last[4] == "🤖 Agent: ✅ Completed"
+    assert last[5] == []
+
+
+def test_pipeline_ends_when_agent_call_batch_drops_outcomes(stages, monkeypatch):
+    monkeypatch.setattr(main, "agent_call_batch", lambda records: [])
+    last = run_pipeline()
+    assert last is not None, "pipeline hung waiting for agent results"
+    assert last[4] == "🤖 Agent: ✅ Completed"
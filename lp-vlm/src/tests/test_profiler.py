@@ -0,0 +1,38 @@
+"""Per-camera Publishers must not overwrite or interleave each other's profile exports."""
+import os
+import sys
+
+import pytest
+
+# The gvapython stage imports its siblings flat, as DL Streamer loads them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pipeline"))
+
+from profiler import StageProfiler, stream_profile_path  # noqa: E402
+
+
+def test_stream_profile_path():
+    assert stream_profile_path("/m/publisher_profile.prom", "cam1") == "/m/publisher_profile.cam1.prom"
+    assert stream_profile_path("/m/publisher_profile.jsonl", "cam2") == "/m/publisher_profile.cam2.jsonl"
+    assert stream_profile_path("/m/publisher_profile.prom", None) == "/m/publisher_profile.prom"
+
+
+@pytest.mark.parametrize("name", ["profile.prom", "profile.jsonl"])
+def test_streams_write_separate_files(tmp_path, name):
+    path = str(tmp_path / name)
+    profilers = {
+        stream_id: StageProfiler(enabled=True, path=path, labels={"stream_id": stream_id}, stream_id=stream_id)
+        for stream_id in ("cam1", "cam2")
+    }
+    for stream_id, profiler in profilers.items():
+        profiler.record("encode", 0.01)
+        profiler.count(f"frames_{stream_id}")
+        profiler.export()
+
+    for stream_id, profiler in profilers.items():
+        with open(profiler.path) as f:
+            content = f.read()
+        assert 'stream_id' in content and stream_id in content
+        other = "cam2" if stream_id == "cam1" else "cam1"
+        assert other not in content
+    # No temp files left behind
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p.path) for p in profilers.values())
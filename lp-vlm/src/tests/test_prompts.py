@@ -0,0 +1,20 @@
+"""A batched request must carry one output contract: the index-keyed array."""
+from utils.prompts import (BATCH_TEMPLATE, COMMON_PROMPT, INVENTORY_TEMPLATE, ITEMS_TEMPLATE,
+                           generate_batch_prompt, generate_inventory_prompt)
+
+
+def test_batch_prompt_drops_single_image_output_format():
+    inventory_prompt = generate_inventory_prompt("apple", [], candidates=["Red Apple", "Green Apple"])
+    prompt = generate_batch_prompt([COMMON_PROMPT, inventory_prompt, COMMON_PROMPT])
+
+    assert prompt.startswith(BATCH_TEMPLATE.prefix)
+    body = prompt[len(BATCH_TEMPLATE.prefix):]
+    assert ITEMS_TEMPLATE.output not in body
+    assert INVENTORY_TEMPLATE.output not in body
+    assert "Images 0, 2:" in body
+    assert "Images 1:" in body and "Items: Red Apple, Green Apple" in body
+
+
+def test_single_image_prompts_keep_output_format():
+    assert COMMON_PROMPT.endswith(ITEMS_TEMPLATE.output)
+    assert INVENTORY_TEMPLATE.output in generate_inventory_prompt("apple", [], candidates=["Red Apple"])
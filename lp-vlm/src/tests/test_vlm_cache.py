@@ -0,0 +1,50 @@
+"""VLM result cache keys must separate different items on the same checkout background."""
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from utils.vlm_cache import VLMResultCache, hamming, image_phash
+
+PROMPT = "Identify the item."
+# The detected item: a small region of a 640x360 frame
+BBOX = {"x_min": 0.45, "y_min": 0.4, "x_max": 0.55, "y_max": 0.6}
+
+
+def checkout_frame(item_pattern):
+    """A static textured background with a small item drawn inside BBOX."""
+    rng = np.random.default_rng(0)
+    frame = (rng.random((360, 640)) * 60 + 100).astype("uint8")
+    item = np.zeros((72, 64), dtype="uint8")
+    if item_pattern == "vertical":
+        item[:, ::8] = 255
+    else:
+        item[::8, :] = 255
+    frame[144:216, 288:352] = item
+    buffer = BytesIO()
+    Image.fromarray(frame).convert("RGB").save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def cache():
+    return VLMResultCache(max_entries=16, ttl_sec=60, max_hamming=2, db_path=None)
+
+
+def test_frames_differing_only_in_item_region_miss(cache):
+    first, second = checkout_frame("vertical"), checkout_frame("horizontal")
+    cache.put(PROMPT, image_phash(first, BBOX), [{"item_name": "Red Apple"}])
+    assert cache.get(PROMPT, image_phash(second, BBOX)) is None
+
+
+def test_whole_frame_hash_cannot_tell_them_apart():
+    # Why the key is computed on the crop: the full-frame hashes are (nearly) equal
+    first, second = checkout_frame("vertical"), checkout_frame("horizontal")
+    assert hamming(image_phash(first), image_phash(second)) <= 2
+
+
+def test_same_item_hits(cache):
+    frame = checkout_frame("vertical")
+    cache.put(PROMPT, image_phash(frame, BBOX), [{"item_name": "Red Apple"}])
+    assert cache.get(PROMPT, image_phash(checkout_frame("vertical"), BBOX)) == [{"item_name": "Red Apple"}]
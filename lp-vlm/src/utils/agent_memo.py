@@ -0,0 +1,220 @@
+"""Memoized decision-agent validations keyed by normalized item name and prompt version."""
+import copy
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Optional, Tuple
+
+from utils.config import (logger,
+                          AGENT_MEMO_ENABLED,
+                          AGENT_MEMO_MAX_ENTRIES,
+                          AGENT_MEMO_TTL_SEC,
+                          AGENT_MEMO_DB,
+                          )
+from utils.inventory_index import normalize
+from utils.prompts import AGENT_TEMPLATE
+from vlm_metrics_logger import get_logger
+
+# Editing the agent template changes its id and so invalidates every memoized answer
+AGENT_PROMPT_VERSION = AGENT_TEMPLATE.id
+
+_DIGIT_UNIT = re.compile(r"(\d)([a-z])")
+
+
+def memo_key(item_name: str) -> str:
+    """Spelling-insensitive key: "Coca-Cola Bottles 500ml" -> "coca cola bottle 500 ml"."""
+    return " ".join(normalize(_DIGIT_UNIT.sub(r"\1 \2", (item_name or "").lower())))
+
+
+class AgentDecisionMemo:
+    """
+    LRU + TTL memo of agent results with optional SQLite persistence.
+
+    call() answers from the memo, joins an identical request already in
+    flight, or runs it and stores a successful result. Entries carry the
+    prompt version they were produced with; other versions never match.
+    """
+
+    def __init__(self, max_entries=AGENT_MEMO_MAX_ENTRIES, ttl_sec=AGENT_MEMO_TTL_SEC,
+                 db_path=AGENT_MEMO_DB, version=AGENT_PROMPT_VERSION):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.version = version
+        self._entries = OrderedDict()  # key -> (created_at, result)
+        self._in_flight = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS agent_memo ("
+                    " item_key TEXT, prompt_version TEXT, result TEXT,"
+                    " created_at REAL, last_access REAL,"
+                    " PRIMARY KEY (item_key, prompt_version))"
+                )
+                self._db.execute("DELETE FROM agent_memo WHERE created_at < ? OR prompt_version != ?",
+                                 (time.time() - ttl_sec, version))
+                self._db.commit()
+                logger.info(f"Agent memo persisted at {db_path}")
+            except Exception as e:
+                logger.error(f"Agent memo - could not open {db_path}, using memory only: {e}")
+                self._db = None
+
+    def get(self, item_name: str) -> Optional[Any]:
+        """Memoized result for an item name (a private copy), or None."""
+        key = memo_key(item_name)
+        now = time.time()
+        with self._lock:
+            result = self._get(key, now)
+            if result is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self._log("hit" if result is not None else "miss")
+        # Callers annotate results (stream_id, run_id); never hand out the memoized object
+        return copy.deepcopy(result)
+
+    def put(self, item_name: str, result: Any):
+        """Memoize a successful agent result; empty results are never memoized."""
+        if not result:
+            return
+        key = memo_key(item_name)
+        now = time.time()
+        with self._lock:
+            self._store(key, result, now)
+            if self._db is not None:
+                try:
+                    self._db.execute("INSERT OR REPLACE INTO agent_memo VALUES (?, ?, ?, ?, ?)",
+                                     (key, self.version, json.dumps(result), now, now))
+                    self._db.execute(
+                        "DELETE FROM agent_memo WHERE rowid NOT IN ("
+                        " SELECT rowid FROM agent_memo ORDER BY last_access DESC LIMIT ?)",
+                        (self.max_entries,),
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    logger.error(f"Agent memo - SQLite write failed: {e}")
+
+    def call(self, item_name: str, fn: Callable[[], Tuple[bool, Any, str]]) -> Tuple[bool, Any, str]:
+        """
+        Memoized fn() for an item name; fn returns (valid, result, err_msg) like call_vlm.
+
+        Concurrent calls for the same key share one fn() call. Only valid,
+        non-empty list results are memoized.
+        """
+        key = memo_key(item_name)
+        now = time.time()
+        with self._lock:
+            result = self._get(key, now)
+            if result is not None:
+                self.hits += 1
+                outcome = "hit"
+            else:
+                future = self._in_flight.get(key)
+                owner = future is None
+                if owner:
+                    future = self._in_flight[key] = Future()
+                    self.misses += 1
+                    outcome = "miss"
+                else:
+                    self.coalesced += 1
+                    outcome = "coalesced"
+        self._log(outcome)
+        if outcome == "hit":
+            return True, copy.deepcopy(result), ""
+        if not owner:
+            return copy.deepcopy(future.result())
+
+        try:
+            valid, result, err_msg = fn()
+            if valid and not err_msg and isinstance(result, list) and result:
+                self.put(item_name, result)
+            future.set_result((valid, result, err_msg))
+            return valid, copy.deepcopy(result), err_msg
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": ((self.hits + self.coalesced) / total) if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def _get(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now - entry[0] <= self.ttl_sec:
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+        result = self._db_get(key, now)
+        if result is not None:
+            self._store(key, result, now)
+        return result
+
+    def _store(self, key, result, now):
+        self._entries[key] = (now, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _db_get(self, key, now):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT result FROM agent_memo WHERE item_key = ? AND prompt_version = ? AND created_at >= ?",
+                (key, self.version, now - self.ttl_sec),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE agent_memo SET last_access = ? WHERE item_key = ? AND prompt_version = ?",
+                             (now, key, self.version))
+            self._db.commit()
+            return json.loads(row[0])
+        except Exception as e:
+            logger.error(f"Agent memo - SQLite read failed: {e}")
+            return None
+
+    def _log(self, outcome):
+        stats = self.stats()
+        get_logger().log_custom_event(
+            f"agent_memo_{outcome}",
+            "USECASE_2",
+            f"agent_memo_{int(time.time() * 1000)}",
+            hits=stats["hits"],
+            misses=stats["misses"],
+            coalesced=stats["coalesced"],
+            hit_rate=stats["hit_rate"],
+        )
+
+
+_agent_memo = None
+_agent_memo_lock = threading.Lock()
+
+
+def get_agent_memo() -> Optional[AgentDecisionMemo]:
+    """Process-wide memo, or None when AGENT_MEMO_ENABLED=0."""
+    global _agent_memo
+    if not AGENT_MEMO_ENABLED:
+        return None
+    with _agent_memo_lock:
+        if _agent_memo is None:
+            _agent_memo = AgentDecisionMemo()
+    return _agent_memo
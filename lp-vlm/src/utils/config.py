@@ -1,6 +1,7 @@
 """Configuration settings for the grocery video app."""
 
 import os
+import socket
 import logging
 from datetime import datetime
 
@@ -12,6 +13,69 @@ MINIO_API_HOST_PORT = os.environ.get("MINIO_API_HOST_PORT", "4000")
 VLM_MODEL = os.environ.get("VLM_MODEL_NAME", "Qwen/Qwen2.5-VL-7B-Instruct")
 OVMS_ENDPOINT = os.environ.get("OVMS_ENDPOINT", "http://ovms-vlm:8000")
 OVMS_MODEL_NAME = os.environ.get("OVMS_MODEL_NAME", VLM_MODEL)
+# Stream tokens over SSE and stop as soon as a complete JSON array/object arrives
+VLM_STREAMING = os.environ.get("VLM_STREAMING", "1") == "1"
+# Send each prompt's JSON schema as response_format (constrained decoding); falls back if OVMS rejects it
+VLM_STRUCTURED_OUTPUT = os.environ.get("VLM_STRUCTURED_OUTPUT", "1") == "1"
+
+# ---------------- VLM concurrency -----------------
+# Worker threads issuing VLM calls, and the cap on requests outstanding at OVMS
+VLM_WORKERS = int(os.environ.get("VLM_WORKERS", "4"))
+VLM_MAX_IN_FLIGHT = int(os.environ.get("VLM_MAX_IN_FLIGHT", str(VLM_WORKERS)))
+# Batch mode: unmatched items collected for up to VLM_BATCH_WINDOW_MS (or until
+# STREAM_END) share one multi-image request
+VLM_BATCH_MODE = os.environ.get("VLM_BATCH_MODE", "0") == "1"
+VLM_BATCH_WINDOW_MS = int(os.environ.get("VLM_BATCH_WINDOW_MS", "500"))
+VLM_BATCH_MAX_ITEMS = int(os.environ.get("VLM_BATCH_MAX_ITEMS", "8"))
+# Enhancement requests still queued this long after detection are stale:
+# "downgrade" runs them after all audit work, "drop" skips them (0 = no deadline)
+VLM_ENHANCE_DEADLINE_SEC = float(os.environ.get("VLM_ENHANCE_DEADLINE_SEC", "30"))
+VLM_STALE_POLICY = os.environ.get("VLM_STALE_POLICY", "downgrade")
+
+# ---------------- Best-frame selection -----------------
+# "sharpness" (Laplacian + frame-diff energy) or "flow_ssim" (Farneback + SSIM)
+BEST_FRAME_METRIC = os.environ.get("BEST_FRAME_METRIC", "sharpness")
+# Long tracks are evenly subsampled to this many frames (0 = score every frame)
+BEST_FRAME_MAX_FRAMES = int(os.environ.get("BEST_FRAME_MAX_FRAMES", "32"))
+BEST_FRAME_FETCH_WORKERS = int(os.environ.get("BEST_FRAME_FETCH_WORKERS", "8"))
+
+# ---------------- Frame fetcher -----------------
+# In-memory LRU of frame JPEG bytes shared by best-frame scoring and VLM image loading
+FRAME_CACHE_MAX_BYTES = int(os.environ.get("FRAME_CACHE_MAX_MB", "256")) * 1024 * 1024
+FRAME_FETCH_WORKERS = int(os.environ.get("FRAME_FETCH_WORKERS", "8"))
+
+# ---------------- VLM result cache -----------------
+VLM_CACHE_ENABLED = os.environ.get("VLM_CACHE_ENABLED", "1") == "1"
+VLM_CACHE_MAX_ENTRIES = int(os.environ.get("VLM_CACHE_MAX_ENTRIES", "1024"))
+VLM_CACHE_TTL_SEC = int(os.environ.get("VLM_CACHE_TTL_SEC", "3600"))
+# Max differing bits between perceptual hashes of the item crop still treated as the same image
+VLM_CACHE_MAX_HAMMING = int(os.environ.get("VLM_CACHE_MAX_HAMMING", "2"))
+# Optional SQLite file that keeps the cache across restarts, e.g. /app/results/vlm_cache.sqlite
+VLM_CACHE_DB = os.environ.get("VLM_CACHE_DB", "")
+
+# ---------------- Decision-agent memo -----------------
+# Agent validations keyed by normalized item name and AGENT_PROMPT version
+AGENT_MEMO_ENABLED = os.environ.get("AGENT_MEMO_ENABLED", "1") == "1"
+AGENT_MEMO_MAX_ENTRIES = int(os.environ.get("AGENT_MEMO_MAX_ENTRIES", "4096"))
+AGENT_MEMO_TTL_SEC = int(os.environ.get("AGENT_MEMO_TTL_SEC", str(7 * 24 * 3600)))
+# Optional SQLite file that keeps the memo across runs, e.g. /app/results/agent_memo.sqlite
+AGENT_MEMO_DB = os.environ.get("AGENT_MEMO_DB", "")
+
+# ---------------- HTTP connection pool -----------------
+# Keep-alive connections per host; defaults to enough for every in-flight VLM call
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", str(max(VLM_WORKERS, VLM_MAX_IN_FLIGHT) + 2)))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "3"))
+HTTP_BACKOFF_FACTOR = float(os.environ.get("HTTP_BACKOFF_FACTOR", "0.5"))
+
+# ---------------- Scale-out -----------------
+# Consumer processes/containers sharing the object_detection queue. With more
+# than one, STREAM_END is re-broadcast to every worker and the worker that
+# received it collects all workers' results for the run.
+VLM_WORKER_COUNT = int(os.environ.get("VLM_WORKER_COUNT", "1"))
+VLM_WORKER_ID = os.environ.get("VLM_WORKER_ID") or socket.gethostname()
+# How long the aggregating worker waits for the others before writing partial results
+VLM_AGGREGATE_TIMEOUT_SEC = float(os.environ.get("VLM_AGGREGATE_TIMEOUT_SEC", "300"))
+
 SAMPLE_MEDIA_DIR = "sample-media"
 LP_APP_BASE_DIR = "/app"
 
@@ -23,12 +87,27 @@ MINIO_HOST = f"{LP_IP}:{MINIO_API_HOST_PORT}"
 
 CONFIG_FILES_PATH = os.path.join(LP_APP_BASE_DIR, "config")
 INVENTORY_FILE = os.path.join(CONFIG_FILES_PATH, "inventory.json")
+# Detector label -> inventory terms, e.g. {"bottle": ["coca-cola bottle"]}
+LABEL_SYNONYMS_FILE = os.path.join(CONFIG_FILES_PATH, "label_synonyms.json")
+# Fuzzy inventory matching: minimum score (coverage of query and item name, whichever is lower),
+# and lead over the runner-up, to skip the VLM
+INVENTORY_MATCH_THRESHOLD = float(os.environ.get("INVENTORY_MATCH_THRESHOLD", "0.85"))
+INVENTORY_MATCH_MARGIN = float(os.environ.get("INVENTORY_MATCH_MARGIN", "0.05"))
+# Optional prebuilt SQLite catalog (python -m utils.inventory_store build); overrides INVENTORY_FILE
+INVENTORY_DB = os.environ.get("INVENTORY_DB", "")
+INVENTORY_DB_MMAP_BYTES = int(os.environ.get("INVENTORY_DB_MMAP_MB", "64")) * 1024 * 1024
+# How often the catalog files are checked for changes; 0 disables hot reload
+INVENTORY_RELOAD_INTERVAL_S = float(os.environ.get("INVENTORY_RELOAD_INTERVAL_S", "5"))
 
 # Generate timestamp for results file
 TIMESTAMP = datetime.now().strftime("%Y%m%d%H%M%S")
 
 AGENT_RESULTS_DIR_FULL_PATH = os.path.join(LP_APP_BASE_DIR, RESULTS_DIR, "agent_results.json")
-COMMON_RESULTS_DIR_FULL_PATH = os.path.join(LP_APP_BASE_DIR, RESULTS_DIR,  f"results_{TIMESTAMP}.jsonl")
+# Workers of a scaled-out consumer share the results directory
+RESULTS_FILE_SUFFIX = f"_{VLM_WORKER_ID}" if VLM_WORKER_COUNT > 1 else ""
+COMMON_RESULTS_DIR_FULL_PATH = os.path.join(LP_APP_BASE_DIR, RESULTS_DIR,  f"results_{TIMESTAMP}{RESULTS_FILE_SUFFIX}.jsonl")
+# Aggregated per-run results (run_<run_id>.json) written by the aggregating worker
+RUN_RESULTS_DIR_FULL_PATH = os.path.join(LP_APP_BASE_DIR, RESULTS_DIR, "runs")
 STREAM_RESULTS_DIR_FULL_PATH = os.path.join(LP_APP_BASE_DIR, RESULTS_DIR, "stream_results.log")
 
 ####### volume-mount paths ############
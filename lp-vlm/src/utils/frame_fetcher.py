@@ -0,0 +1,165 @@
+"""Prefetching MinIO frame reader with an in-memory, byte-bounded LRU cache."""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Union
+
+from utils.config import logger, FRAME_CACHE_MAX_BYTES, FRAME_FETCH_WORKERS
+from utils.save_results import FrameFetchError, MINIO_BUCKET, get_frames_from_minio
+from vlm_metrics_logger import get_logger
+
+
+class FrameFetcher:
+    """
+    Shared frame reader for best-frame scoring and VLM image loading.
+
+    - prefetch() starts background GETs for keys that are not cached yet
+    - concurrent requests for the same key share one GET
+    - fetched bytes are kept in an LRU bounded by max_bytes
+    - failures raise FrameFetchError and are not cached
+    """
+
+    def __init__(self, max_bytes: int = FRAME_CACHE_MAX_BYTES, workers: int = FRAME_FETCH_WORKERS,
+                 fetch_fn=None):
+        self.max_bytes = max_bytes
+        self._fetch_fn = fetch_fn or get_frames_from_minio
+        self._cache = OrderedDict()  # (bucket, key) -> bytes
+        self._cached_bytes = 0
+        self._in_flight = {}  # (bucket, key) -> Future
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="frame-fetch")
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.fetch_seconds = 0.0
+
+    @staticmethod
+    def _cache_key(key, bucket):
+        return (bucket or MINIO_BUCKET, key)
+
+    def _load(self, cache_key):
+        bucket, key = cache_key
+        start = time.perf_counter()
+        try:
+            data = self._fetch_fn(key, bucket_name=bucket)
+            with self._lock:
+                self.fetch_seconds += time.perf_counter() - start
+                self._store(cache_key, data)
+            return data
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            if isinstance(e, FrameFetchError):
+                raise
+            raise FrameFetchError(str(e), key, bucket) from e
+        finally:
+            with self._lock:
+                self._in_flight.pop(cache_key, None)
+
+    def _store(self, cache_key, data):
+        if len(data) > self.max_bytes:
+            return
+        if cache_key in self._cache:
+            self._cached_bytes -= len(self._cache.pop(cache_key))
+        self._cache[cache_key] = data
+        self._cached_bytes += len(data)
+        while self._cached_bytes > self.max_bytes:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= len(evicted)
+
+    def _lookup(self, cache_key) -> Union[bytes, Future]:
+        """Cached bytes, or the Future of a (possibly shared) fetch. Caller holds the lock."""
+        data = self._cache.get(cache_key)
+        if data is not None:
+            self._cache.move_to_end(cache_key)
+            self.hits += 1
+            return data
+        self.misses += 1
+        future = self._in_flight.get(cache_key)
+        if future is None:
+            future = self._executor.submit(self._load, cache_key)
+            self._in_flight[cache_key] = future
+        return future
+
+    def prefetch(self, keys: List[str], bucket: Optional[str] = None):
+        """Start fetching keys in the background; already cached or in-flight keys are skipped."""
+        with self._lock:
+            for key in keys:
+                cache_key = self._cache_key(key, bucket)
+                if cache_key not in self._cache and cache_key not in self._in_flight:
+                    self._in_flight[cache_key] = self._executor.submit(self._load, cache_key)
+
+    def get(self, key: str, bucket: Optional[str] = None) -> bytes:
+        """
+        Frame bytes for key.
+
+        Raises:
+            FrameFetchError: If the frame cannot be read
+        """
+        with self._lock:
+            found = self._lookup(self._cache_key(key, bucket))
+        return found.result() if isinstance(found, Future) else found
+
+    def get_many(self, keys: List[str], bucket: Optional[str] = None) -> list:
+        """
+        Fetch several frames concurrently.
+
+        Returns:
+            list: bytes or FrameFetchError per key, in input order
+        """
+        start = time.perf_counter()
+        with self._lock:
+            hits_before, misses_before = self.hits, self.misses
+            found = [self._lookup(self._cache_key(key, bucket)) for key in keys]
+            hits, misses = self.hits - hits_before, self.misses - misses_before
+        results = []
+        for item in found:
+            if isinstance(item, Future):
+                try:
+                    item = item.result()
+                except FrameFetchError as e:
+                    item = e
+            results.append(item)
+        elapsed = time.perf_counter() - start
+        failed = sum(isinstance(item, FrameFetchError) for item in results)
+        logger.debug(f"Fetched {len(keys)} frame(s) in {elapsed * 1000:.1f} ms ({hits} hit, {misses} miss, {failed} failed)")
+        get_logger().log_custom_event(
+            "frame_fetch",
+            "USECASE_1",
+            f"frame_fetch_{int(time.time() * 1000)}",
+            frames=len(keys),
+            hits=hits,
+            misses=misses,
+            errors=failed,
+            latency_ms=round(elapsed * 1000, 3),
+        )
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "errors": self.errors,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "cached_frames": len(self._cache),
+                "cached_bytes": self._cached_bytes,
+                "fetch_seconds": round(self.fetch_seconds, 3),
+            }
+
+
+_frame_fetcher = None
+_frame_fetcher_lock = threading.Lock()
+
+
+def get_frame_fetcher() -> FrameFetcher:
+    """Process-wide FrameFetcher."""
+    global _frame_fetcher
+    if _frame_fetcher is not None:
+        return _frame_fetcher
+    with _frame_fetcher_lock:
+        if _frame_fetcher is None:
+            _frame_fetcher = FrameFetcher()
+    return _frame_fetcher
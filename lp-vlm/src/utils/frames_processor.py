@@ -1,7 +1,14 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 from skimage.metrics import structural_similarity as ssim
-from utils.save_results import get_frames_from_minio
+from utils.config import (logger,
+                          BEST_FRAME_METRIC,
+                          BEST_FRAME_MAX_FRAMES,
+                          BEST_FRAME_FETCH_WORKERS,
+                          )
+from utils.frame_fetcher import get_frame_fetcher
 
 class FrameProcessingError(Exception):
     pass
@@ -16,42 +23,123 @@ def compute_optical_flow_mag_fast(gray1, gray2):
     return np.mean(mag)
 
 
-def get_best_frame(frames_list, bucket_name="", alpha=0.5, resize_factor=0.2):
-    prev_gray = None
-    best_frame = None
-    best_score = -1
+def subsample_frames(frames_list, max_frames=BEST_FRAME_MAX_FRAMES):
+    """Evenly spaced subset of at most max_frames keys, keeping the first and last."""
+    if max_frames <= 0 or len(frames_list) <= max_frames:
+        return list(frames_list)
+    indexes = np.linspace(0, len(frames_list) - 1, max_frames).round().astype(int)
+    return [frames_list[i] for i in np.unique(indexes)]
 
-    try:
-        for f in frames_list:
-            # Fetch → decode
-            frame_bytes = get_frames_from_minio(f, bucket_name=bucket_name)
-            img = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
-            if img is None:
-                continue
 
-            # Resize once — used for BOTH SSIM & optical flow
-            small = cv2.resize(img, None, fx=resize_factor, fy=resize_factor,
-                               interpolation=cv2.INTER_AREA)
-            gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+def load_gray_frames(frames_list, bucket_name="", fetch_fn=None, workers=BEST_FRAME_FETCH_WORKERS):
+    """
+    Fetch frames concurrently and decode them as 1/4-size grayscale.
+
+    Frames come from the shared FrameFetcher unless fetch_fn is given.
+
+    Returns:
+        list of (frame key, gray image) for frames that could be fetched and decoded, in input order
+    """
+    if fetch_fn is None:
+        fetched = dict(zip(frames_list, get_frame_fetcher().get_many(frames_list, bucket_name or None)))
+        fetch_fn = lambda key, bucket_name=None: fetched[key]
+
+    def fetch_and_decode(key):
+        frame_bytes = fetch_fn(key, bucket_name=bucket_name)
+        if not isinstance(frame_bytes, (bytes, bytearray)):
+            logger.warning(f"Skipping frame {key}: {frame_bytes}")
+            return None
+        # libjpeg DCT scaling: decodes straight to 1/4 size, no full-resolution buffer
+        return cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(frames_list)))) as executor:
+        grays = list(executor.map(fetch_and_decode, frames_list))
+    return [(key, gray) for key, gray in zip(frames_list, grays) if gray is not None]
+
 
-            if prev_gray is not None:
-                # Optical flow on resized grayscale frames (FASTER)
-                motion = compute_optical_flow_mag_fast(prev_gray, gray)
-                motion_score = 1 / (1 + motion)
+def score_sharpness_stability(grays, alpha=0.5):
+    """
+    Score frames in one batch: Laplacian sharpness plus inverse frame-diff energy.
 
-                # SSIM (no full map → much faster)
-                ssim_score = ssim(prev_gray, gray)
+    Args:
+        grays: Grayscale frames (resized to a common shape)
+        alpha: Weight of sharpness vs stability
 
-                # Weighted score
-                stability_score = alpha * ssim_score + (1 - alpha) * motion_score
+    Returns:
+        np.ndarray: Score per frame in [0, 1]
+    """
+    stack = np.stack(grays).astype(np.float32)
+    lap = (4 * stack[:, 1:-1, 1:-1] - stack[:, :-2, 1:-1] - stack[:, 2:, 1:-1]
+           - stack[:, 1:-1, :-2] - stack[:, 1:-1, 2:])
+    sharpness = lap.var(axis=(1, 2))
+    sharpness = sharpness / sharpness.max() if sharpness.max() > 0 else np.zeros(len(stack))
 
-                if stability_score > best_score:
-                    best_score = stability_score
-                    best_frame = f
+    if len(stack) < 2:
+        return alpha * sharpness + (1 - alpha)
+    # Motion of a frame = mean abs difference to its neighbours
+    diffs = np.abs(np.diff(stack, axis=0)).mean(axis=(1, 2))
+    motion = np.empty(len(stack), dtype=np.float32)
+    motion[0], motion[-1] = diffs[0], diffs[-1]
+    motion[1:-1] = (diffs[:-1] + diffs[1:]) / 2
+    stability = 1 - motion / motion.max() if motion.max() > 0 else np.ones(len(stack))
+    return alpha * sharpness + (1 - alpha) * stability
 
-            prev_gray = gray
 
-        return best_frame, best_score if best_frame else (None, 0.0)
+def score_flow_ssim(grays, alpha=0.5):
+    """
+    Original metric: SSIM and Farneback motion against the previous frame.
+    The first frame has no predecessor and scores -1.
+    """
+    scores = np.full(len(grays), -1.0)
+    for i in range(1, len(grays)):
+        motion = compute_optical_flow_mag_fast(grays[i - 1], grays[i])
+        motion_score = 1 / (1 + motion)
+        ssim_score = ssim(grays[i - 1], grays[i])
+        scores[i] = alpha * ssim_score + (1 - alpha) * motion_score
+    return scores
+
+
+def get_best_frame(frames_list, bucket_name="", alpha=0.5, resize_factor=0.2, metric=None,
+                   max_frames=BEST_FRAME_MAX_FRAMES, fetch_fn=None):
+    """
+    Pick the most stable/sharp frame of a track.
+
+    Args:
+        frames_list: Frame object keys in capture order
+        bucket_name: MinIO bucket
+        alpha: Weight between the two components of the metric
+        resize_factor: Scale of the original frame used for flow_ssim
+        metric: "sharpness" (Laplacian + frame-diff, default) or "flow_ssim"
+        max_frames: Subsample long tracks to this many frames (0 = all)
+        fetch_fn: fetch_fn(key, bucket_name=...) -> bytes; defaults to the shared FrameFetcher
+
+    Returns:
+        (best frame key, score), or (None, 0.0) when no frame could be decoded
+    """
+    metric = metric or BEST_FRAME_METRIC
+    try:
+        frames = load_gray_frames(subsample_frames(frames_list, max_frames), bucket_name, fetch_fn)
+        if not frames:
+            return None, 0.0
+        keys = [key for key, _ in frames]
+        shape = frames[0][1].shape[::-1]
+        if metric == "flow_ssim":
+            # Frames are already decoded at 1/4 scale
+            scale = min(1.0, resize_factor * 4)
+            size = (max(1, int(shape[0] * scale)), max(1, int(shape[1] * scale)))
+        else:
+            size = shape
+        grays = [gray if gray.shape[::-1] == size else cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+                 for _, gray in frames]
+
+        if len(grays) == 1:
+            return keys[0], 0.0
+        if metric == "flow_ssim":
+            scores = score_flow_ssim(grays, alpha)
+        else:
+            scores = score_sharpness_stability(grays, alpha)
+        best = int(np.argmax(scores))
+        return keys[best], float(scores[best])
 
     except Exception as e:
         raise FrameProcessingError(f"Error processing frames: {e}")
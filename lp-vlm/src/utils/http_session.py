@@ -0,0 +1,89 @@
+"""Shared keep-alive HTTP session for OVMS and MinIO presigned requests."""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError
+from urllib3.util.retry import Retry
+
+from utils.config import logger, HTTP_POOL_MAXSIZE, HTTP_RETRIES, HTTP_BACKOFF_FACTOR
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+# Gateway/overload answers only: the generation never ran
+POST_RETRY_STATUS_CODES = (502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class GenerationSafeRetry(Retry):
+    """
+    Retry that never re-runs a POST the server may already be working on.
+
+    A read timeout or dropped response on /v3/chat/completions usually means
+    a slow generation, and retrying it would queue the same work again on a
+    saturated server. POSTs are retried only on connect errors, on a pooled
+    connection dropped before any response (see _is_connection_dropped) and
+    on POST_RETRY_STATUS_CODES; GETs keep the full policy.
+    """
+
+    @staticmethod
+    def _is_connection_dropped(error):
+        """
+        The server closed or reset the connection instead of answering.
+
+        urllib3 reports this as a read error, but it is what a keep-alive
+        connection the server already closed (idle timeout, OVMS restart)
+        looks like: the request was never read, so resending it is safe.
+        Errors in the response body surface later and are not retried here.
+        """
+        return (isinstance(error, ProtocolError) and len(error.args) > 1
+                and isinstance(error.args[1], (ConnectionResetError, BrokenPipeError)))
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if (method == "POST" and error is not None and self._is_read_error(error)
+                and not self._is_connection_dropped(error)):
+            return Retry.increment(self.new(read=False), method, url, response, error, _pool, _stacktrace)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method == "POST" and status_code not in POST_RETRY_STATUS_CODES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def build_session(pool_maxsize: int = HTTP_POOL_MAXSIZE, retries: int = HTTP_RETRIES,
+                  backoff_factor: float = HTTP_BACKOFF_FACTOR) -> requests.Session:
+    """
+    Create a pooled session that retries 5xx and connection resets with backoff.
+
+    POST is retried too, but only where the request cannot have started a
+    generation (see GenerationSafeRetry).
+    """
+    retry = GenerationSafeRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset(["GET", "POST"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide pooled session (requests.Session is safe to share across worker threads)."""
+    global _session
+    if _session is not None:
+        return _session
+    with _session_lock:
+        if _session is None:
+            logger.info(f"Initializing HTTP session pool_maxsize={HTTP_POOL_MAXSIZE}, retries={HTTP_RETRIES}")
+            _session = build_session()
+    return _session
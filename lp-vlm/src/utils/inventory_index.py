@@ -0,0 +1,215 @@
+"""Fuzzy inventory matching: normalized token and trigram inverted index over item names."""
+import itertools
+import json
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.config import logger, INVENTORY_MATCH_THRESHOLD, INVENTORY_MATCH_MARGIN
+
+_NON_ALNUM = re.compile(r"[^a-z0-9.]+")
+# Known tokens a misspelled query token is expanded to
+MAX_TYPO_EXPANSIONS = 3
+# Tokens in more items than this ("bottle" in a large catalog) are intersected rather than unioned
+MAX_POSTINGS = 256
+# Candidates scored per query variant; the rest are the ones least like the query in length
+MAX_SCORED = 32
+# A confident match pairs every query token and every item token at least this closely;
+# typos ("yelow") pass, truncations and different words ("larg", "juice") do not
+MIN_TOKEN_SIMILARITY = 0.7
+
+
+def _singular(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def normalize(text: str) -> Tuple[str, ...]:
+    """Lowercase, split on punctuation and singularize: "Yellow Bananas" -> ("yellow", "banana")."""
+    if not text:
+        return ()
+    return tuple(_singular(tok) for tok in _NON_ALNUM.sub(" ", text.lower()).split())
+
+
+def _trigrams(token: str) -> frozenset:
+    padded = f"#{token}#"
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+@lru_cache(maxsize=65536)
+def _token_similarity(a: str, b: str) -> float:
+    """Dice coefficient of token trigrams; tolerates typos such as "yelow"/"yellow"."""
+    if a == b:
+        return 1.0
+    ta, tb = _trigrams(a), _trigrams(b)
+    score = 2 * len(ta & tb) / (len(ta) + len(tb))
+    return score if score >= 0.5 else 0.0
+
+
+def _score(query: Tuple[str, ...], item: Tuple[str, ...]) -> float:
+    """
+    min(query coverage, item coverage) with soft token matches.
+
+    Both directions must be covered, so a subset ("green" vs "Green Apple") or
+    superset ("green apple juice") of an item name scores low.
+    """
+    if query == item:
+        return 1.0
+    query_set, item_set = set(query), set(item)
+    # Exact token hits first; only the rest need trigram similarity
+    coverage = sum(1.0 if q in item_set else max(_token_similarity(q, t) for t in item) for q in query) / len(query)
+    if coverage == 0.0:
+        return 0.0
+    precision = sum(1.0 if t in query_set else max(_token_similarity(t, q) for q in query) for t in item) / len(item)
+    return min(coverage, precision)
+
+
+def _aligned(query: Tuple[str, ...], item: Tuple[str, ...]) -> bool:
+    """Every token on each side has a close counterpart on the other."""
+    return (all(max(_token_similarity(q, t) for t in item) >= MIN_TOKEN_SIMILARITY for q in query)
+            and all(max(_token_similarity(t, q) for q in query) >= MIN_TOKEN_SIMILARITY for t in item))
+
+
+def load_label_synonyms(path: str) -> Dict[str, List[str]]:
+    """Load the detector-label -> inventory-term map; a missing file means no synonyms."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logger.error(f"Failed to load label synonyms from {path}: {e}")
+        return {}
+
+
+class InventoryIndex:
+    """
+    In-memory index for matching detector labels and VLM item names to inventory.
+
+    match() returns an inventory name only when the best candidate scores at
+    least `threshold` and beats the runner-up by `margin`; ambiguous labels
+    ("apple" vs "Red Apple"/"Green Apple") return None and go to the VLM with
+    candidates() as the narrowed item list.
+    """
+
+    def __init__(self, items: Iterable[str], synonyms: Optional[Dict[str, List[str]]] = None,
+                 threshold: float = INVENTORY_MATCH_THRESHOLD, margin: float = INVENTORY_MATCH_MARGIN):
+        self.threshold = threshold
+        self.margin = margin
+        self.items: List[str] = []
+        self._tokens: List[Tuple[str, ...]] = []
+        self._exact: Dict[Tuple[str, ...], int] = {}
+        self._token_postings = defaultdict(set)
+        # Item ids by token count, to keep the items closest in length when capping candidates
+        self._ids_by_length = defaultdict(set)
+        # Trigrams of the distinct tokens (not of items), to correct misspelled query tokens
+        self._vocab_trigrams = defaultdict(set)
+        for name in items:
+            tokens = normalize(name)
+            if not tokens or tokens in self._exact:
+                continue  # "Yellow Bananas" and "Yellow Banana" are one entry
+            item_id = len(self.items)
+            self.items.append(name)
+            self._tokens.append(tokens)
+            self._exact[tokens] = item_id
+            self._ids_by_length[len(tokens)].add(item_id)
+            for token in tokens:
+                self._token_postings[token].add(item_id)
+        for token in self._token_postings:
+            for gram in _trigrams(token):
+                self._vocab_trigrams[gram].add(token)
+        self.synonyms = {
+            normalize(label): [normalize(term) for term in terms]
+            for label, terms in (synonyms or {}).items()
+        }
+
+    def __len__(self):
+        return len(self.items)
+
+    def _query_variants(self, query: str) -> List[Tuple[str, ...]]:
+        tokens = normalize(query)
+        if not tokens:
+            return []
+        return [tokens] + [terms for terms in self.synonyms.get(tokens, []) if terms]
+
+    def _similar_tokens(self, token: str) -> List[str]:
+        """Known tokens close to a token missing from the vocabulary ("yelow" -> ["yellow"])."""
+        gram_hits = Counter()
+        for gram in _trigrams(token):
+            gram_hits.update(self._vocab_trigrams.get(gram, ()))
+        similar = [(_token_similarity(token, known), known) for known, _ in gram_hits.most_common(4 * MAX_TYPO_EXPANSIONS)]
+        return [known for score, known in sorted(similar, reverse=True)[:MAX_TYPO_EXPANSIONS] if score > 0]
+
+    def _retrieve(self, tokens: Tuple[str, ...]):
+        """
+        Item ids worth scoring for a token tuple, at most MAX_SCORED.
+
+        Rare tokens are unioned. When every token is frequent, items holding
+        all of them are taken instead, so a lookup never fans out to a large
+        share of the catalog.
+        """
+        postings = []
+        for token in set(tokens):
+            ids = self._token_postings.get(token)
+            if ids is None:
+                ids = set().union(*(self._token_postings[known] for known in self._similar_tokens(token)))
+            if ids:
+                postings.append(ids)
+        if not postings:
+            return set()
+        postings.sort(key=len)
+        rare = [ids for ids in postings if len(ids) <= MAX_POSTINGS]
+        if rare:
+            ids = set().union(*rare)
+        else:
+            ids = postings[0].intersection(*postings[1:]) or postings[0]
+        if len(ids) <= MAX_SCORED:
+            return ids
+        kept = []
+        for length in sorted(self._ids_by_length, key=lambda length: abs(length - len(tokens))):
+            kept.extend(itertools.islice(ids & self._ids_by_length[length], MAX_SCORED - len(kept)))
+            if len(kept) >= MAX_SCORED:
+                break
+        return kept
+
+    def candidates(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """
+        Inventory items similar to the query, best first.
+
+        Returns:
+            list of (inventory name, score in [0, 1])
+        """
+        scores = {}
+        for tokens in self._query_variants(query):
+            exact = self._exact.get(tokens)
+            if exact is not None:
+                scores[exact] = 1.0
+                continue
+            ids = self._retrieve(tokens)
+            for item_id in ids:
+                score = _score(tokens, self._tokens[item_id])
+                if score > scores.get(item_id, 0.0):
+                    scores[item_id] = score
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+        return [(self.items[item_id], score) for item_id, score in ranked if score > 0]
+
+    def match(self, query: str) -> Optional[str]:
+        """
+        The inventory name the query confidently refers to, or None.
+
+        The query itself, or one of its label_synonyms.json terms, must
+        cover the whole item name and nothing else, token by token.
+        """
+        ranked = self.candidates(query, limit=2)
+        if not ranked or ranked[0][1] < self.threshold:
+            return None
+        if len(ranked) > 1 and ranked[0][1] - ranked[1][1] < self.margin:
+            return None
+        item = normalize(ranked[0][0])
+        if not any(_aligned(tokens, item) for tokens in self._query_variants(query)):
+            return None
+        return ranked[0][0]
@@ -0,0 +1,176 @@
+"""
+Hot-reloadable inventory for the VLM consumer.
+
+The catalog is either config/inventory.json or a SQLite file built offline
+from it (see `python -m utils.inventory_store build --help`). The SQLite file
+is opened read-only and memory-mapped, so several consumer processes share
+its pages through the OS cache. A watcher thread rebuilds the InventoryIndex
+when the catalog or synonym file changes and swaps it in atomically; callers
+holding the previous index keep using it until they ask again.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from utils.config import (logger,
+                          INVENTORY_FILE,
+                          INVENTORY_DB,
+                          LABEL_SYNONYMS_FILE,
+                          INVENTORY_RELOAD_INTERVAL_S,
+                          INVENTORY_DB_MMAP_BYTES,
+                          )
+from utils.inventory_index import InventoryIndex, load_label_synonyms
+
+SCHEMA_VERSION = "1"
+
+
+def build_inventory_db(inventory_path: str, synonyms_path: str, db_path: str) -> int:
+    """
+    Compile inventory.json (+ label synonyms) into a SQLite catalog.
+
+    The file is written next to db_path and renamed over it, so readers never
+    see a partial catalog.
+
+    Returns:
+        int: Number of items written
+    """
+    with open(inventory_path, "r") as f:
+        items = json.load(f)
+    synonyms = load_label_synonyms(synonyms_path) if synonyms_path else {}
+
+    tmp_path = f"{db_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(
+            "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT NOT NULL);"
+            "CREATE TABLE synonyms (label TEXT NOT NULL, term TEXT NOT NULL);"
+        )
+        conn.executemany("INSERT INTO items (name) VALUES (?)", [(name,) for name in items])
+        conn.executemany(
+            "INSERT INTO synonyms VALUES (?, ?)",
+            [(label, term) for label, terms in synonyms.items() for term in terms],
+        )
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("schema_version", SCHEMA_VERSION), ("built_at", str(time.time())), ("source", inventory_path)],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+    return len(items)
+
+
+def read_inventory_db(db_path: str) -> Tuple[List[str], Dict[str, List[str]]]:
+    """Read items and synonyms from a catalog built by build_inventory_db (read-only, mmap)."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        conn.execute(f"PRAGMA mmap_size={INVENTORY_DB_MMAP_BYTES}")
+        items = [row[0] for row in conn.execute("SELECT name FROM items ORDER BY id")]
+        synonyms = {}
+        for label, term in conn.execute("SELECT label, term FROM synonyms ORDER BY rowid"):
+            synonyms.setdefault(label, []).append(term)
+        return items, synonyms
+    finally:
+        conn.close()
+
+
+def _file_signature(path: str):
+    try:
+        st = os.stat(path)
+        return st.st_ino, st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return None
+
+
+class InventoryStore:
+    """
+    Owns the current InventoryIndex and replaces it when the catalog changes.
+
+    A failed reload (bad JSON, half-copied file) keeps the previous index.
+    """
+
+    def __init__(self, inventory_path: Optional[str] = None, synonyms_path: str = LABEL_SYNONYMS_FILE,
+                 reload_interval_s: float = INVENTORY_RELOAD_INTERVAL_S):
+        self.inventory_path = inventory_path or INVENTORY_DB or INVENTORY_FILE
+        self.synonyms_path = synonyms_path
+        self.reload_interval_s = reload_interval_s
+        self.generation = 0
+        self._index = InventoryIndex([])
+        self._signature = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.reload()
+
+    @property
+    def index(self) -> InventoryIndex:
+        """The current index; hold on to it for the duration of one lookup."""
+        return self._index
+
+    def _load(self) -> InventoryIndex:
+        if self.inventory_path.endswith((".sqlite", ".db")):
+            # Synonyms are compiled into the catalog
+            items, synonyms = read_inventory_db(self.inventory_path)
+        else:
+            with open(self.inventory_path, "r") as f:
+                items = json.load(f)
+            if not isinstance(items, list):
+                raise ValueError(f"{self.inventory_path} must contain a JSON list of item names")
+            synonyms = load_label_synonyms(self.synonyms_path)
+        return InventoryIndex(items, synonyms)
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuild and swap the index if the source files changed. Returns True on swap."""
+        with self._lock:
+            signature = (_file_signature(self.inventory_path), _file_signature(self.synonyms_path))
+            if not force and signature == self._signature:
+                return False
+            try:
+                index = self._load()
+            except Exception as e:
+                logger.error(f"Inventory reload from {self.inventory_path} failed, keeping previous index: {e}")
+                return False
+            self._index = index
+            self._signature = signature
+            self.generation += 1
+        logger.info(f"Inventory loaded from {self.inventory_path}: {len(index)} item(s), generation {self.generation}")
+        return True
+
+    def start_watching(self):
+        """Poll the source files every reload_interval_s on a daemon thread."""
+        if self._thread is not None or self.reload_interval_s <= 0:
+            return
+        self._thread = threading.Thread(target=self._watch, name="inventory-watcher", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval_s):
+            self.reload()
+
+    def close(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the SQLite inventory catalog used by the VLM consumer")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Compile inventory.json and label synonyms into SQLite")
+    build.add_argument("--inventory", default=INVENTORY_FILE, help="Path to inventory.json")
+    build.add_argument("--synonyms", default=LABEL_SYNONYMS_FILE, help="Path to label_synonyms.json")
+    build.add_argument("--output", required=True, help="Catalog path, e.g. /app/config/inventory.sqlite")
+    args = parser.parse_args()
+
+    count = build_inventory_db(args.inventory, args.synonyms, args.output)
+    print(f"✅ Wrote {count} item(s) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
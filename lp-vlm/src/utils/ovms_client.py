@@ -1,29 +1,119 @@
 import base64
+import json
 from io import BytesIO
 from typing import Optional
 import time
 
 import numpy as np
-import requests
 from PIL import Image
 
+from utils.config import logger
+from utils.http_session import get_http_session
+
+
+class GenerationResult:
+    def __init__(self, generated_text, usage_data, latency, ttft=None, tpot=None, stopped_early=False,
+                 structured=False):
+        self.texts = [generated_text]
+        self.usage = usage_data
+        self.total_latency = latency
+        # Only set for streamed responses
+        self.ttft = ttft
+        self.tpot = tpot
+        self.stopped_early = stopped_early
+        # Decoding was constrained to a response_format schema
+        self.structured = structured
+
+
+class IncrementalJSONScanner:
+    """
+    Tracks bracket depth over streamed text and reports when the first
+    top-level JSON array or object is complete. Brackets inside strings are
+    ignored; anything before the opening bracket (e.g. ```json) is skipped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.start = -1
+        self.end = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def complete(self):
+        return self.end != -1
+
+    def feed(self, chunk):
+        """Append a text chunk. Returns True once the JSON value is complete."""
+        offset = len(self.text)
+        self.text += chunk
+        if self.complete:
+            return True
+        for i, ch in enumerate(chunk, start=offset):
+            if self.start == -1:
+                if ch in "[{":
+                    self.start = i
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = i
+                    return True
+        return False
+
+    def value_text(self):
+        """The complete JSON text, or everything received so far."""
+        if self.complete:
+            return self.text[self.start:self.end + 1]
+        return self.text
+
 
 class OVMSVLMClient:
-    def __init__(self, endpoint, model_name, timeout=120, max_new_tokens=512, temperature=0.0):
+    def __init__(self, endpoint, model_name, timeout=120, max_new_tokens=512, temperature=0.0, session=None,
+                 streaming=False, structured_output=True):
         self.endpoint = f"{endpoint.rstrip('/')}/v3/chat/completions"
         self.model_name = model_name
         self.timeout = timeout
         self.max_new_tokens = max_new_tokens
         self.temperature = temperature
+        self.session = session or get_http_session()
+        self.streaming = streaming
+        # Cleared for good if the server rejects response_format
+        self.structured_output = structured_output
 
     def _encode_image(self, image):
+        # Already-encoded JPEG bytes are sent as-is
+        if isinstance(image, (bytes, bytearray)):
+            img_b64 = base64.b64encode(image).decode("utf-8")
+            return f"data:image/jpeg;base64,{img_b64}"
         pil_img = Image.fromarray(image.astype("uint8"))
         buffer = BytesIO()
         pil_img.save(buffer, format="JPEG", quality=82, optimize=True)
         img_b64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
         return f"data:image/jpeg;base64,{img_b64}"
 
-    def generate(self, prompt, images=None, generation_config=None, unique_id: Optional[str] = None):
+    def generate(self, prompt, images=None, generation_config=None, unique_id: Optional[str] = None,
+                 response_format: Optional[dict] = None):
+        """
+        Run one chat completion.
+
+        response_format (e.g. from utils.prompts.get_response_format) constrains
+        decoding to a JSON schema; it is dropped if structured output is
+        disabled or the server does not support it.
+        """
         _ = generation_config
         _ = unique_id
         images = images or []
@@ -33,7 +123,7 @@ class OVMSVLMClient:
             content.append(
                 {
                     "type": "image_url",
-                    "image_url": {"url": self._encode_image(np.asarray(image))},
+                    "image_url": {"url": self._encode_image(image if isinstance(image, (bytes, bytearray)) else np.asarray(image))},
                 }
             )
 
@@ -43,14 +133,14 @@ class OVMSVLMClient:
             "max_completion_tokens": self.max_new_tokens,
             "temperature": self.temperature,
         }
+        if response_format and self.structured_output:
+            request_data["response_format"] = response_format
+
+        if self.streaming:
+            return self._generate_stream(request_data)
 
         request_start = time.time()
-        response = requests.post(
-            self.endpoint,
-            headers={"Content-Type": "application/json"},
-            json=request_data,
-            timeout=self.timeout,
-        )
+        response = self._post(request_data, headers={"Content-Type": "application/json"})
         response.raise_for_status()
 
         payload = response.json()
@@ -58,10 +148,71 @@ class OVMSVLMClient:
         text = payload.get("choices", [{}])[0].get("message", {}).get("content", "")
         usage = payload.get("usage", {})
 
-        class GenerationResult:
-            def __init__(self, generated_text, usage_data, latency):
-                self.texts = [generated_text]
-                self.usage = usage_data
-                self.total_latency = latency
+        return GenerationResult(text, usage, total_latency, structured="response_format" in request_data)
+
+    def _post(self, request_data, headers, stream=False):
+        """
+        POST a completion request. A 400 for a request carrying response_format
+        is retried once without it, and structured output is switched off.
+        Drops response_format from request_data in that case.
+        """
+        response = self.session.post(self.endpoint, headers=headers, json=request_data,
+                                     timeout=self.timeout, stream=stream)
+        if response.status_code == 400 and "response_format" in request_data:
+            logger.warning(f"OVMS rejected response_format, disabling structured output: {response.text[:200]}")
+            response.close()
+            self.structured_output = False
+            request_data.pop("response_format")
+            response = self.session.post(self.endpoint, headers=headers, json=request_data,
+                                         timeout=self.timeout, stream=stream)
+        return response
+
+    def _generate_stream(self, request_data):
+        """
+        Consume an SSE response and close it as soon as a complete JSON value
+        has been received; closing the connection makes OVMS stop generating.
+        """
+        request_data = dict(request_data, stream=True, stream_options={"include_usage": True})
+        scanner = IncrementalJSONScanner()
+        usage = {}
+        chunks = 0
+        first_token_at = None
+        stopped_early = False
+
+        request_start = time.time()
+        response = self._post(request_data, headers={"Content-Type": "application/json", "Accept": "text/event-stream"},
+                              stream=True)
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                usage = event.get("usage") or usage
+                choices = event.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.time()
+                chunks += 1
+                if scanner.feed(delta):
+                    stopped_early = True
+                    break
+        finally:
+            response.close()
+
+        total_latency = time.time() - request_start
+        if not usage.get("completion_tokens"):
+            # Usage arrives in the final event, which an early exit never reads
+            usage = dict(usage, completion_tokens=chunks)
+        ttft = (first_token_at - request_start) if first_token_at else total_latency
+        generated = usage["completion_tokens"]
+        tpot = ((total_latency - ttft) / (generated - 1)) if generated > 1 else 0.0
 
-        return GenerationResult(text, usage, total_latency)
\ No newline at end of file
+        return GenerationResult(scanner.value_text(), usage, total_latency,
+                                ttft=ttft, tpot=tpot, stopped_early=stopped_early,
+                                structured="response_format" in request_data)
@@ -0,0 +1,167 @@
+"""
+Versioned, compact prompt templates.
+
+A template is a stable prefix (instructions, examples, output format) plus a
+short per-request suffix. Every request built from a template starts with
+the same prefix bytes, so OVMS prefix caching can reuse its KV cache and
+only the suffix (and images) is prefilled per item. Indentation and blank
+lines are stripped when a template is defined.
+
+    python -m utils.prompt_builder   # estimated prefix/suffix tokens per template
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from utils.config import logger
+from vlm_metrics_logger import get_logger
+
+# Rough BPE ratio for English prompt text; used when OVMS reports no usage
+CHARS_PER_TOKEN = 4
+
+
+def compact_prompt(text: str) -> str:
+    """Strip indentation and trailing spaces from every line and drop blank lines."""
+    return "\n".join(line.strip() for line in (text or "").splitlines() if line.strip())
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, round(len(text) / CHARS_PER_TOKEN)) if text else 0
+
+
+class PromptTemplate:
+    """
+    A named, versioned prompt: fixed prefix + str.format suffix.
+
+    Bump version when the wording changes meaningfully; the fingerprint
+    changes with any edit, so caches keyed on `id` never mix versions.
+    """
+
+    def __init__(self, name: str, version: str, prefix: str, suffix: str = "", output: str = ""):
+        self.name = name
+        self.version = version
+        # Output-format lines close the prefix; kept apart so strip_output() can drop them
+        self.output = compact_prompt(output)
+        self.prefix = "\n".join(part for part in (compact_prompt(prefix), self.output) if part)
+        self.suffix = compact_prompt(suffix)
+        self.fingerprint = hashlib.sha256(f"{self.prefix}\0{self.suffix}".encode("utf-8")).hexdigest()[:8]
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@{self.version}-{self.fingerprint}"
+
+    def render(self, **fields) -> str:
+        """Prefix, then the suffix filled with fields."""
+        if not self.suffix:
+            return self.prefix
+        return f"{self.prefix}\n{self.suffix.format(**fields)}"
+
+    def strip_output(self, prompt: str) -> str:
+        """The prompt without this template's output-format lines, for a prompt that sets its own."""
+        if not self.output:
+            return prompt
+        return compact_prompt(prompt.replace(self.output, "", 1))
+
+
+_templates: Dict[str, PromptTemplate] = {}
+
+
+def register_template(template: PromptTemplate) -> PromptTemplate:
+    _templates[template.name] = template
+    return template
+
+
+def get_template(name: str) -> PromptTemplate:
+    return _templates[name]
+
+
+def list_templates() -> List[PromptTemplate]:
+    return list(_templates.values())
+
+
+def identify_template(prompt: str) -> Optional[PromptTemplate]:
+    """The registered template whose prefix the prompt starts with (longest match)."""
+    best = None
+    for template in _templates.values():
+        if prompt.startswith(template.prefix) and (best is None or len(template.prefix) > len(best.prefix)):
+            best = template
+    return best
+
+
+class PromptTokenStats:
+    """Running prompt-token totals per template, from OVMS usage or estimated from the text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = defaultdict(lambda: {"requests": 0, "prompt_tokens": 0, "estimated": 0})
+
+    def record(self, prompt: str, usage: Optional[dict], images: int = 0, unique_id: Optional[str] = None) -> dict:
+        """
+        Attribute one request's prompt tokens to its template and log a prompt_tokens event.
+
+        Returns:
+            dict: The logged fields
+        """
+        template = identify_template(prompt)
+        prompt_tokens = (usage or {}).get("prompt_tokens")
+        estimated = not prompt_tokens
+        if estimated:
+            # Streamed requests stopped early never receive usage; text only, images not counted
+            prompt_tokens = estimate_tokens(prompt)
+        fields = {
+            "template": template.name if template else "adhoc",
+            "template_id": template.id if template else "adhoc",
+            "prompt_tokens": prompt_tokens,
+            "estimated": estimated,
+            "prefix_tokens": estimate_tokens(template.prefix) if template else 0,
+            "text_tokens": estimate_tokens(prompt),
+            "images": images,
+        }
+        with self._lock:
+            totals = self._totals[fields["template_id"]]
+            totals["requests"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["estimated"] += int(estimated)
+        get_logger().log_custom_event(
+            "prompt_tokens",
+            "USECASE_2",
+            unique_id or f"prompt_tokens_{int(time.time() * 1000)}",
+            **fields,
+        )
+        return fields
+
+    def report(self) -> dict:
+        """template_id -> {"requests", "prompt_tokens", "estimated", "mean_prompt_tokens"}."""
+        with self._lock:
+            return {
+                template_id: dict(totals, mean_prompt_tokens=totals["prompt_tokens"] / totals["requests"])
+                for template_id, totals in self._totals.items()
+            }
+
+
+prompt_token_stats = PromptTokenStats()
+
+
+def record_prompt_usage(prompt: str, usage: Optional[dict], images: int = 0, unique_id: Optional[str] = None) -> dict:
+    """Record one request's prompt tokens in the process-wide stats."""
+    try:
+        return prompt_token_stats.record(prompt, usage, images, unique_id)
+    except Exception as e:
+        logger.error(f"Prompt token accounting failed: {e}")
+        return {}
+
+
+def main():
+    # Templates register themselves in utils.prompt_builder (not this __main__ copy) on import
+    import utils.prompts  # noqa: F401
+    from utils.prompt_builder import list_templates
+
+    print(f"{'template':<40} {'prefix':>8} {'suffix':>8}   (estimated tokens)")
+    for template in list_templates():
+        print(f"{template.id:<40} {estimate_tokens(template.prefix):>8} {estimate_tokens(template.suffix):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+import json
+
+from utils.prompt_builder import PromptTemplate, identify_template, register_template
+
 ITEMS_IN_PLASTIC_BOX_VLM_PROMPT = """
                                     Analyze this image captured at a grocery checkout counter.
                                     Focus specifically on any grocery items that are stored **inside transparent plastic boxes or containers**.
@@ -79,85 +83,207 @@ BOTTLE_PRODUCT_VLM_PROMPT = """
                             }
                             """
                             
-COMMON_PROMPT = """
-You are a vision-language assistant that analyzes grocery images and identifies the visible items in strict JSON format only. Try to be as specific as possible with item names.
-Items could be fruits, vegetables, bottles (soda, water, etc.), items in plastic containers, etc. 
-Rules:
-1. For Fruits/vegetables: include color in name, Dont duplicate items in output, Add only once. example:
-  [{"item_name": "Black Apple"}]
-
-2. For Single bottle: include brand and size, example (Try to estimate the size in ml or Liter if possible):
-  [{"item_name": "Coke Bottle 1L"]
-
-3. For Multiple bottles, example: (Try to estimate the size in ml or Liter if possible)
-  [{"item_name": "Coke Bottle 200ml"}, {"item_name": "Pepsi Bottle 2L"}]
-
-4. For Items in plastic containers: zoom in and read from the label of the box. Try to be as accurate as possible, example:
-  [{"item_name": "Peeled peas"}]
-
-Return only valid JSON array. No additional text.
-"""
-
-
-AGENT_PROMPT = """
-You are a smart grocery item name validator. You will receive a single item name generated by a grocery detection system. The item name might include volume formats (like "200ml", "1 liter", "2 liters", etc.).
-
-Your job is to validate according to these rules:
-
-We have following items in grocery store:
- - "Red Apple"
- - "Green Apple"
- - "Coca-Cola Bottle Small"
- - "Coca-Cola Bottle Large"
- - "Peeled Pomegranate"
- - "Yellow Banana"
- 
-There may be spelling mistakes or additional prepositions from above but the item should be same as above items. Compare the grocery item name with the valid items in the store and check if it matches any of them based on the size criteria defined below.
-
-1) Size Validator for coca-cola bottles:
-  - Below is the size of bottles available in the grocery store and mapped to three categories: Small, Medium, and Large.
-  - Small: 200 ml, 250 ml, 300 ml
-  - Medium: 500 ml, 600 ml, 750 ml, 1 liter
-  - Large: 1.25 liter, 1.5 liter, 2 liter, 2.25 liter, 2.5 liter
-
-2) Formatting:
-  - The final output must be in JSON format with a single object (not an array)
-  - Examples:
+# ============================================================================
+# PROMPT TEMPLATES
+# ============================================================================
+# Templates are compacted (no indentation, no blank lines) and keep everything
+# shared across requests in the prefix, so OVMS can reuse the prefix KV cache;
+# only the short suffix differs per item. See utils.prompt_builder.
+
+ITEMS_TEMPLATE = register_template(PromptTemplate("items", "2", """
+    You are a vision-language assistant that analyzes grocery images and identifies the visible items in strict JSON format only. Try to be as specific as possible with item names.
+    Items could be fruits, vegetables, bottles (soda, water, etc.), items in plastic containers, etc.
+    Rules:
+    1. For Fruits/vegetables: include color in name, Dont duplicate items in output, Add only once. example:
+    [{"item_name": "Black Apple"}]
+    2. For Single bottle: include brand and size, example (Try to estimate the size in ml or Liter if possible):
+    [{"item_name": "Coke Bottle 1L"}]
+    3. For Multiple bottles, example: (Try to estimate the size in ml or Liter if possible)
+    [{"item_name": "Coke Bottle 200ml"}, {"item_name": "Pepsi Bottle 2L"}]
+    4. For Items in plastic containers: zoom in and read from the label of the box. Try to be as accurate as possible, example:
+    [{"item_name": "Peeled peas"}]
+""", output="""
+    Return only valid JSON array. No additional text.
+"""))
+
+AGENT_TEMPLATE = register_template(PromptTemplate("agent_validation", "3", """
+    You are a smart grocery item name validator. You will receive a single item name generated by a grocery detection system. The item name might include volume formats (like "200ml", "1 liter", "2 liters", etc.).
+    Your job is to validate according to these rules:
+    We have following items in grocery store:
+    - "Red Apple"
+    - "Green Apple"
+    - "Coca-Cola Bottle Small"
+    - "Coca-Cola Bottle Large"
+    - "Peeled Pomegranate"
+    - "Yellow Banana"
+    There may be spelling mistakes or additional prepositions from above but the item should be same as above items. Compare the grocery item name with the valid items in the store and check if it matches any of them based on the size criteria defined below.
+    1) Size Validator for coca-cola bottles:
+    - Below is the size of bottles available in the grocery store and mapped to three categories: Small, Medium, and Large.
+    - Small: 200 ml, 250 ml, 300 ml
+    - Medium: 500 ml, 600 ml, 750 ml, 1 liter
+    - Large: 1.25 liter, 1.5 liter, 2 liter, 2.25 liter, 2.5 liter
+    2) Formatting:
+    - The final output must be in JSON format with a single object (not an array)
+    - Examples:
     * If input is "Coca-Cola Bottle 500 ml" then output is:
-     [{"item_name": "Coca-Cola Bottle Medium", "match": true}]
+    [{"item_name": "Coca-Cola Bottle Medium", "match": true}]
     * If input is "Coca-Cola Bottle 3 liters" then output is:
-     [{"item_name": "Coca-Cola Bottle Large", "match": false}]
-  - If the item name is valid according to the size validator, set "match" to true; otherwise, set it to false.
-  - Return only a single JSON object in an array."""
+    [{"item_name": "Coca-Cola Bottle Large", "match": false}]
+    - If the item name is valid according to the size validator, set "match" to true; otherwise, set it to false.
+    - Return only a single JSON object in an array.
+""", suffix="Input {items}"))
+
+# The batch prompt extends the single-item one, so both share its cached prefix
+AGENT_BATCH_TEMPLATE = register_template(PromptTemplate("agent_batch", "2", AGENT_TEMPLATE.prefix + """
+    You will receive several item names, each with an index. Validate every item independently and return one JSON array with one object per input, keeping its "index", e.g. [{"index": 0, "item_name": "Coca-Cola Bottle Medium", "match": true}]. No additional text.
+""", suffix="Input {items}"))
+
+INVENTORY_TEMPLATE = register_template(PromptTemplate("inventory", "3", """
+    Which of the following items is visible in this image (the items are listed at the end)?
+    Items may appear inside transparent plastic bags, containers, or packaging. Identify the item even if it is wrapped or partially occluded by packaging.
+""", output="""
+    Reply only with names of detected items in strict JSON format: [{"item_name": "item name here"}]. If no items from the list are visible, reply with [{"item_name": "None"}].
+""", suffix="Items: {items}"))
 
+BATCH_TEMPLATE = register_template(PromptTemplate("batch", "3", """
+    You will receive several images, numbered from 0 in the order given. Answer for each image independently, using the instructions listed for its number below.
+    Return one strict JSON array covering all images. Add an "index" field with the image number to every object, e.g. [{"index": 0, "item_name": "Red Apple"}, {"index": 1, "item_name": "None"}]. Use "None" as the item name for an image showing none of its listed items. No additional text.
+""", suffix="{groups}"))
 
-def generate_inventory_prompt(detected_label, inventory_list):
+COMMON_PROMPT = ITEMS_TEMPLATE.render()
+AGENT_PROMPT = AGENT_TEMPLATE.prefix
+
+
+def generate_agent_prompt(items):
+    """Single-item validation prompt: the shared AGENT_PROMPT prefix, then the compact JSON input."""
+    return AGENT_TEMPLATE.render(items=json.dumps(items))
+
+
+def generate_inventory_prompt(detected_label, inventory_list, candidates=None):
     """Generate a dynamic VLM prompt narrowed to inventory items matching the detected label.
 
     Args:
         detected_label: Object label from the detection model (e.g. "bottle").
         inventory_list: List of inventory item names.
+        candidates: Items already retrieved for the label (e.g. from InventoryIndex);
+            skips the substring scan of inventory_list when given.
 
     Returns:
         A targeted prompt string, or None if no inventory items match.
     """
-    if not detected_label or not inventory_list:
+    if not detected_label:
+        return None
+    if candidates is not None:
+        matched_items = list(candidates)
+    elif not inventory_list:
         return None
-    label_lower = detected_label.strip().lower()
-    matched_items = [
-        item for item in inventory_list
-        if label_lower in item.lower() or item.lower() in label_lower
-    ]
+    else:
+        label_lower = detected_label.strip().lower()
+        matched_items = [
+            item for item in inventory_list
+            if label_lower in item.lower() or item.lower() in label_lower
+        ]
     if not matched_items:
         return None
-    items_list = ", ".join(matched_items)
-    return (
-        f"Which of the following items is visible in this image: {items_list}? "
-        f"Items may appear inside transparent plastic bags, containers, or packaging. "
-        f"Identify the item even if it is wrapped or partially occluded by packaging. "
-        f"Reply only with names of detected items in strict JSON format: "
-        f'[{{"item_name": "item name here"}}]. '
-        f'If no items from the list are visible, reply with [{{"item_name": "None"}}].'
+    # Candidates go last: everything before them is the same for every label
+    return INVENTORY_TEMPLATE.render(items=", ".join(matched_items))
+
+
+def generate_batch_prompt(item_prompts):
+    """Combine per-image prompts into one request covering several images.
+
+    Args:
+        item_prompts: One prompt per image, in the order the images are sent.
+
+    Returns:
+        A prompt asking for a single JSON array whose objects carry the image "index";
+        the per-image instructions come after the shared preamble, without their
+        own single-image output format.
+    """
+    groups = {}
+    for index, prompt in enumerate(item_prompts):
+        template = identify_template(prompt)
+        if template is not None:
+            prompt = template.strip_output(prompt)
+        groups.setdefault(" ".join(prompt.split()), []).append(str(index))
+    return BATCH_TEMPLATE.render(
+        groups="\n".join(f"Images {', '.join(indexes)}: {prompt}" for prompt, indexes in groups.items())
     )
 
 
+def generate_agent_batch_prompt(item_names):
+    """Build one validation prompt for several item names.
+
+    Args:
+        item_names: Item names produced by VLM enhancement.
+
+    Returns:
+        AGENT_PROMPT extended to validate every name and echo its "index".
+    """
+    indexed = [{"index": index, "item_name": name} for index, name in enumerate(item_names)]
+    return AGENT_BATCH_TEMPLATE.render(items=json.dumps(indexed))
+
+
+# ============================================================================
+# RESPONSE SCHEMAS (structured output)
+# ============================================================================
+
+ITEM_LIST_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"item_name": {"type": "string"}},
+        "required": ["item_name"],
+    },
+}
+
+AGENT_VALIDATION_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "maxItems": 1,
+    "items": {
+        "type": "object",
+        "properties": {"item_name": {"type": "string"}, "match": {"type": "boolean"}},
+        "required": ["item_name", "match"],
+        "additionalProperties": False,
+    },
+}
+
+
+def _indexed(schema):
+    """Batch variant of an array schema: every object also carries the integer input "index"."""
+    item = dict(schema["items"])
+    item["properties"] = {"index": {"type": "integer"}, **item["properties"]}
+    item["required"] = ["index", *item["required"]]
+    return {"type": "array", "items": item}
+
+
+# Schema per prompt family; the model is constrained to it when OVMS supports response_format
+RESPONSE_SCHEMAS = {
+    "items": ITEM_LIST_SCHEMA,
+    "agent_validation": AGENT_VALIDATION_SCHEMA,
+    "batch_items": _indexed(ITEM_LIST_SCHEMA),
+    "agent_batch": _indexed(AGENT_VALIDATION_SCHEMA),
+}
+
+
+def response_schema_name(use_case, batch=False):
+    """Registered schema for the prompt call_vlm / call_vlm_batch builds for a use case."""
+    if use_case == "decision_agent":
+        return "agent_batch" if batch else "agent_validation"
+    return "batch_items" if batch else "items"
+
+
+def get_response_format(schema_name):
+    """Chat-completions response_format for a registered schema.
+
+    Args:
+        schema_name: Key of RESPONSE_SCHEMAS.
+
+    Returns:
+        {"type": "json_schema", "json_schema": {...}}, or None for an unknown name.
+    """
+    schema = RESPONSE_SCHEMAS.get(schema_name)
+    if schema is None:
+        return None
+    return {"type": "json_schema", "json_schema": {"name": schema_name, "schema": schema}}
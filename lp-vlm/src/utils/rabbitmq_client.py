@@ -5,26 +5,28 @@ import socket
 from utils.config import logger
 
 
+def get_connection_parameters(user_name: str, password: str) -> pika.ConnectionParameters:
+    """Connection parameters shared by the blocking and the asynchronous (SelectConnection) clients."""
+    return pika.ConnectionParameters(
+        host=os.getenv("RABBITMQ_HOST", "rabbitmq"),
+        port=int(os.getenv("RABBITMQ_PORT", "5672")),
+        credentials=pika.PlainCredentials(user_name, password),
+        heartbeat=300,
+        blocked_connection_timeout=300
+    )
+
+
 def get_rabbitmq_connection(user_name: str, password: str):
     logger.info("Creating RabbitMQ connection...")
     retry = 0
     MAX_RETRIES = 20
-    host = os.getenv("RABBITMQ_HOST", "rabbitmq")
-    port = int(os.getenv("RABBITMQ_PORT", "5672"))
+    parameters = get_connection_parameters(user_name, password)
+    host, port = parameters.host, parameters.port
     logger.info(f"RabbitMQ target → host={host} port={port}")
     while retry < MAX_RETRIES:
         logger.info(f"Attempt {retry + 1}/{MAX_RETRIES} connecting to RabbitMQ...")
         try:
-            credentials = pika.PlainCredentials(user_name, password)
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=host,
-                    port=port,
-                    credentials=credentials,
-                    heartbeat=300,
-                    blocked_connection_timeout=300
-                )
-            )
+            connection = pika.BlockingConnection(parameters)
             logger.info("RabbitMQ connection established.")
             return connection
         except (pika.exceptions.AMQPConnectionError, socket.gaierror) as e:
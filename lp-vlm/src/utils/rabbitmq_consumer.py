@@ -1,37 +1,373 @@
 import pika
 import json
-import queue
 import time
 from datetime import datetime
-from .vlm import call_vlm
-from .rabbitmq_client import get_rabbitmq_connection
+from .rabbitmq_client import get_connection_parameters
+import os
 import threading
-from concurrent.futures import ThreadPoolExecutor
-from .config import logger
-            
+from .config import logger, VLM_WORKER_COUNT, VLM_WORKER_ID
+
+QUEUE_NAME = "object_detection"
+# Publishers route per stream: object_detection.<stream_id> on a topic exchange
+EXCHANGE_NAME = os.environ.get("RABBITMQ_EXCHANGE", "lp.object_detection")
+ROUTING_KEY_PATTERN = "object_detection.#"
+# Fanout exchange every scaled-out worker listens on for STREAM_END / WORKER_DONE
+CONTROL_EXCHANGE_NAME = os.environ.get("RABBITMQ_CONTROL_EXCHANGE", "lp.control")
+# Unacked deliveries the broker hands this consumer; detections stay unacked until VLM processing ends
+PREFETCH_COUNT = int(os.environ.get("RABBITMQ_PREFETCH", "32"))
+RECONNECT_DELAY_SEC = float(os.environ.get("RABBITMQ_RECONNECT_DELAY_SEC", "2"))
+# A detection that fails processing is republished this many times before it is dead-lettered
+MAX_RETRIES = int(os.environ.get("RABBITMQ_MAX_RETRIES", "3"))
+RETRY_HEADER = "x-retry-count"
+# Detections that kept failing (or could not be decoded), kept for inspection instead of dropped
+DEAD_LETTER_QUEUE = os.environ.get("RABBITMQ_DEAD_LETTER_QUEUE", "object_detection_dead_letter")
+
+
+class Delivery:
+    """
+    One AMQP delivery, acked once every message unpacked from it is settled.
+
+    A BATCH delivery carries several detections; the broker copy is kept
+    until the last of them has been processed, so a crash redelivers the
+    whole batch instead of losing the unfinished part.
+    """
+
+    def __init__(self, consumer, channel, delivery_tag, parts, routing_key="", retries=0):
+        self.consumer = consumer
+        self.channel = channel
+        self.delivery_tag = delivery_tag
+        self.routing_key = routing_key
+        self.retries = retries
+        self._pending = parts
+        self._failed = False
+        self._requeue = False
+        self._lock = threading.Lock()
+
+    def settle(self, ok=True, requeue=False):
+        with self._lock:
+            self._pending -= 1
+            self._failed = self._failed or not ok
+            self._requeue = self._requeue or requeue
+            if self._pending > 0:
+                return
+        self.consumer.settle(self, not self._failed, self._requeue)
+
+
+class ODMessage(dict):
+    """
+    A detection message as put on the in-process queue: a plain dict that
+    remembers the delivery it came from. Mutating it (e.g. replacing "data")
+    keeps the link, so it can be acked after VLM processing.
+    """
+
+    def __init__(self, message, delivery=None):
+        super().__init__(message)
+        self._delivery = delivery
+        self._settled = False
+        # As received, for republishing after the pipeline has rewritten "data"
+        self._body = json.dumps(message) if delivery is not None else None
+
+    def ack(self):
+        self._settle(True, False)
+
+    def nack(self, requeue=False):
+        self._settle(False, requeue)
+
+    def retry(self, error=""):
+        """
+        Settle a message whose processing failed so it is tried again.
+
+        Only this message is republished (with its retry count), not the
+        BATCH delivery it came in; after MAX_RETRIES it is dead-lettered.
+        """
+        if self._settled or self._delivery is None:
+            return
+        self._settled = True
+        delivery = self._delivery
+        if delivery.retries < MAX_RETRIES:
+            delivery.consumer.republish(delivery, self._body, delivery.retries + 1, error)
+        else:
+            delivery.consumer.dead_letter(delivery, self._body, error)
+
+    def _settle(self, ok, requeue):
+        if self._settled or self._delivery is None:
+            return
+        self._settled = True
+        self._delivery.settle(ok, requeue)
+
+
+def ack_message(message):
+    """Ack the delivery behind a message; a no-op for messages that did not come from RabbitMQ."""
+    if isinstance(message, ODMessage):
+        message.ack()
+
+
+def nack_message(message, requeue=False):
+    """Reject the delivery behind a message (dead-lettered or dropped unless requeue)."""
+    if isinstance(message, ODMessage):
+        message.nack(requeue)
+
+
+def retry_message(message, error=""):
+    """Retry a message that failed processing, up to MAX_RETRIES times, then dead-letter it."""
+    if isinstance(message, ODMessage):
+        message.retry(error)
+
+
 class ODConsumer:
-    def __init__(self,message_queue,user_name, password):
-        self.message_queue = message_queue 
+    """
+    Asynchronous object-detection consumer on a pika SelectConnection.
+
+    Runs the connection's IO loop on a daemon thread with manual acks and a
+    basic_qos prefetch window. Messages are put on message_queue as
+    ODMessage dicts; the pipeline acks them (ack_message) after the VLM
+    result is published, from any thread. Unacked messages are redelivered
+    if the process dies or the connection drops, so delivery is
+    at-least-once. The connection is re-established after a failure.
+    A message the pipeline fails on is republished with an x-retry-count
+    header (retry_message) and moved to DEAD_LETTER_QUEUE after MAX_RETRIES.
+
+    With worker_count > 1 several consumers compete for the queue. The one
+    that receives STREAM_END re-broadcasts it on the control exchange, naming
+    itself aggregator, so every worker ends its share of the run; WORKER_DONE
+    messages from the workers are passed to on_worker_done.
+    """
+
+    def __init__(self,message_queue,user_name, password, prefetch_count=PREFETCH_COUNT,
+                 worker_count=VLM_WORKER_COUNT, worker_id=VLM_WORKER_ID, on_worker_done=None):
+        self.message_queue = message_queue
         self.user_name = user_name
         self.password = password
+        self.prefetch_count = prefetch_count
+        self.worker_count = worker_count
+        self.worker_id = worker_id
+        self.on_worker_done = on_worker_done
+        self._connection = None
+        self._channel = None
+        self._control_queue = None
+        self._stopping = False
 
-    # RabbitMQ consumer running in background
-    def rabbitmq_consumer(self):
-        connection = get_rabbitmq_connection(self.user_name, self.password)
-        channel = connection.channel()
-        channel.queue_declare(queue="object_detection", durable=True)
+    @property
+    def scaled_out(self):
+        return self.worker_count > 1
+
+    # ------------------------------------------------------------------
+    # Connection / channel setup (IO loop thread)
+    # ------------------------------------------------------------------
+
+    def _connect(self):
+        return pika.SelectConnection(
+            get_connection_parameters(self.user_name, self.password),
+            on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_open_error,
+            on_close_callback=self._on_connection_closed,
+        )
+
+    def _on_connection_open(self, connection):
+        logger.info("OD Consumer - RabbitMQ connection established.")
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, err):
+        logger.info(f"OD Consumer - Waiting for RabbitMQ... ({err})")
+        connection.ioloop.stop()
 
-        def callback(ch, method, properties, body):
+    def _on_connection_closed(self, connection, reason):
+        self._channel = None
+        if not self._stopping:
+            logger.warning(f"OD Consumer - RabbitMQ connection closed, reconnecting: {reason}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.basic_qos(prefetch_count=self.prefetch_count, callback=self._on_qos_ok)
+
+    def _on_channel_closed(self, channel, reason):
+        logger.warning(f"OD Consumer - Channel closed: {reason}")
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+
+    def _on_qos_ok(self, _frame):
+        self._channel.exchange_declare(exchange=EXCHANGE_NAME, exchange_type="topic", durable=True,
+                                       callback=self._on_exchange_ok)
+
+    def _on_exchange_ok(self, _frame):
+        self._channel.queue_declare(queue=QUEUE_NAME, durable=True, callback=self._on_queue_ok)
+
+    def _on_queue_ok(self, _frame):
+        self._channel.queue_declare(queue=DEAD_LETTER_QUEUE, durable=True, callback=self._on_dead_letter_queue_ok)
+
+    def _on_dead_letter_queue_ok(self, _frame):
+        self._channel.queue_bind(queue=QUEUE_NAME, exchange=EXCHANGE_NAME, routing_key=ROUTING_KEY_PATTERN,
+                                 callback=self._on_bind_ok)
+
+    def _on_bind_ok(self, _frame):
+        if not self.scaled_out:
+            self._start_consuming()
+            return
+        self._channel.exchange_declare(exchange=CONTROL_EXCHANGE_NAME, exchange_type="fanout", durable=True,
+                                       callback=self._on_control_exchange_ok)
+
+    def _on_control_exchange_ok(self, _frame):
+        # Private queue per worker, gone with its connection
+        self._channel.queue_declare(queue="", exclusive=True, auto_delete=True, callback=self._on_control_queue_ok)
+
+    def _on_control_queue_ok(self, frame):
+        self._control_queue = frame.method.queue
+        self._channel.queue_bind(queue=self._control_queue, exchange=CONTROL_EXCHANGE_NAME,
+                                 callback=self._on_control_bind_ok)
+
+    def _on_control_bind_ok(self, _frame):
+        self._channel.basic_consume(queue=self._control_queue, on_message_callback=self._on_control, auto_ack=True)
+        self._start_consuming()
+
+    def _start_consuming(self):
+        self._channel.basic_consume(queue=QUEUE_NAME, on_message_callback=self._on_message, auto_ack=False)
+        logger.info(f"OD Consumer - Worker {self.worker_id} ({self.worker_count} total) consuming {QUEUE_NAME} "
+                    f"with prefetch {self.prefetch_count}")
+
+    # ------------------------------------------------------------------
+    # Messages
+    # ------------------------------------------------------------------
+
+    def _on_message(self, channel, method, properties, body):
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            logger.error(f"OD Consumer - Dead-lettering undecodable {method.routing_key} message: {e}")
+            self._publish_dead_letter(channel, body, method.routing_key, 0, str(e))
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            return
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        logger.info(f"OD Consumer - Received {method.routing_key} message at {timestamp}: {payload}")
+        if self.scaled_out and payload.get("msg_type") == "STREAM_END":
+            # Detections before it were dispatched to this and the other workers already;
+            # every worker (this one included) gets the end of the run through the control exchange
+            payload["aggregator"] = self.worker_id
+            channel.basic_publish(exchange=CONTROL_EXCHANGE_NAME, routing_key="", body=json.dumps(payload))
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            logger.info(f"OD Consumer - Broadcast STREAM_END for run {payload.get('run_id')} to all workers")
+            return
+        # The publisher batches small events into a single BATCH message
+        if payload.get("msg_type") == "BATCH":
+            messages = payload.get("data", {}).get("messages", [])
+        else:
+            messages = [payload]
+        if not messages:
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            return
+        retries = int(((properties.headers if properties else None) or {}).get(RETRY_HEADER, 0))
+        delivery = Delivery(self, channel, method.delivery_tag, len(messages), method.routing_key, retries)
+        for message in messages:
+            self.message_queue.put(ODMessage(message, delivery), block=False)
+
+    def _on_control(self, channel, method, properties, body):
+        try:
             payload = json.loads(body)
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            logger.info(f"OD Consumer - Received object_detection message at {timestamp}: {payload}")
-            self.message_queue.put(json.dumps(payload),block=False)
+        except ValueError as e:
+            logger.error(f"OD Consumer - Dropping undecodable control message: {e}")
+            return
+        msg_type = payload.get("msg_type")
+        if msg_type == "STREAM_END":
+            # Queued behind every detection this worker has been delivered
+            self.message_queue.put(ODMessage(payload), block=False)
+        elif msg_type == "WORKER_DONE" and self.on_worker_done is not None:
+            self.on_worker_done(payload)
 
+    def publish_control(self, message, timeout=10.0):
+        """Publish a message on the control exchange from any thread; True once it was handed to the broker."""
+        connection = self._connection
+        if connection is None or not connection.is_open:
+            logger.error(f"OD Consumer - Cannot publish {message.get('msg_type')}: no connection")
+            return False
+        published = threading.Event()
+
+        def publish_on_loop():
+            if self._channel is not None and self._channel.is_open:
+                self._channel.basic_publish(exchange=CONTROL_EXCHANGE_NAME, routing_key="", body=json.dumps(message))
+                published.set()
+
+        connection.ioloop.add_callback_threadsafe(publish_on_loop)
+        return published.wait(timeout)
+
+    def republish(self, delivery, body, retries, error=""):
+        """Publish one failed message again with its retry count, then settle its part of the delivery."""
+        def republish_on_loop():
+            if not delivery.channel.is_open:
+                logger.warning(f"OD Consumer - Channel gone, delivery {delivery.delivery_tag} will be redelivered")
+                return
+            delivery.channel.basic_publish(
+                exchange=EXCHANGE_NAME, routing_key=delivery.routing_key, body=body,
+                properties=pika.BasicProperties(delivery_mode=2, content_type="application/json",
+                                                headers={RETRY_HEADER: retries}),
+            )
+            logger.warning(f"OD Consumer - Retrying {delivery.routing_key} message ({retries}/{MAX_RETRIES}): {error}")
+            delivery.settle(True)
+
+        self._on_loop(delivery, republish_on_loop)
+
+    def dead_letter(self, delivery, body, error=""):
+        """Move one message that kept failing to DEAD_LETTER_QUEUE, then settle its part of the delivery."""
+        def dead_letter_on_loop():
+            if not delivery.channel.is_open:
+                logger.warning(f"OD Consumer - Channel gone, delivery {delivery.delivery_tag} will be redelivered")
+                return
+            self._publish_dead_letter(delivery.channel, body, delivery.routing_key, delivery.retries, error)
+            delivery.settle(True)
+
+        self._on_loop(delivery, dead_letter_on_loop)
+
+    def _publish_dead_letter(self, channel, body, routing_key, retries, error):
+        channel.basic_publish(
+            exchange="", routing_key=DEAD_LETTER_QUEUE, body=body,
+            properties=pika.BasicProperties(delivery_mode=2, headers={RETRY_HEADER: retries,
+                                                                      "x-routing-key": routing_key,
+                                                                      "x-error": str(error)[:1000]}),
+        )
+        logger.error(f"OD Consumer - {routing_key} message failed {retries} retries, moved to {DEAD_LETTER_QUEUE}: {error}")
+
+    def _on_loop(self, delivery, callback):
+        """Run callback on the IO loop; if the connection is gone the broker redelivers the delivery anyway."""
+        connection = self._connection
+        if connection is None or not connection.is_open:
+            logger.warning(f"OD Consumer - Connection gone, delivery {delivery.delivery_tag} will be redelivered")
+            return
+        connection.ioloop.add_callback_threadsafe(callback)
+
+    def settle(self, delivery, ok, requeue=False):
+        """Ack or nack a delivery from any thread; runs on the IO loop."""
+        def settle_on_loop():
+            if not delivery.channel.is_open:
+                # Delivery tags die with their channel; the broker has already requeued it
+                logger.warning(f"OD Consumer - Channel gone, delivery {delivery.delivery_tag} will be redelivered")
+                return
+            if ok:
+                delivery.channel.basic_ack(delivery_tag=delivery.delivery_tag)
+            else:
+                delivery.channel.basic_nack(delivery_tag=delivery.delivery_tag, requeue=requeue)
+
+        self._on_loop(delivery, settle_on_loop)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    # RabbitMQ consumer running in background
+    def rabbitmq_consumer(self):
+        while not self._stopping:
+            try:
+                self._connection = self._connect()
+                self._connection.ioloop.start()
+            except Exception as e:
+                logger.error(f"OD Consumer - Consumer loop error: {e}")
+            if not self._stopping:
+                time.sleep(RECONNECT_DELAY_SEC)
 
-        channel.basic_consume(queue="object_detection", on_message_callback=callback, auto_ack=True)
-        channel.start_consuming()
-        
     def start_consumer(self):
-        threading.Thread(target=self.rabbitmq_consumer, daemon=True).start()
-        
-        
+        threading.Thread(target=self.rabbitmq_consumer, name="od-consumer", daemon=True).start()
+
+    def stop(self):
+        self._stopping = True
+        connection = self._connection
+        if connection is not None and connection.is_open:
+            connection.ioloop.add_callback_threadsafe(connection.close)
@@ -0,0 +1,89 @@
+"""
+Result aggregation for a scaled-out VLM consumer.
+
+Each worker publishes WORKER_DONE with its own OD / VLM / agent results once
+it has drained its share of a run. The worker that received the run's
+STREAM_END collects them and writes one file per run, grouped by stream id.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict
+
+from utils.config import logger, RUN_RESULTS_DIR_FULL_PATH
+
+
+class RunAggregator:
+    """Collects WORKER_DONE messages per run_id; add() is called from the consumer thread."""
+
+    def __init__(self):
+        self._parts = defaultdict(dict)  # run_id -> worker_id -> data
+        self._cond = threading.Condition()
+
+    def add(self, message: dict):
+        run_id = message.get("run_id") or "default"
+        worker_id = message.get("worker_id", "unknown")
+        with self._cond:
+            self._parts[run_id][worker_id] = message.get("data", {})
+            received = len(self._parts[run_id])
+            self._cond.notify_all()
+        logger.info(f"Run {run_id}: results from worker {worker_id} ({received} received)")
+
+    def wait(self, run_id: str, expected: int, timeout: float) -> Dict[str, dict]:
+        """
+        Block until `expected` workers reported for run_id or the timeout expires.
+
+        Returns:
+            dict: worker_id -> that worker's results (possibly fewer than expected)
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._parts[run_id]) < expected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"Run {run_id}: only {len(self._parts[run_id])}/{expected} worker(s) "
+                                   f"reported within {timeout:.0f}s")
+                    break
+                self._cond.wait(remaining)
+            return dict(self._parts.pop(run_id, {}))
+
+
+def merge_worker_results(run_id: str, parts: Dict[str, dict], expected: int) -> dict:
+    """
+    Merge per-worker results into one record for the run, keyed by stream id.
+
+    Args:
+        run_id: Run the results belong to
+        parts: worker_id -> {"od_results": [...], "vlm_results": [...], "agent_results": [...], "status": {...}}
+        expected: Number of workers that should have reported
+
+    Returns:
+        dict: {"run_id", "workers", "missing_workers", "status", "streams": {stream_id: {...}}}
+    """
+    streams = defaultdict(lambda: {"od_results": [], "vlm_results": [], "agent_results": []})
+    for worker_id in sorted(parts):
+        for kind in ("od_results", "vlm_results", "agent_results"):
+            for record in parts[worker_id].get(kind, []):
+                if isinstance(record, dict):
+                    streams[record.get("stream_id", "default")][kind].append(record)
+    return {
+        "run_id": run_id,
+        "workers": sorted(parts),
+        "missing_workers": max(0, expected - len(parts)),
+        "status": {worker_id: part.get("status", {}) for worker_id, part in parts.items()},
+        "streams": dict(streams),
+    }
+
+
+def write_run_results(summary: dict, directory: str = RUN_RESULTS_DIR_FULL_PATH) -> str:
+    """Write the merged results to <directory>/run_<run_id>.json atomically and return the path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"run_{summary['run_id']}.json")
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, path)
+    logger.info(f"Run {summary['run_id']}: aggregated results → {path}")
+    return path
@@ -4,6 +4,9 @@ import subprocess
 from pathlib import Path
 import json
 import io
+import threading
+import time
+from collections import OrderedDict
 from typing import Tuple
 from utils.config import MINIO_HOST, logger
 from datetime import timedelta
@@ -16,6 +19,51 @@ MINIO_API_HOST_PORT=os.environ.get("MINIO_API_HOST_PORT",4000)
 MINIO_CONSOLE_HOST_PORT=os.environ.get("MINIO_CONSOLE_HOST_PORT",4001)
 MINIO_HOST=f"{os.environ.get('LP_IP','localhost')}:{MINIO_API_HOST_PORT}"
 
+PRESIGNED_URL_EXPIRY = timedelta(minutes=15)
+# Cached URLs are regenerated this long before they expire
+PRESIGNED_URL_REFRESH_MARGIN_SEC = int(os.environ.get("PRESIGNED_URL_REFRESH_MARGIN_SEC", "120"))
+PRESIGNED_URL_CACHE_SIZE = 4096
+
+# Buckets known to exist; forgotten again on a NoSuchBucket error
+_known_buckets = set()
+# (bucket, path) -> (url, refresh_at); refresh_at is on the monotonic clock
+_presigned_urls = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def ensure_bucket(client, bucket_name: str, create: bool = False) -> bool:
+    """
+    Check (once per process) that a bucket exists, optionally creating it.
+
+    Returns:
+        bool: True if the bucket exists
+    """
+    if bucket_name in _known_buckets:
+        return True
+    if not client.bucket_exists(bucket_name):
+        if not create:
+            return False
+        client.make_bucket(bucket_name)
+        logger.info(f"Created bucket: {bucket_name}")
+    with _cache_lock:
+        _known_buckets.add(bucket_name)
+    return True
+
+
+def forget_bucket(bucket_name: str):
+    """Drop a bucket from the existence cache, and its cached presigned URLs, e.g. after a NoSuchBucket error."""
+    with _cache_lock:
+        _known_buckets.discard(bucket_name)
+        for key in [key for key in _presigned_urls if key[0] == bucket_name]:
+            del _presigned_urls[key]
+
+
+def _forget_missing_bucket(error, bucket_name: str):
+    """forget_bucket() if a MinIO error says the bucket is gone."""
+    if getattr(error, "code", None) == "NoSuchBucket":
+        logger.warning(f"Bucket '{bucket_name}' no longer exists, dropping its cached state")
+        forget_bucket(bucket_name)
+
 def get_presigned_url( file_path: str, bucket_name: str) -> str:
     """
     Generate a presigned URL for accessing a file in MinIO.
@@ -44,18 +92,33 @@ def get_presigned_url( file_path: str, bucket_name: str) -> str:
         if not file_path:
             logger.error("File path was empty")
             return ""
+        cache_key = (bucket_name, file_path)
+        now = time.monotonic()
+        with _cache_lock:
+            cached = _presigned_urls.get(cache_key)
+            if cached and now < cached[1]:
+                _presigned_urls.move_to_end(cache_key)
+                return cached[0]
+
         # Check if bucket exists
-        if not client.bucket_exists(bucket_name):
+        if not ensure_bucket(client, bucket_name):
             logger.error(f"Bucket '{bucket_name}' does not exist")
             return ""
 
-        # Generate presigned URL
-        url = client.presigned_get_object(bucket_name, file_path, expires=timedelta(minutes=15))
+        # Generate presigned URL (local signing, no round trip)
+        url = client.presigned_get_object(bucket_name, file_path, expires=PRESIGNED_URL_EXPIRY)
+        refresh_at = now + PRESIGNED_URL_EXPIRY.total_seconds() - PRESIGNED_URL_REFRESH_MARGIN_SEC
+        with _cache_lock:
+            _presigned_urls[cache_key] = (url, refresh_at)
+            _presigned_urls.move_to_end(cache_key)
+            while len(_presigned_urls) > PRESIGNED_URL_CACHE_SIZE:
+                _presigned_urls.popitem(last=False)
         logger.info(f"Generated presigned URL for {bucket_name}/{file_path}")
         return url
 
     except S3Error as e:
         logger.error(f"MinIO S3 error while generating presigned URL: {e}")
+        _forget_missing_bucket(e, bucket_name)
         return ""
     except Exception as e:
         import traceback
@@ -119,9 +182,7 @@ def save_to_minio(use_case:str, data_type: str, data, bucket: str = None) -> Tup
 
     try:
         # Ensure bucket exists
-        if not client.bucket_exists(target_bucket):
-            client.make_bucket(target_bucket)
-            logger.info(f"Created bucket: {target_bucket}")
+        ensure_bucket(client, target_bucket, create=True)
 
         # Validate and process data based on type
         if data_type.lower() == 'json':
@@ -174,6 +235,7 @@ def save_to_minio(use_case:str, data_type: str, data, bucket: str = None) -> Tup
 
     except S3Error as e:
         logger.error(f"MinIO S3 error: {e}")
+        _forget_missing_bucket(e, target_bucket)
         return False, str(e)
     except Exception as e:
         logger.error(f"Exception while saving to MinIO: {e}")
@@ -201,31 +263,45 @@ def get_order_json_from_minio(order_id: str, bucket: str = None) -> dict:
         logger.error(f"Failed to fetch {filename} from {target_bucket}: {e}")
         return {"error": f"Failed to fetch order: {e}"}
     
-def get_frames_from_minio(minio_path,bucket_name=None) -> dict:
+class FrameFetchError(Exception):
+    """A frame could not be read from MinIO."""
+
+    def __init__(self, message, key=None, bucket=None):
+        super().__init__(message)
+        self.key = key
+        self.bucket = bucket
+
+
+def get_frames_from_minio(minio_path,bucket_name=None) -> bytes:
     """
-    Download and return the JSON (excluding video_id) from MinIO for the given order_id.
+    Download a frame image from MinIO.
+
+    Returns:
+        bytes: Encoded image
+
+    Raises:
+        FrameFetchError: If the client is unavailable or the object cannot be read
     """
     client = get_minio_client()
+    # Use provided bucket or default to MINIO_BUCKET
+    target_bucket = bucket_name if bucket_name else MINIO_BUCKET
     if client is None:
-        logger.error("MinIO client not available")
-        return {"error": "MinIO client not available"}
+        raise FrameFetchError("MinIO client not available", minio_path, target_bucket)
     if not minio_path:
-        logger.error("No minio_path provided")
-        return {"error": "No minio_path provided"}
-
-    # Use provided bucket or default to MINIO_BUCKET
-    target_bucket = bucket_name if bucket_name is not None else MINIO_BUCKET
+        raise FrameFetchError("No minio_path provided", minio_path, target_bucket)
 
+    response = None
     try:
         response = client.get_object(target_bucket, minio_path)
-        image_bytes = response.read()
-        response.close()
-        response.release_conn()
-        return image_bytes
-    
+        return response.read()
     except Exception as e:
         logger.error(f"Failed to fetch {minio_path} from {target_bucket}: {e}")
-        return {"error": f"Failed to fetch order: {e}"}
+        _forget_missing_bucket(e, target_bucket)
+        raise FrameFetchError(f"Failed to fetch {minio_path} from {target_bucket}: {e}", minio_path, target_bucket) from e
+    finally:
+        if response is not None:
+            response.close()
+            response.release_conn()
 
 def get_video_url_from_minio(video_id: str, bucket: str = None) -> str:
     """
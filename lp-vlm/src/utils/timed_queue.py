@@ -0,0 +1,23 @@
+import queue
+import time
+
+
+class TimedQueue(queue.Queue):
+    """queue.Queue that stamps items on put() so consumers can measure queue-wait time.
+
+    get() behaves like queue.Queue.get(); get_timed() also returns the seconds
+    the item spent in the queue.
+    """
+
+    def _put(self, item):
+        self.queue.append((time.monotonic(), item))
+
+    def _get(self):
+        return self.queue.popleft()
+
+    def get(self, block=True, timeout=None):
+        return self.get_timed(block, timeout)[0]
+
+    def get_timed(self, block=True, timeout=None):
+        enqueued_at, item = super().get(block, timeout)
+        return item, time.monotonic() - enqueued_at
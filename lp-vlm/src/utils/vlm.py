@@ -1,16 +1,21 @@
 """Vision Language Model integration for grocery item detection."""
 import json
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Tuple
 from io import BytesIO
+import itertools
 import os
+import threading
 import time
 import numpy as np
 from PIL import Image
-import requests
 from pathlib import Path
-from utils.config import OVMS_ENDPOINT, OVMS_MODEL_NAME, logger
+from utils.config import OVMS_ENDPOINT, OVMS_MODEL_NAME, VLM_STREAMING, VLM_STRUCTURED_OUTPUT, logger
 from utils.prompts import *
+from utils.prompt_builder import record_prompt_usage
 from utils.ovms_client import OVMSVLMClient
+from utils.http_session import get_http_session
+from utils.vlm_cache import get_vlm_cache, image_phash
+from utils.frame_fetcher import get_frame_fetcher, FrameFetchError
 from vlm_metrics_logger import (
     get_logger,
     log_start_time,
@@ -20,13 +25,21 @@ from vlm_metrics_logger import (
 
 WORKLOAD_PIPELINE_CONFIG = "/app/lp/configs/"
 TARGET_WORKLOAD = "lp_vlm"  # normalized compare
+VLM_IMAGE_SIZE = (640, 360)
 
 _ovms_client = None
+_ovms_client_lock = threading.Lock()
+# Disambiguates metric ids of concurrent calls started in the same millisecond
+_request_seq = itertools.count()
 
 
 def get_ovms_client():
     global _ovms_client
-    if _ovms_client is None:
+    if _ovms_client is not None:
+        return _ovms_client
+    with _ovms_client_lock:
+        if _ovms_client is not None:
+            return _ovms_client
         try:
             raw_model_name, _, _ = get_vlm_model_from_workload()
         except Exception as e:
@@ -43,15 +56,34 @@ def get_ovms_client():
             model_name=model_name,
             max_new_tokens=max_tokens,
             temperature=0.0,
+            streaming=VLM_STREAMING,
+            structured_output=VLM_STRUCTURED_OUTPUT,
         )
     return _ovms_client
 
 
-def extract_prompt_and_images(frame_records: Dict[str, Any], use_case: str = None) -> Tuple[str, list[np.ndarray]]:
+def prepare_image_bytes(data: bytes, size: Tuple[int, int] = VLM_IMAGE_SIZE) -> bytes:
+    """
+    Fit an encoded frame to the VLM input size with at most one decode/encode.
+
+    JPEGs already at the target size are returned untouched; larger JPEGs are
+    decoded with DCT scaling (draft) before the final resize.
+    """
+    img = Image.open(BytesIO(data))
+    if img.format == "JPEG" and img.size == size and img.mode == "RGB":
+        return data
+    img.draft("RGB", size)
+    img = img.convert("RGB").resize(size)
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=82)
+    return buffer.getvalue()
+
+
+def extract_prompt_and_images(frame_records: Dict[str, Any], use_case: str = None) -> Tuple[str, list]:
     """Extract prompt and images from frame_records."""
     # Select prompt based on use_case
     if use_case == "decision_agent":
-        prompt = AGENT_PROMPT
+        prompt = None
     else:
         # Use dynamic inventory-aware prompt if provided, otherwise fall back to generic
         dynamic_prompt = frame_records.get("dynamic_prompt")
@@ -61,18 +93,27 @@ def extract_prompt_and_images(frame_records: Dict[str, Any], use_case: str = Non
     
     # Extract images based on frame_records format
     if use_case == "decision_agent":
-        # For decision_agent, append the JSON data to prompt
-        prompt = f"{prompt}\nInput {json.dumps(frame_records.get('items', {}), indent=4)}"
+        # For decision_agent, the item goes after the shared AGENT_PROMPT prefix
+        prompt = generate_agent_prompt(frame_records.get("items", {}))
+    elif frame_records.get("frame_path"):
+        # Direct path: one (usually prefetched) MinIO read, one decode, JPEG bytes handed to OVMS as-is
+        frame_path = frame_records["frame_path"]
+        try:
+            frame_bytes = get_frame_fetcher().get(frame_path, frame_records.get("bucket") or None)
+            images.append(prepare_image_bytes(frame_bytes))
+            logger.info(f"Successfully loaded image {frame_path}")
+        except FrameFetchError as e:
+            logger.error(f"Failed to load image {frame_path}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Failed to decode image {frame_path}: {str(e)}")
     else:
-        # Extract image from presigned_url
+        # Legacy path: extract image from presigned_url
         presigned_url = frame_records.get("presigned_url", "")
         if presigned_url:
             try:
-                response = requests.get(presigned_url, timeout=30)
+                response = get_http_session().get(presigned_url, timeout=30)
                 response.raise_for_status()
-                img = Image.open(BytesIO(response.content)).convert("RGB")
-                img = img.resize((640, 360))
-                images.append(np.array(img))
+                images.append(prepare_image_bytes(response.content))
                 logger.info(f"Successfully loaded image from {presigned_url}")
             except Exception as e:
                 logger.error(f"Failed to load image from {presigned_url}: {str(e)}")
@@ -80,6 +121,77 @@ def extract_prompt_and_images(frame_records: Dict[str, Any], use_case: str = Non
     return prompt, images
 
 
+def _cache_lookup(prompt, images, unique_id, bbox=None):
+    """
+    Look up a prompt/images pair in the result cache.
+
+    The key hashes the item's bounding box region of each image. Without a
+    bbox (legacy publishers, consumer-side best-frame scoring) the call is
+    not cached: a whole-frame hash cannot tell two products apart on the
+    same checkout background.
+
+    Returns:
+        (cache, cache_key, cached_result); cache is None for text-only calls,
+        calls without a bbox, or when caching is disabled.
+    """
+    cache = get_vlm_cache() if images and bbox else None
+    if cache is None:
+        return None, None, None
+    cache_key = "|".join(image_phash(img, bbox) for img in images)
+    cached = cache.get(prompt, cache_key)
+    stats = cache.stats()
+    get_logger().log_custom_event(
+        "ovms_vlm_cache_hit" if cached is not None else "ovms_vlm_cache_miss",
+        "USECASE_2",
+        unique_id,
+        hits=stats["hits"],
+        misses=stats["misses"],
+        hit_rate=stats["hit_rate"],
+    )
+    if cached is not None:
+        logger.info(f"vlm Script - Cache hit (hit rate {stats['hit_rate']:.2%})")
+    return cache, cache_key, cached
+
+
+def _log_generation_metrics(application_name, unique_id, output, elapsed, **extra):
+    """Log OVMS latency/token metrics for one generate() call."""
+    metrics_logger = get_logger()
+    logger.info("VLM call completed in %.2f seconds", elapsed)
+    usage = getattr(output, "usage", {}) or {}
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    total_latency = getattr(output, "total_latency", elapsed)
+    generated_tokens = completion_tokens
+    ttft = getattr(output, "ttft", None)
+    tpot = getattr(output, "tpot", None)
+    if tpot is None:
+        tpot = (total_latency / generated_tokens) if generated_tokens > 0 else 0.0
+    throughput_mean = (generated_tokens / total_latency) if total_latency > 0 else 0.0
+
+    vlm_metrics_result = {
+        "Generate_Duration_Mean": total_latency,
+        "generated_tokens": generated_tokens,
+        "tpot_sec": tpot,
+        "throughput_mean_sec": throughput_mean,
+    }
+    log_ovms_performance_metric(application_name, vlm_metrics_result)
+    metrics_logger.log_custom_event(
+        "ovms_vlm_request",
+        application_name,
+        unique_id,
+        generated_tokens=generated_tokens,
+        total_latency_sec=total_latency,
+        tpot_sec=tpot,
+        throughput_mean=throughput_mean,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        ttft_sec=ttft,
+        stopped_early=getattr(output, "stopped_early", False),
+        structured_output=getattr(output, "structured", False),
+        **extra,
+    )
+
+
 def call_vlm(
     frame_records: Dict[str, Any],
     seed: int = 0,
@@ -92,7 +204,7 @@ def call_vlm(
     try:
         _ = seed  # kept for API compatibility with existing callers
         start_time = time.time()
-        unique_id = f"{use_case or 'default'}_{int(start_time * 1000)}"
+        unique_id = f"{use_case or 'default'}_{int(start_time * 1000)}_{next(_request_seq)}"
         log_start_time(application_name, unique_id)
         metrics_logger.log_custom_event("ovms_vlm_call_started", application_name, unique_id, use_case=use_case or "default")
         logger.info("Making ovms VLM call...")
@@ -105,38 +217,19 @@ def call_vlm(
             log_end_time(application_name, unique_id)
             return False, {}, "No images extracted from frame_records"
 
+        # Same prompt + (near-)identical image -> reuse the previous answer
+        cache, cache_key, cached = _cache_lookup(prompt, images, unique_id, frame_records.get("bbox"))
+        if cached is not None:
+            log_end_time(application_name, unique_id)
+            return True, cached, ""
+
         vlm = get_ovms_client()
 
-        output = vlm.generate(prompt, images=images, unique_id=unique_id)
+        output = vlm.generate(prompt, images=images, unique_id=unique_id,
+                              response_format=get_response_format(response_schema_name(use_case)))
         
-        elapsed = time.time() - start_time
-        logger.info("VLM call completed in %.2f seconds", elapsed)
-        usage = getattr(output, "usage", {}) or {}
-        prompt_tokens = usage.get("prompt_tokens", 0)
-        completion_tokens = usage.get("completion_tokens", 0)
-        total_latency = getattr(output, "total_latency", elapsed)
-        generated_tokens = completion_tokens
-        tpot = (total_latency / generated_tokens) if generated_tokens > 0 else 0.0
-        throughput_mean = (generated_tokens / total_latency) if total_latency > 0 else 0.0
-
-        vlm_metrics_result = {
-            "Generate_Duration_Mean": total_latency,
-            "generated_tokens": generated_tokens,
-            "tpot_sec": tpot,
-            "throughput_mean_sec": throughput_mean,
-        }
-        log_ovms_performance_metric(application_name, vlm_metrics_result)
-        metrics_logger.log_custom_event(
-            "ovms_vlm_request",
-            application_name,
-            unique_id,
-            generated_tokens=generated_tokens,
-            total_latency_sec=total_latency,
-            tpot_sec=tpot,
-            throughput_mean=throughput_mean,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-        )
+        _log_generation_metrics(application_name, unique_id, output, time.time() - start_time)
+        record_prompt_usage(prompt, getattr(output, "usage", None), len(images), unique_id)
         
         # Parse the output
         if hasattr(output, 'texts') and output.texts:
@@ -151,6 +244,8 @@ def call_vlm(
                     parsed = json.loads(json_str)
                     logger.info(f"vlm Script - [call_vlm] Successfully parsed JSON from extracted string: {parsed}")
                     metrics_logger.log_custom_event("ovms_vlm_call_success", application_name, unique_id, response_format="json_array_extracted")
+                    if cache is not None:
+                        cache.put(prompt, cache_key, parsed)
                     log_end_time(application_name, unique_id)
                     return True, parsed, ""
                 except Exception as e:
@@ -163,6 +258,8 @@ def call_vlm(
             try:
                 parsed = json.loads(raw_text)
                 metrics_logger.log_custom_event("ovms_vlm_call_success", application_name, unique_id, response_format="json_raw")
+                if cache is not None:
+                    cache.put(prompt, cache_key, parsed)
                 log_end_time(application_name, unique_id)
                 return True, parsed, ""
             except Exception as e:
@@ -184,6 +281,116 @@ def call_vlm(
         return False, None, error_msg
 
 
+def _split_batch_output(raw_text: str, count: int):
+    """Group an item-indexed JSON array into one result list per input index."""
+    json_start = raw_text.find('[')
+    json_end = raw_text.rfind(']')
+    if json_start == -1 or json_end <= json_start:
+        raise ValueError("no JSON array in batch response")
+    parsed = json.loads(raw_text[json_start:json_end + 1])
+    grouped = [[] for _ in range(count)]
+    for entry in parsed:
+        if not isinstance(entry, dict):
+            continue
+        entry = dict(entry)
+        try:
+            index = int(entry.pop("index"))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if 0 <= index < count:
+            grouped[index].append(entry)
+    return grouped
+
+
+def call_vlm_batch(
+    frame_records_list: List[Dict[str, Any]],
+    use_case: str = None,
+) -> List[Tuple[bool, Any, str]]:
+    """
+    Analyze several items with one OVMS request.
+
+    Image items are sent as numbered images with a combined prompt; for
+    use_case="decision_agent" the item names are validated in one prompt.
+    The model answers with one JSON array whose objects carry the item
+    "index". Cached items are answered without the request. If the
+    combined answer cannot be parsed each item falls back to call_vlm, and
+    so does any item the answer has no entries for.
+
+    Returns:
+        list of (valid, result, error) in input order
+    """
+    if len(frame_records_list) == 1:
+        return [call_vlm(frame_records_list[0], use_case=use_case)]
+
+    application_name = "USECASE_2"
+    start_time = time.time()
+    unique_id = f"{use_case or 'default'}_batch_{int(start_time * 1000)}_{next(_request_seq)}"
+    log_start_time(application_name, unique_id)
+    outcomes = [None] * len(frame_records_list)
+
+    try:
+        pending = []  # (index, prompt or item name, images, cache, cache_key)
+        for index, frame_records in enumerate(frame_records_list):
+            if use_case == "decision_agent":
+                pending.append((index, frame_records.get("items", ""), [], None, None))
+                continue
+            prompt, images = extract_prompt_and_images(frame_records, use_case)
+            if not images:
+                outcomes[index] = (False, {}, "No images extracted from frame_records")
+                continue
+            cache, cache_key, cached = _cache_lookup(prompt, images, f"{unique_id}_{index}", frame_records.get("bbox"))
+            if cached is not None:
+                outcomes[index] = (True, cached, "")
+                continue
+            pending.append((index, prompt, images, cache, cache_key))
+
+        if pending:
+            if use_case == "decision_agent":
+                prompt = generate_agent_batch_prompt([entry[1] for entry in pending])
+            else:
+                prompt = generate_batch_prompt([entry[1] for entry in pending])
+            images = [img for entry in pending for img in entry[2]]
+
+            logger.info(f"Making batched ovms VLM call for {len(pending)} item(s)...")
+            output = get_ovms_client().generate(prompt, images=images, unique_id=unique_id,
+                                                response_format=get_response_format(response_schema_name(use_case, batch=True)))
+            _log_generation_metrics(application_name, unique_id, output, time.time() - start_time,
+                                    batch_size=len(pending))
+            record_prompt_usage(prompt, getattr(output, "usage", None), len(images), unique_id)
+            raw_text = output.texts[0] if getattr(output, "texts", None) else ""
+            try:
+                grouped = _split_batch_output(raw_text, len(pending))
+            except Exception as e:
+                logger.error(f"vlm Script - [call_vlm_batch] Unparseable batch response, retrying per item: {e}")
+                get_logger().log_custom_event("ovms_vlm_parse_failure", application_name, unique_id,
+                                              stage="batch", error=str(e))
+                grouped = None
+
+            for position, (index, _, _, cache, cache_key) in enumerate(pending):
+                if grouped is not None and not grouped[position]:
+                    # The model skipped this item; a parse miss for it alone
+                    logger.warning(f"vlm Script - [call_vlm_batch] No entries for item {position} in batch response, "
+                                   f"retrying it alone")
+                    get_logger().log_custom_event("ovms_vlm_parse_failure", application_name, unique_id,
+                                                  stage="batch_item_missing", position=position)
+                if grouped is None or not grouped[position]:
+                    outcomes[index] = call_vlm(frame_records_list[index], use_case=use_case)
+                    continue
+                outcomes[index] = (True, grouped[position], "")
+                if cache is not None:
+                    cache.put(pending[position][1], cache_key, grouped[position])
+
+        get_logger().log_custom_event("ovms_vlm_batch_call", application_name, unique_id,
+                                      batch_size=len(frame_records_list), requested=len(pending))
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+        logger.error(f"vlm Script - [call_vlm_batch] {error_msg}")
+        get_logger().log_custom_event("ovms_vlm_call_exception", application_name, unique_id, error=error_msg)
+        outcomes = [outcome or (False, None, error_msg) for outcome in outcomes]
+    log_end_time(application_name, unique_id)
+    return outcomes
+
+
 def get_vlm_model_from_workload(workload_config_path: str = None) -> tuple:
     """
     Extract vlm_model, vlm_precision, and vlm_device from workload configuration.
@@ -0,0 +1,210 @@
+"""Result cache for VLM calls keyed by prompt hash and perceptual image hash."""
+import copy
+import hashlib
+from io import BytesIO
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+from PIL import Image
+
+from utils.config import (logger,
+                          VLM_CACHE_ENABLED,
+                          VLM_CACHE_MAX_ENTRIES,
+                          VLM_CACHE_TTL_SEC,
+                          VLM_CACHE_MAX_HAMMING,
+                          VLM_CACHE_DB,
+                          )
+
+
+def prompt_hash(prompt: str) -> str:
+    """Stable short hash of a prompt string."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def crop_to_bbox(image: Image.Image, bbox: dict) -> Image.Image:
+    """Crop to a normalized x_min/y_min/x_max/y_max box; the whole image if the box is empty."""
+    width, height = image.size
+    x1 = int(np.clip(bbox.get("x_min", 0.0), 0, 1) * width)
+    x2 = int(np.clip(bbox.get("x_max", 1.0), 0, 1) * width)
+    y1 = int(np.clip(bbox.get("y_min", 0.0), 0, 1) * height)
+    y2 = int(np.clip(bbox.get("y_max", 1.0), 0, 1) * height)
+    if x2 - x1 < 2 or y2 - y1 < 2:
+        return image
+    return image.crop((x1, y1, x2, y2))
+
+
+def image_phash(image, bbox: Optional[dict] = None) -> str:
+    """64-bit difference hash (dHash) of an image, or of its bbox region, as 16 hex chars.
+
+    Robust to re-encoding, small shifts and lighting changes, so the same
+    product re-entering the ROI maps to the same (or a very close) hash.
+    Hash the detection crop: at 9x8 a whole checkout frame is mostly static
+    background, and two different products on it hash (nearly) alike.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        image = Image.open(BytesIO(image))
+        if bbox is None:
+            image.draft("L", (64, 64))
+    elif not isinstance(image, Image.Image):
+        image = Image.fromarray(np.asarray(image).astype("uint8"))
+    if bbox is not None:
+        image = crop_to_bbox(image, bbox)
+    small = np.asarray(image.convert("L").resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):016x}"
+
+
+def hamming(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+class VLMResultCache:
+    """LRU + TTL cache of parsed VLM results with optional SQLite persistence.
+
+    Lookups match the prompt hash exactly and the image hash within
+    max_hamming bits. The SQLite file (if configured) survives restarts.
+    """
+
+    def __init__(self, max_entries=VLM_CACHE_MAX_ENTRIES, ttl_sec=VLM_CACHE_TTL_SEC,
+                 max_hamming=VLM_CACHE_MAX_HAMMING, db_path=VLM_CACHE_DB):
+        self.max_entries = max_entries
+        self.ttl_sec = ttl_sec
+        self.max_hamming = max_hamming
+        self._entries = OrderedDict()  # (prompt_hash, image_hash) -> (created_at, result)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS vlm_cache ("
+                    " prompt_hash TEXT, image_hash TEXT, result TEXT,"
+                    " created_at REAL, last_access REAL,"
+                    " PRIMARY KEY (prompt_hash, image_hash))"
+                )
+                self._db.execute("DELETE FROM vlm_cache WHERE created_at < ?", (time.time() - ttl_sec,))
+                self._db.commit()
+                logger.info(f"VLM cache persisted at {db_path}")
+            except Exception as e:
+                logger.error(f"VLM cache - could not open {db_path}, using memory only: {e}")
+                self._db = None
+
+    def get(self, prompt: str, image_hash: str) -> Optional[Any]:
+        """Return a private copy of a cached result, or None."""
+        p_hash = prompt_hash(prompt)
+        now = time.time()
+        with self._lock:
+            key = self._find(p_hash, image_hash, now)
+            if key is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # Callers annotate results (run_id, stream_id, match); never hand out the cached object
+                return copy.deepcopy(self._entries[key][1])
+            result = self._db_get(p_hash, image_hash, now)
+            if result is not None:
+                self._store(p_hash, image_hash, result, now)
+                self.hits += 1
+                return copy.deepcopy(result)
+            self.misses += 1
+            return None
+
+    def put(self, prompt: str, image_hash: str, result: Any):
+        """Cache a copy of a successfully parsed result."""
+        p_hash = prompt_hash(prompt)
+        now = time.time()
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._store(p_hash, image_hash, result, now)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO vlm_cache VALUES (?, ?, ?, ?, ?)",
+                        (p_hash, image_hash, json.dumps(result), now, now),
+                    )
+                    # Keep the file LRU-bounded as well
+                    self._db.execute(
+                        "DELETE FROM vlm_cache WHERE rowid NOT IN ("
+                        " SELECT rowid FROM vlm_cache ORDER BY last_access DESC LIMIT ?)",
+                        (self.max_entries * 10,),
+                    )
+                    self._db.commit()
+                except Exception as e:
+                    logger.error(f"VLM cache - SQLite write failed: {e}")
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def _find(self, p_hash, image_hash, now):
+        key = (p_hash, image_hash)
+        if key in self._entries and self._fresh(key, now):
+            return key
+        if self.max_hamming <= 0:
+            return None
+        best_key, best_dist = None, self.max_hamming + 1
+        for candidate in list(self._entries):
+            if candidate[0] != p_hash or not self._fresh(candidate, now):
+                continue
+            dist = hamming(candidate[1], image_hash)
+            if dist < best_dist:
+                best_key, best_dist = candidate, dist
+        return best_key
+
+    def _fresh(self, key, now):
+        if now - self._entries[key][0] <= self.ttl_sec:
+            return True
+        del self._entries[key]
+        return False
+
+    def _store(self, p_hash, image_hash, result, now):
+        self._entries[(p_hash, image_hash)] = (now, result)
+        self._entries.move_to_end((p_hash, image_hash))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _db_get(self, p_hash, image_hash, now):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT result FROM vlm_cache WHERE prompt_hash = ? AND image_hash = ? AND created_at >= ?",
+                (p_hash, image_hash, now - self.ttl_sec),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE vlm_cache SET last_access = ? WHERE prompt_hash = ? AND image_hash = ?",
+                (now, p_hash, image_hash),
+            )
+            self._db.commit()
+            return json.loads(row[0])
+        except Exception as e:
+            logger.error(f"VLM cache - SQLite read failed: {e}")
+            return None
+
+
+_vlm_cache = None
+_vlm_cache_lock = threading.Lock()
+
+
+def get_vlm_cache() -> Optional[VLMResultCache]:
+    """Process-wide cache instance, or None when VLM_CACHE_ENABLED=0."""
+    global _vlm_cache
+    if not VLM_CACHE_ENABLED:
+        return None
+    with _vlm_cache_lock:
+        if _vlm_cache is None:
+            _vlm_cache = VLMResultCache()
+    return _vlm_cache
@@ -0,0 +1,173 @@
+"""Priority and deadline scheduling for VLM calls."""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from utils.config import (logger,
+                          VLM_WORKERS,
+                          VLM_MAX_IN_FLIGHT,
+                          )
+from vlm_metrics_logger import get_logger
+
+# Lower runs first
+PRIORITY_ENHANCEMENT = 0  # item still at the checkout
+PRIORITY_AUDIT = 1        # decision-agent validation
+PRIORITY_BACKGROUND = 2   # stale work that still has to finish
+PRIORITY_NAMES = {PRIORITY_ENHANCEMENT: "enhancement", PRIORITY_AUDIT: "audit", PRIORITY_BACKGROUND: "background"}
+
+
+class DeadlineExceeded(Exception):
+    """A scheduled VLM call was dropped because its deadline passed before a worker picked it up."""
+
+
+class _Job:
+    __slots__ = ("fn", "args", "priority", "deadline", "on_expire", "future", "submitted_at", "downgraded")
+
+    def __init__(self, fn, args, priority, deadline, on_expire):
+        self.fn = fn
+        self.args = args
+        self.priority = priority
+        self.deadline = deadline
+        self.on_expire = on_expire
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+        self.downgraded = False
+
+
+class VLMScheduler:
+    """
+    Runs VLM calls on a fixed set of worker threads, highest priority first.
+
+    A job whose deadline has passed when a worker reaches it is either
+    downgraded to PRIORITY_BACKGROUND (on_expire="downgrade") and requeued,
+    or dropped: its on_expire callable runs instead of the call, or the
+    future fails with DeadlineExceeded. Within a priority, jobs run in
+    submission order. Queue depth and wait time are logged per job.
+    """
+
+    def __init__(self, workers: int = min(VLM_WORKERS, VLM_MAX_IN_FLIGHT)):
+        self._heap = []  # (priority, seq, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        self.completed = 0
+        self.dropped = 0
+        self.downgraded = 0
+        self._threads = [threading.Thread(target=self._worker, name=f"vlm-worker-{i}", daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn: Callable, *args, priority: int = PRIORITY_ENHANCEMENT,
+               deadline_s: Optional[float] = None, on_expire="downgrade") -> Future:
+        """
+        Queue fn(*args).
+
+        Args:
+            fn: The call to run on a VLM worker
+            priority: PRIORITY_* constant, lower runs first
+            deadline_s: Seconds from now after which the job is stale (None = never)
+            on_expire: "downgrade", "drop", or a callable run with *args instead of fn
+
+        Returns:
+            Future: Result of fn, or DeadlineExceeded for a dropped job
+        """
+        deadline = time.monotonic() + deadline_s if deadline_s is not None else None
+        job = _Job(fn, args, priority, deadline, on_expire)
+        self._push(job)
+        return job.future
+
+    def _push(self, job):
+        with self._cond:
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+            self._depth[PRIORITY_NAMES[job.priority]] += 1
+            self._cond.notify()
+
+    def _pop(self):
+        with self._cond:
+            while not self._heap:
+                self._cond.wait()
+            _, _, job = heapq.heappop(self._heap)
+            self._depth[PRIORITY_NAMES[job.priority]] -= 1
+            depth = dict(self._depth)
+        return job, depth
+
+    def _expire(self, job):
+        """Handle a job past its deadline: "downgraded" (requeued), "dropped", or "run" if already at the bottom."""
+        if job.on_expire == "downgrade":
+            if job.priority >= PRIORITY_BACKGROUND:
+                return "run"
+            job.priority = PRIORITY_BACKGROUND
+            job.downgraded = True
+            job.deadline = None
+            with self._cond:
+                self.downgraded += 1
+            self._push(job)
+            return "downgraded"
+        with self._cond:
+            self.dropped += 1
+        if callable(job.on_expire):
+            try:
+                job.future.set_result(job.on_expire(*job.args))
+            except Exception as e:
+                job.future.set_exception(e)
+        else:
+            job.future.set_exception(DeadlineExceeded(f"{getattr(job.fn, '__name__', 'job')} missed its deadline"))
+        return "dropped"
+
+    def _worker(self):
+        while True:
+            job, depth = self._pop()
+            now = time.monotonic()
+            priority = job.priority
+            outcome = "run"
+            if job.deadline is not None and now > job.deadline:
+                outcome = self._expire(job)
+            self._log(priority, job, depth, now, outcome)
+            if outcome != "run":
+                continue
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                job.future.set_result(job.fn(*job.args))
+            except Exception as e:
+                job.future.set_exception(e)
+            with self._cond:
+                self.completed += 1
+
+    def _log(self, priority, job, depth, now, outcome):
+        wait_ms = round((now - job.submitted_at) * 1000, 3)
+        logger.debug(f"VLM scheduler - {PRIORITY_NAMES[priority]} job {outcome} after {wait_ms} ms, depth {depth}")
+        get_logger().log_custom_event(
+            "vlm_schedule",
+            "USECASE_1",
+            f"vlm_schedule_{int(time.time() * 1000)}",
+            priority=PRIORITY_NAMES[priority],
+            downgraded=job.downgraded,
+            outcome=outcome,
+            wait_ms=wait_ms,
+            **{f"depth_{name}": count for name, count in depth.items()},
+        )
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"depth": dict(self._depth), "completed": self.completed,
+                    "dropped": self.dropped, "downgraded": self.downgraded}
+
+
+_vlm_scheduler = None
+_vlm_scheduler_lock = threading.Lock()
+
+
+def get_vlm_scheduler() -> VLMScheduler:
+    """Process-wide VLMScheduler."""
+    global _vlm_scheduler
+    if _vlm_scheduler is not None:
+        return _vlm_scheduler
+    with _vlm_scheduler_lock:
+        if _vlm_scheduler is None:
+            _vlm_scheduler = VLMScheduler()
+    return _vlm_scheduler
@@ -3,6 +3,7 @@ import argparse
 import json
 import logging
 import os
+import re
 from pathlib import Path
 from urllib.parse import urlparse
 import socket
@@ -153,17 +154,20 @@ def derive_stream_name(camera: dict, stream_uri: str) -> str:
     fileSrc = camera.get("fileSrc", "")
     return extract_video_name(fileSrc, camera.get("width"), camera.get("fps"))
 
-# -------------------- Main Validation --------------------
-def validate_and_extract_vlm_config(camera_cfg_path: str = None) -> dict:
+def derive_stream_id(stream_name: str) -> str:
     """
-    Validate that exactly one camera has LP_VLM workload.
-    Extract and return video metadata.
-    
-    Returns:
-        dict with keys: stream_name, stream_uri, roi
-    
+    Sanitize a stream name into an id usable in GStreamer element names
+    and RabbitMQ routing keys (letters, digits, '_' and '-').
+    """
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", stream_name).strip("_")
+
+
+def get_vlm_cameras(camera_cfg_path: str = None) -> list:
+    """
+    Return every camera with the LP_VLM workload.
+
     Raises:
-        ValueError: if zero or more than one LP_VLM workload found
+        ValueError: if no camera has the LP_VLM workload
     """
     # Determine config path
     if not camera_cfg_path:
@@ -187,17 +191,73 @@ def validate_and_extract_vlm_config(camera_cfg_path: str = None) -> dict:
             f"[ERROR] No lp_vlm workload found in any camera. "
             f"Available workloads: {[c.get('workloads', []) for c in cameras]}"
         )
+    return vlm_cameras
+
+
+def get_vlm_streams(camera_cfg_path: str = None) -> list:
+    """
+    Return pipeline launch info for every LP_VLM camera.
+
+    Returns:
+        list of dicts with keys: stream_id, video_name, stream_uri, roi
+    """
+    cameras = get_vlm_cameras(camera_cfg_path)
+    streams = validate_and_extract_vlm_configs(camera_cfg_path)
+    return [
+        {
+            "stream_id": stream["stream_id"],
+            "video_name": get_camera_video_name(cam),
+            "stream_uri": stream["stream_uri"],
+            "roi": stream["roi"],
+        }
+        for cam, stream in zip(cameras, streams)
+    ]
+
+# -------------------- Main Validation --------------------
+def validate_and_extract_vlm_configs(camera_cfg_path: str = None) -> list:
+    """
+    Validate all cameras with LP_VLM workload and extract their metadata.
+    Each camera becomes one detection branch / Publisher in the pipeline.
     
-    if len(vlm_cameras) > 1:
-        camera_ids = [c.get("camera_id", "unknown") for c in vlm_cameras]
+    Returns:
+        list of dicts with keys: stream_id, stream_name, stream_uri, roi
+    
+    Raises:
+        ValueError: if no LP_VLM workload is found, a camera is incomplete,
+            or two cameras resolve to the same stream id
+    """
+    streams = [extract_vlm_stream(cam) for cam in get_vlm_cameras(camera_cfg_path)]
+
+    stream_ids = [s["stream_id"] for s in streams]
+    duplicates = sorted({sid for sid in stream_ids if stream_ids.count(sid) > 1})
+    if duplicates:
         raise ValueError(
-            f"[ERROR] More than one LP_VLM workload defined. "
-            f"Found {len(vlm_cameras)} cameras with LP_VLM: {camera_ids}. "
-            f"Only one camera should have LP_VLM workload."
+            f"[ERROR] Duplicate LP_VLM stream ids {duplicates}. "
+            f"Give each lp_vlm camera a unique camera_id."
         )
+    return streams
+
+
+def validate_and_extract_vlm_config(camera_cfg_path: str = None) -> dict:
+    """
+    Validate LP_VLM cameras and return metadata of the first (primary) one.
+    
+    Returns:
+        dict with keys: stream_id, stream_name, stream_uri, roi
     
-    # Extract metadata from the single LP_VLM camera
-    cam = vlm_cameras[0]
+    Raises:
+        ValueError: if no LP_VLM workload found or configuration is invalid
+    """
+    return extract_vlm_stream(get_vlm_cameras(camera_cfg_path)[0])
+
+
+def extract_vlm_stream(cam: dict) -> dict:
+    """
+    Extract stream metadata from a single LP_VLM camera.
+    
+    Returns:
+        dict with keys: stream_id, stream_name, stream_uri, roi
+    """
     camera_id = cam.get("camera_id", "unknown")
     roi_dict = cam.get("region_of_interest", {})
 
@@ -225,6 +285,7 @@ def validate_and_extract_vlm_config(camera_cfg_path: str = None) -> dict:
     roi = f"{roi_dict.get('x', '')},{roi_dict.get('y', '')},{roi_dict.get('x2', '')},{roi_dict.get('y2', '')}"
     
     result = {
+        "stream_id": derive_stream_id(stream_name),
         "stream_name": stream_name,
         "stream_uri": stream_uri,
         "roi": roi
@@ -255,34 +316,12 @@ def get_video_name_with_extension(camera_cfg_path: str = None) -> str:
     (e.g. "lp-vlm-1080-15-bench") and appends the extension taken from
     the original fileSrc value in the camera config (e.g. ".mp4").
     """
-    # Resolve config path similarly to other helpers
-    if not camera_cfg_path:
-        camera_cfg_path = os.getenv("CAMERA_STREAM") or CONFIG_PATH_DEFAULT
-
-    cfg = load_config(camera_cfg_path)
-    lane = cfg.get("lane_config", {})
-    cameras = lane.get("cameras", [])
-
-    if not cameras:
-        raise ValueError("[ERROR] No cameras found in configuration")
+    # Primary lp_vlm camera
+    return get_camera_video_name(get_vlm_cameras(camera_cfg_path)[0])
 
-    # Select the single lp_vlm camera
-    vlm_cameras = [cam for cam in cameras if camera_has_vlm(cam)]
-    if len(vlm_cameras) == 0:
-        raise ValueError(
-            f"[ERROR] No lp_vlm workload found in any camera. "
-            f"Available workloads: {[c.get('workloads', []) for c in cameras]}"
-        )
-    if len(vlm_cameras) > 1:
-        camera_ids = [c.get("camera_id", "unknown") for c in vlm_cameras]
-        raise ValueError(
-            f"[ERROR] More than one LP_VLM workload defined. "
-            f"Found {len(vlm_cameras)} cameras with LP_VLM: {camera_ids}. "
-            f"Only one camera should have LP_VLM workload."
-        )
-
-    cam = vlm_cameras[0]
 
+def get_camera_video_name(cam: dict) -> str:
+    """Return the bench-style video name with extension for one camera."""
     # Original fileSrc, first segment before '|'
     raw_src = str(cam.get("fileSrc", ""))
     file_src = raw_src.split("|", 1)[0].strip()
@@ -361,6 +400,11 @@ if __name__ == "__main__":
         action="store_true",
         help="Return only the RTSP URI for lp_vlm workload"
     )
+    parser.add_argument(
+        "--get-streams",
+        action="store_true",
+        help="Print one 'stream_id|video_name|stream_uri|roi' line per lp_vlm camera"
+    )
     parser.add_argument(
         "--extract_video_name",
         action="store_true",
@@ -383,6 +427,10 @@ if __name__ == "__main__":
                 "roi": roi_coordinates
             }))
             exit(0)
+        if args.get_streams:
+            for stream in get_vlm_streams(args.camera_config):
+                print("|".join([stream["stream_id"], stream["video_name"], stream["stream_uri"], stream["roi"]]))
+            exit(0)
         if args.extract_video_name:
             video_name = get_video_name_with_extension(args.camera_config)
             print(video_name)